@@ -0,0 +1,5 @@
+"""
+Micro-benchmarks of the hot paths, run from `src`, e.g. `python -m benchmark.model_validators`.
+Each one times the code before its optimization, kept here as the baseline, against the current
+code.
+"""
@@ -0,0 +1,137 @@
+"""
+Per-item validation cost of the memoized `core.pydantic.field` types on 100k-element lists,
+against the uncached validators they replaced.
+
+    python -m benchmark.field_validators
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import phonenumbers
+from dateutil.parser import isoparse
+from pydantic import BaseModel, create_model
+
+from core.pydantic import field
+
+SIZE = 100_000
+
+
+class LegacyPhoneNumberStr(str):
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v):
+        if not isinstance(v, str):
+            raise TypeError('string required')
+        try:
+            parsed_phone_number = phonenumbers.parse(v, None)
+        except Exception:
+            raise ValueError('invalid phone number')
+        if not phonenumbers.is_possible_number(parsed_phone_number):
+            raise ValueError('invalid phone number')
+        return v
+
+
+class LegacyParameterDate(datetime):
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v):
+        if type(v) is not str:
+            v = str(v)
+        try:
+            return datetime.strptime(v, '%Y%m%d' if v.isdigit() else '%Y-%m-%d')
+        except ValueError:
+            raise ValueError('Unprocessable date format in URL parameters')
+
+
+class LegacyISO8601Datetime(datetime):
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v):
+        if type(v) is not str:
+            v = str(v)
+
+        datetime_ = isoparse(v)
+        if not datetime_.tzinfo:
+            raise ValueError('datetime should contain timezone info')
+
+        return datetime_.astimezone(timezone.utc)
+
+
+class LegacyUTCDatetime(datetime):
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v) -> datetime:
+        if type(v) is not str:
+            v = str(v)
+        return isoparse(v).replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def timestamps(distinct: int) -> list[str]:
+    start = datetime(2022, 1, 1, tzinfo=timezone(timedelta(hours=8)))
+    return [(start + timedelta(seconds=i % distinct)).isoformat() for i in range(SIZE)]
+
+
+def phone_numbers(distinct: int) -> list[str]:
+    return [f'+88609{i % distinct:08d}' for i in range(SIZE)]
+
+
+def dates(distinct: int) -> list[str]:
+    start = datetime(2000, 1, 1)
+    return [(start + timedelta(days=i % distinct)).strftime('%Y-%m-%d') for i in range(SIZE)]
+
+
+CASES = (
+    # name, before, after, values, distinct values of the last column
+    ('ISO8601Datetime', LegacyISO8601Datetime, field.ISO8601Datetime, timestamps, SIZE),
+    ('UTCDatetime', LegacyUTCDatetime, field.UTCDatetime, timestamps, SIZE),
+    ('PhoneNumberStr', LegacyPhoneNumberStr, field.PhoneNumberStr, phone_numbers, SIZE),
+    # there are not 100k distinct dates
+    ('ParameterDate', LegacyParameterDate, field.ParameterDate, dates, 20_000),
+)
+
+
+def per_item(model: type[BaseModel], values: list[str], repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        for cache in (
+            field.parse_iso8601,
+            field.is_possible_phone_number,
+            field.parse_parameter_date,
+        ):
+            cache.cache_clear()
+        start = time.perf_counter()
+        model(items=values)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) / len(values) * 1e6
+
+
+def main():
+    print(f'per item on {SIZE // 1000}k-element lists, best of 3 (us)')
+    print(f'{"":<18} {"before":>8} {"1k distinct":>12} {"all distinct":>13}')
+    for name, before, after, build, distinct in CASES:
+        before_model = create_model('Before', items=(list[before], ...))
+        after_model = create_model('After', items=(list[after], ...))
+        few, many = build(1_000), build(distinct)
+        print(
+            f'{name:<18} {per_item(before_model, few):8.2f} {per_item(after_model, few):12.2f} '
+            f'{per_item(after_model, many):13.2f}'
+            + ('' if distinct == SIZE else f' ({distinct // 1000}k distinct)')
+        )
+
+
+if __name__ == '__main__':
+    main()
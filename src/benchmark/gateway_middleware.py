@@ -0,0 +1,130 @@
+"""
+Per-request overhead of `GatewayMiddleware` against the stack of middlewares it replaced, with
+straight ASGI calls to an app answering a fixed response.
+
+    python -m benchmark.gateway_middleware
+"""
+
+import asyncio
+import logging
+import time
+
+from asgi_correlation_id import CorrelationIdMiddleware
+from fastapi.middleware.asyncexitstack import AsyncExitStackMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core.fastapi.exception import FastAPIError
+from core.fastapi.middleware import (
+    GatewayMiddleware,
+    MetricsMiddleware,
+    ParseRequestMiddleware,
+    WrapperExceptionMiddleware,
+)
+from core.handler import fastapi_exception_handler
+
+SIZE = 20_000
+CORS = {
+    'allow_origin_regex': r'https://.*\.example\.com',
+    'allow_credentials': True,
+    'allow_methods': ['*'],
+    'allow_headers': ['*'],
+}
+HANDLERS = {FastAPIError: fastapi_exception_handler}
+
+
+async def endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+    await receive()
+    if scope['path'] == '/error':
+        raise FastAPIError('Conflict', http_status=409)
+
+    await send(
+        {
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', b'2')],
+        }
+    )
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+def stacked(app: ASGIApp) -> ASGIApp:
+    """
+    The middlewares of `main.app` and those `FastAPI.build_middleware_stack` added, before
+    `GatewayMiddleware`
+    """
+
+    app = AsyncExitStackMiddleware(app)
+    app = WrapperExceptionMiddleware(app, handlers=HANDLERS)
+    app = ParseRequestMiddleware(app)
+    app = CorrelationIdMiddleware(app)
+    app = CORSMiddleware(app, **CORS)
+    return MetricsMiddleware(app)
+
+
+def fused(app: ASGIApp) -> ASGIApp:
+    return GatewayMiddleware(app, handlers=HANDLERS, cors=CORS)
+
+
+def build_scope(path: str, origin: bool) -> Scope:
+    headers = [
+        (b'host', b'gateway'),
+        (b'user-agent', b'benchmark'),
+        (b'accept', b'*/*'),
+        (b'content-type', b'application/json'),
+        (b'x-request-id', b'7d4b5c3a2f1e4d6c8b9a0f1e2d3c4b5a'),
+    ]
+    if origin:
+        headers.append((b'origin', b'https://app.example.com'))
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('gateway', 80),
+    }
+
+
+async def per_request(app: ASGIApp, scope: Scope, repeat: int = 5) -> float:
+    async def receive():
+        return {'type': 'http.request', 'body': b'{"id": 1}', 'more_body': False}
+
+    async def send(_):
+        pass
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(SIZE):
+            await app(dict(scope), receive, send)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) / SIZE * 1e6
+
+
+async def main():
+    # the handled errors are logged with their traceback, which is not the middleware's cost
+    logging.getLogger('fastapi').disabled = True
+    logging.getLogger('asgi_correlation_id').disabled = True
+    print(f'us per request, best of 5 x {SIZE // 1000}k straight ASGI calls')
+    print(f'{"":<26} {"stacked":>8} {"fused":>8}')
+    for label, path, origin in (
+        ('200', '/ok', False),
+        ('200, CORS origin', '/ok', True),
+        ('handled error (409)', '/error', True),
+    ):
+        scope = build_scope(path, origin)
+        before = await per_request(stacked(endpoint), scope)
+        after = await per_request(fused(endpoint), scope)
+        print(f'{label:<26} {before:8.2f} {after:8.2f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Root validators of `core.pydantic.model.BaseModel` against the per-field walk they replaced.
+
+    python -m benchmark.model_validators
+"""
+
+import timeit
+from datetime import datetime, timezone
+from functools import partial
+from typing import Optional
+
+from pydantic import BaseModel as _BaseModel
+from pydantic import Field, create_model, root_validator
+
+from core.pydantic.model import BaseModel
+
+
+class LegacyBaseModel(_BaseModel):
+    """
+    The root validators before the non-nullable and datetime fields were precomputed per class
+    """
+
+    @root_validator(pre=True)
+    def check_nullable(cls, values):
+        for k, field_ in cls.__fields__.items():
+            if k not in values:
+                continue
+
+            nullable = field_.field_info.extra.get('nullable')
+            if nullable is False and values[k] is None:
+                raise ValueError(f'{k} is not allowed to be null')
+
+        return values
+
+    @root_validator
+    def transfer_datetime_format_to_utc(cls, values: dict):
+        for name, field_ in cls.__fields__.items():
+            if field_.type_ is datetime and values.get(name) and values.get(name).tzinfo:
+                values[name] = (values[name].astimezone(timezone.utc)).replace(tzinfo=None)
+
+        return values
+
+
+def build_models(base: type[_BaseModel]) -> dict[str, type[_BaseModel]]:
+    ints = {f'f{i}': (int, ...) for i in range(30)}
+    wide = create_model('Wide', __base__=base, **ints)
+    dated = create_model('Dated', __base__=base, created_at=(datetime, ...), **ints)
+    leaf = create_model(
+        'Leaf',
+        __base__=base,
+        id=(int, ...),
+        name=(str, Field(..., nullable=False)),
+        note=(Optional[str], None),
+    )
+    payload = create_model(
+        'Payload', __base__=base, items=(list[dated], ...), leaves=(list[leaf], ...)
+    )
+    return {'wide': wide, 'dated': dated, 'payload': payload}
+
+
+def build_payload(items: int = 2000, leaves: int = 20000) -> dict:
+    row = {f'f{i}': i for i in range(30)}
+    created_at = datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    return {
+        'items': [{**row, 'created_at': created_at} for _ in range(items)],
+        'leaves': [{'id': i, 'name': f'leaf {i}'} for i in range(leaves)],
+    }
+
+
+def run_root_validators(model: type[_BaseModel], values: dict) -> dict:
+    # what validate_model runs around the field validation
+    values = dict(values)
+    for validator in model.__pre_root_validators__:
+        values = validator(model, values)
+    for _, validator in model.__post_root_validators__:
+        values = validator(model, values)
+    return values
+
+
+def best(func, number: int, repeat: int = 5) -> float:
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    row = {f'f{i}': i for i in range(30)}
+    dated_row = {**row, 'created_at': datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc)}
+    payload = build_payload()
+
+    results = {}
+    for label, base in (('before', LegacyBaseModel), ('after', BaseModel)):
+        wide, dated, payload_model = build_models(base).values()
+        results[label] = (
+            best(partial(run_root_validators, wide, row), 100_000),
+            best(partial(run_root_validators, dated, dated_row), 100_000),
+            best(partial(payload_model.parse_obj, payload), 1, repeat=10),
+        )
+
+    print('root validators per instance, best of 5 x 100k')
+    labels = ('30 int fields', '30 int fields + datetime')
+    for i, label in enumerate(labels):
+        before, after = results['before'][i] * 1e6, results['after'][i] * 1e6
+        print(f'  {label:<28} {before:6.2f} us -> {after:6.2f} us')
+    before, after = results['before'][2] * 1e3, results['after'][2] * 1e3
+    print(f'parse_obj of a nested payload, best of 10: {before:.0f} ms -> {after:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
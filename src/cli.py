@@ -23,6 +23,29 @@ def run(reload: Optional[bool] = False):
     )
 
 
+@app.command()
+def serve(
+    host: Optional[str] = typer.Option(None, help='SERVER_HOST by default'),
+    port: Optional[int] = typer.Option(None, help='SERVER_PORT by default'),
+    workers: Optional[int] = typer.Option(
+        None, help='GUNICORN_WORKERS by default, sized from the available CPUs when 0'
+    ),
+):
+    """
+    Production server: gunicorn managing uvicorn workers, see `settings.server`.
+    """
+
+    from settings import GUNICORN_WORKERS, SERVER_HOST, SERVER_PORT
+    from settings.server import GunicornApplication, gunicorn_options
+
+    options = gunicorn_options(
+        host=host or SERVER_HOST,
+        port=port or SERVER_PORT,
+        workers=GUNICORN_WORKERS if workers is None else workers,
+    )
+    GunicornApplication('main:app', options).run()
+
+
 @app.command()
 def test(pytest_args: Optional[str] = typer.Option(None)):
     args = pytest_args.split(',') if pytest_args else []
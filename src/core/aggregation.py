@@ -0,0 +1,190 @@
+import asyncio
+import inspect
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import status
+
+from core.pydantic.model import BaseModel
+
+from .enum import StrEnum
+from .exception import UpstreamException
+from .fastapi import FastAPILogger
+
+
+class OnError(StrEnum):
+    RAISE = 'raise'  # cancel the other calls and raise the error
+    SKIP = 'skip'  # use `default` as the result, dependent calls are skipped as well
+
+
+@dataclass
+class Call:
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    depends_on: tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    on_error: OnError = OnError.RAISE
+    default: Any = None
+    model: Optional[type[BaseModel]] = None
+    _parameters: Optional[frozenset[str]] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.depends_on = tuple(self.depends_on)
+        self.on_error = OnError(self.on_error)
+
+        parameters = inspect.signature(self.func).parameters.values()
+        if not any(parameter.kind is parameter.VAR_KEYWORD for parameter in parameters):
+            self._parameters = frozenset(parameter.name for parameter in parameters)
+
+    async def __call__(self, **kwargs) -> Any:
+        if self._parameters is not None:
+            kwargs = {k: v for k, v in kwargs.items() if k in self._parameters}
+
+        try:
+            async with asyncio.timeout(self.timeout):
+                result = await self.func(**kwargs)
+        except TimeoutError:
+            raise UpstreamException(
+                f'{self.name} timed out', http_status=status.HTTP_504_GATEWAY_TIMEOUT, data={}
+            )
+
+        if self.model is None or result is None:
+            return result
+        if isinstance(result, list):
+            return [self.model.parse_obj(item) for item in result]
+
+        return self.model.parse_obj(result)
+
+
+@dataclass
+class AggregationResult:
+    results: dict[str, Any]
+    errors: dict[str, Exception]
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+
+class Aggregation:
+    """
+    Run the upstream calls of a route concurrently, respecting their dependencies (a DAG), so
+    the route takes the latency of its critical path instead of the sum of all calls.
+
+    A call receives the `run` keyword arguments and the results of the calls it depends on,
+    matched by parameter name, so the keyword arguments may not be named after a call.
+
+    e.x.:
+        profile = Aggregation()
+
+        @profile.call('member')
+        async def member(member_id: int, service: MemberService):
+            return await service.get_member(member_id)
+
+        @profile.call('orders', depends_on=['member'], timeout=2, on_error='skip', default=[])
+        async def orders(member: dict, service: MemberService):
+            return await service.get_orders(member['id'])
+
+        result = await profile.run(member_id=1, service=service)
+        result['member'], result['orders']
+    """
+
+    def __init__(self, *calls: Call):
+        self._calls: dict[str, Call] = {}
+        self._validated = False
+        for call in calls:
+            self.add(call)
+
+    def add(self, call: Call) -> None:
+        if call.name in self._calls:
+            raise ValueError(f'Duplicated aggregation call {call.name}')
+
+        self._calls[call.name] = call
+        self._validated = False
+
+    def call(self, name: str, **options):
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            self.add(Call(name, func, **options))
+            return func
+
+        return decorator
+
+    async def run(self, **kwargs) -> AggregationResult:
+        self.validate()
+        clashes = kwargs.keys() & self._calls.keys()
+        if clashes:
+            raise ValueError(f'Aggregation arguments {sorted(clashes)} clash with call names')
+
+        loop = asyncio.get_running_loop()
+        futures: dict[str, asyncio.Future] = {name: loop.create_future() for name in self._calls}
+        result = AggregationResult(results={}, errors={})
+
+        async def run_call(call: Call) -> None:
+            dependencies = {}
+            for name in call.depends_on:
+                dependencies[name] = await futures[name]
+            failed = next((name for name in call.depends_on if name in result.errors), None)
+            if failed is not None:
+                self._fail(call, result.errors[failed], result, futures)
+                return
+
+            try:
+                value = await call(**kwargs, **dependencies)
+            except Exception as e:
+                if call.on_error is OnError.RAISE:
+                    raise
+                self._fail(call, e, result, futures)
+                return
+
+            result.results[call.name] = value
+            futures[call.name].set_result(value)
+
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                for call in self._calls.values():
+                    task_group.create_task(run_call(call))
+        except ExceptionGroup as e:
+            # the first error is handled as the route's, the others are logged and chained
+            first, *others = e.exceptions
+            for error in others:
+                FastAPILogger.warning(f'Aggregation call failed along with {first!r}, {error!r}')
+            raise first from e
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+        return result
+
+    def validate(self) -> None:
+        if self._validated:
+            return
+
+        visiting, visited = set(), set()
+
+        def visit(name: str, path: tuple[str, ...]) -> None:
+            if name not in self._calls:
+                raise ValueError(f'Aggregation call {path[-1]} depends on unknown call {name}')
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f'Aggregation calls have a cycle: {" -> ".join(path + (name,))}')
+
+            visiting.add(name)
+            for dependency in self._calls[name].depends_on:
+                visit(dependency, path + (name,))
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self._calls:
+            visit(name, ())
+        self._validated = True
+
+    @staticmethod
+    def _fail(
+        call: Call,
+        error: Exception,
+        result: AggregationResult,
+        futures: dict[str, asyncio.Future],
+    ) -> None:
+        result.errors[call.name] = error
+        result.results[call.name] = call.default
+        futures[call.name].set_result(call.default)
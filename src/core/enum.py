@@ -27,6 +27,8 @@ class ErrorCode(IntEnum):
     SAGA_ORCHESTRATION_COMPENSATION_UNDONE = 1006
     GENERAL_RESOURCE_NOT_FOUND = 1007
     GENERAL_BAD_REQUEST = 1008
+    GENERAL_SERVICE_OVERLOADED = 1009
+    GENERAL_TOO_MANY_REQUESTS = 1010
 
     # TODO: add service specific error code here
     # e.x.: ErrorCode.XXX01_API_RESPONSE_4XX_OR_5XX= 2001
@@ -17,4 +17,31 @@ class ValidationFailedException(FastAPIError):
         )
 
 
+class UnauthorizedException(FastAPIError):
+    code = ErrorCode.GENERAL_UNAUTHORIZED
+    http_status = status.HTTP_401_UNAUTHORIZED
+    message = 'Unauthorized'
+
+
+class UpstreamException(FastAPIError):
+    code = ErrorCode.GENERAL_HTTP_SERVICE_ERROR
+
+
+class SagaCompensationUndoneException(FastAPIError):
+    code = ErrorCode.SAGA_ORCHESTRATION_COMPENSATION_UNDONE
+    message = 'Saga compensation undone'
+
+
+class ServiceOverloadedException(FastAPIError):
+    code = ErrorCode.GENERAL_SERVICE_OVERLOADED
+    http_status = status.HTTP_503_SERVICE_UNAVAILABLE
+    message = 'Service overloaded, retry later'
+
+
+class TooManyRequestsException(FastAPIError):
+    code = ErrorCode.GENERAL_TOO_MANY_REQUESTS
+    http_status = status.HTTP_429_TOO_MANY_REQUESTS
+    message = 'Too many requests'
+
+
 # TODO: add service specific exception below
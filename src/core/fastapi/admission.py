@@ -0,0 +1,158 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional
+
+import orjson
+from starlette.types import Send
+
+from settings import (
+    ADMISSION_DEFAULT_PRIORITY,
+    ADMISSION_LAG_INTERVAL_SECONDS,
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_MAX_LOOP_LAG_SECONDS,
+    ADMISSION_ROUTE_PRIORITIES,
+)
+
+from ..enum import StrEnum
+from ..exception import ServiceOverloadedException
+from ..handler import HTTP_ERRORS
+from ..metrics import metrics
+
+
+class Priority(StrEnum):
+    CRITICAL = 'critical'
+    HIGH = 'high'
+    NORMAL = 'normal'
+    LOW = 'low'
+
+
+# share of the limits up to which each priority is admitted, lower priorities are shed first
+PRIORITY_SHARES = {
+    Priority.LOW: 0.5,
+    Priority.NORMAL: 0.8,
+    Priority.HIGH: 1.0,
+    Priority.CRITICAL: 2.0,
+}
+
+OVERLOADED_CONTENT = orjson.dumps(  # pylint:disable=no-member
+    {
+        'message': ServiceOverloadedException.message,
+        'code': int(ServiceOverloadedException.code),
+        'data': None,
+    }
+)
+
+SHED_REQUESTS = metrics.counter(
+    'http_requests_shed_total', 'Requests rejected by the admission control', ('priority',)
+)
+LOOP_LAG = metrics.gauge('event_loop_lag_seconds', 'Event loop lag of the worker')
+OVERLOADED_ERRORS = HTTP_ERRORS.labels(str(int(ServiceOverloadedException.code)))
+
+
+@dataclass
+class AdmissionController:
+    """
+    Per-worker load shedding, so the admitted requests keep their latency under traffic spikes
+    instead of every request timing out.
+
+    A request is admitted while the requests in flight and the event loop lag stay under
+    `max_in_flight` and `max_loop_lag` (0 disables either) times the share of its priority. The
+    priority comes from the path, see `ADMISSION_ROUTE_PRIORITIES`, e.x.:
+        {'/': 'critical', '/v1/orders/*': 'high'}
+    """
+
+    max_in_flight: int = ADMISSION_MAX_IN_FLIGHT
+    max_loop_lag: float = ADMISSION_MAX_LOOP_LAG_SECONDS
+    lag_interval: float = ADMISSION_LAG_INTERVAL_SECONDS
+    routes: dict[str, str] = field(default_factory=lambda: dict(ADMISSION_ROUTE_PRIORITIES))
+    default_priority: Priority = Priority(ADMISSION_DEFAULT_PRIORITY)
+
+    in_flight: int = field(default=0, init=False)
+    loop_lag: float = field(default=0.0, init=False)
+    _paths: dict[str, Priority] = field(default_factory=dict, init=False, repr=False)
+    _prefixes: list[tuple[str, Priority]] = field(default_factory=list, init=False, repr=False)
+    # (max in flight, max loop lag) per priority
+    _limits: dict[Priority, tuple[float, float]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _monitor: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        for path, priority in self.routes.items():
+            if path.endswith('/*'):
+                self._prefixes.append((path[:-1], Priority(priority)))
+            else:
+                self._paths[path] = Priority(priority)
+        # the longest prefix wins
+        self._prefixes.sort(key=lambda prefix: len(prefix[0]), reverse=True)
+
+        for priority, share in PRIORITY_SHARES.items():
+            self._limits[priority] = (
+                self.max_in_flight * share if self.max_in_flight else float('inf'),
+                self.max_loop_lag * share if self.max_loop_lag else float('inf'),
+            )
+
+    def priority(self, path: str) -> Priority:
+        priority = self._paths.get(path)
+        if priority is not None:
+            return priority
+
+        for prefix, priority in self._prefixes:
+            if path.startswith(prefix):
+                return priority
+
+        return self.default_priority
+
+    def acquire(self, priority: Priority) -> bool:
+        max_in_flight, max_loop_lag = self._limits[priority]
+        if self.in_flight >= max_in_flight or self.loop_lag >= max_loop_lag:
+            SHED_REQUESTS.labels(priority.value).inc()
+            return False
+
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    async def startup(self) -> None:
+        if self.max_loop_lag and self._monitor is None:
+            self._monitor = asyncio.create_task(self._measure_loop_lag())
+
+    async def shutdown(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+    async def _measure_loop_lag(self) -> None:
+        # how late the sleep wakes up is the time callbacks wait for the loop
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.loop_lag = max(loop.time() - start - self.lag_interval, 0.0)
+            LOOP_LAG.labels().set(self.loop_lag)
+
+    @staticmethod
+    async def reject(send: Send) -> None:
+        """
+        The 503 of `ServiceOverloadedException`, sent without going through the exception
+        handlers.
+        """
+
+        OVERLOADED_ERRORS.inc()
+        await send(
+            {
+                'type': 'http.response.start',
+                'status': ServiceOverloadedException.http_status,
+                'headers': [
+                    (b'content-length', str(len(OVERLOADED_CONTENT)).encode('latin-1')),
+                    (b'content-type', b'application/json'),
+                    (b'retry-after', b'1'),
+                ],
+            }
+        )
+        await send({'type': 'http.response.body', 'body': OVERLOADED_CONTENT})
+
+
+admission_controller = AdmissionController()
@@ -9,7 +9,7 @@ from starlette.middleware import Middleware
 from starlette.middleware.errors import ServerErrorMiddleware
 from starlette.types import ASGIApp
 
-from .middleware import WrapperExceptionMiddleware
+from .middleware import GatewayMiddleware, WrapperExceptionMiddleware
 
 
 class FastAPI(_FastAPI):
@@ -21,6 +21,12 @@ class FastAPI(_FastAPI):
         if self._version != fastapi_version:
             raise RuntimeError(f'Please update fastapi.FastAPI.build_middleware_stack with version {fastapi_version}')
 
+        self.proxy_routes: list = []
+
+    @property
+    def fused_middleware(self) -> bool:
+        return any(issubclass(m.cls, GatewayMiddleware) for m in self.user_middleware)
+
     def build_middleware_stack(self) -> ASGIApp:
         debug = self.debug
         error_handler = None
@@ -35,16 +41,33 @@ class FastAPI(_FastAPI):
         # black
         # fmt: off
         # make sure the order of middleware is correct
-        middleware = (
-            [Middleware(ServerErrorMiddleware, handler=error_handler, debug=debug)]
-            + self.user_middleware
-            + [
-                Middleware(
-                    WrapperExceptionMiddleware, handlers=exception_handlers, debug=debug
-                ),
-                Middleware(AsyncExitStackMiddleware),
-            ]
-        )
+        if self.fused_middleware:
+            # GatewayMiddleware maps the exceptions and holds the exit stack of the dependencies
+            middleware = (
+                [Middleware(ServerErrorMiddleware, handler=error_handler, debug=debug)]
+                + [
+                    Middleware(
+                        m.cls,
+                        handlers=exception_handlers,
+                        debug=debug,
+                        error_handler=error_handler,
+                        **m.options,
+                    )
+                    if issubclass(m.cls, GatewayMiddleware) else m
+                    for m in self.user_middleware
+                ]
+            )
+        else:
+            middleware = (
+                [Middleware(ServerErrorMiddleware, handler=error_handler, debug=debug)]
+                + self.user_middleware
+                + [
+                    Middleware(
+                        WrapperExceptionMiddleware, handlers=exception_handlers, debug=debug
+                    ),
+                    Middleware(AsyncExitStackMiddleware),
+                ]
+            )
         # fmt: on
 
         app = self.router
@@ -52,22 +75,43 @@ class FastAPI(_FastAPI):
             app = cls(app=app, **options)
         return app
 
+    def add_proxy(self, routes: list) -> None:
+        """
+        Register reverse-proxy routes (`core.proxy.ProxyRoute`), they are compiled into a route
+        table per version by `add_versioning` and only tried when no API route matches.
+        """
+
+        self.proxy_routes.extend(routes)
+
     # add versioning to FastAPI
     def add_versioning(
         self,
         default_version: tuple[int, int] = (1, 1),
         enable_latest: bool = False,
     ):
+        from core.proxy import ProxyApp, RouteTable  # pylint: disable=import-outside-toplevel
+
         version_route_mapping: dict[tuple[int, int], list[APIRoute]] = defaultdict(list)
         for route in self.routes:
             version, route = version_to_route(route, default_version)
             version_route_mapping[version].append(route)
 
-        versions = sorted(version_route_mapping.keys())
+        version_proxy_mapping: dict[tuple[int, int], RouteTable] = defaultdict(RouteTable)
+        for proxy_route in self.proxy_routes:
+            version_proxy_mapping[proxy_route.version or default_version].add(proxy_route)
+
+        versions = sorted(version_route_mapping.keys() | version_proxy_mapping.keys())
         for version in versions:
             major, minor = version
             prefix = f'/v{major}_{minor}' if minor != 0 else f'/v{major}'
             versioned_app = FastAPI(routes=None, **vars(self))
+            if self.fused_middleware:
+                # errors of the versioned apps are handled by the GatewayMiddleware of this app
+                versioned_app.middleware_stack = versioned_app.router
+            if version in version_proxy_mapping:
+                versioned_app.router.default = ProxyApp(
+                    version_proxy_mapping[version], fallback=versioned_app.router.default
+                )
             for route in version_route_mapping[version]:
                 versioned_app.router.routes.append(route)
                 if route.path not in [
@@ -0,0 +1,339 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+import orjson
+from fastapi import Request
+
+from settings import (
+    AUTH_ALGORITHMS,
+    AUTH_AUDIENCE,
+    AUTH_ISSUER,
+    AUTH_JWKS,
+    AUTH_JWKS_REFRESH_SECONDS,
+    AUTH_LEEWAY_SECONDS,
+    AUTH_TOKEN_CACHE_SECONDS,
+    AUTH_TOKEN_CACHE_SIZE,
+    TIMEOUT_SECONDS,
+)
+
+from ..exception import UnauthorizedException
+from ..metrics import metrics
+from .logging import FastAPILogger
+from .security import HTTPBearer
+
+HASHES = {'256': hashlib.sha256, '384': hashlib.sha384, '512': hashlib.sha512}
+# DER encoded DigestInfo prefixes of EMSA-PKCS1-v1_5 signatures, RFC 8017 section 9.2
+DIGEST_INFO_PREFIXES = {
+    '256': bytes.fromhex('3031300d060960864801650304020105000420'),
+    '384': bytes.fromhex('3041300d060960864801650304020205000430'),
+    '512': bytes.fromhex('3051300d060960864801650304020305000440'),
+}
+# a token signed by an unknown key re-fetches the key set, at most once per interval
+UNKNOWN_KEY_REFRESH_SECONDS = 30
+
+TOKEN_VERIFICATIONS = metrics.counter(
+    'auth_token_verifications_total',
+    'Bearer tokens checked, result is `cached`, `verified` or `rejected`',
+    ('result',),
+)
+
+
+def b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+@dataclass(frozen=True)
+class JsonWebKey:
+    """
+    A signing key of the key set, `oct` keys verify HS256/384/512 and `RSA` keys RS256/384/512.
+    """
+
+    kid: str
+    kty: str
+    alg: Optional[str] = None
+    secret: bytes = field(default=b'', repr=False)
+    n: int = field(default=0, repr=False)
+    e: int = field(default=0, repr=False)
+
+    @classmethod
+    def from_jwk(cls, jwk: dict) -> 'JsonWebKey':
+        if jwk['kty'] == 'oct':
+            return cls(jwk.get('kid', ''), 'oct', jwk.get('alg'), secret=b64decode(jwk['k']))
+        if jwk['kty'] == 'RSA':
+            return cls(
+                jwk.get('kid', ''),
+                'RSA',
+                jwk.get('alg'),
+                n=int.from_bytes(b64decode(jwk['n']), 'big'),
+                e=int.from_bytes(b64decode(jwk['e']), 'big'),
+            )
+
+        raise ValueError(f'Unsupported key type {jwk["kty"]}')
+
+    def verify(self, algorithm: str, signing_input: bytes, signature: bytes) -> bool:
+        family, bits = algorithm[:2], algorithm[2:]
+        digest = HASHES.get(bits)
+        # the algorithm must match the key type, e.x. no HS256 token "signed" with an RSA public key
+        if digest is None or (self.alg is not None and self.alg != algorithm):
+            return False
+
+        if family == 'HS' and self.kty == 'oct':
+            expected = hmac.new(self.secret, signing_input, digest).digest()
+            return hmac.compare_digest(expected, signature)
+
+        if family == 'RS' and self.kty == 'RSA':
+            size = (self.n.bit_length() + 7) // 8
+            if len(signature) != size or int.from_bytes(signature, 'big') >= self.n:
+                return False
+            encoded = pow(int.from_bytes(signature, 'big'), self.e, self.n).to_bytes(size, 'big')
+            digest_info = DIGEST_INFO_PREFIXES[bits] + digest(signing_input).digest()
+            expected = b'\x00\x01' + b'\xff' * (size - len(digest_info) - 3) + b'\x00' + digest_info
+            return hmac.compare_digest(encoded, expected)
+
+        return False
+
+
+@dataclass
+class KeySet:
+    """
+    The JWKS of a local file or an endpoint, e.x. `https://auth.example.com/.well-known/jwks.json`,
+    loaded on startup and refreshed in the background every `refresh_seconds`.
+    """
+
+    source: Optional[str] = AUTH_JWKS
+    refresh_seconds: float = AUTH_JWKS_REFRESH_SECONDS
+
+    keys: dict[str, JsonWebKey] = field(default_factory=dict, init=False)
+    loaded_at: float = field(default=float('-inf'), init=False)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False, repr=False)
+    _refresh: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    async def fetch(self) -> bytes:
+        if self.source.startswith(('http://', 'https://')):
+            async with httpx.AsyncClient(timeout=TIMEOUT_SECONDS) as client:
+                response = await client.get(self.source)
+                response.raise_for_status()
+                return response.content
+
+        with open(self.source, 'rb') as f:
+            return f.read()
+
+    async def load(self) -> None:
+        self.loaded_at = time.monotonic()
+        document = orjson.loads(await self.fetch())  # pylint:disable=no-member
+
+        keys = {}
+        for jwk in document.get('keys', []):
+            if jwk.get('use', 'sig') != 'sig':
+                continue
+            try:
+                key = JsonWebKey.from_jwk(jwk)
+            except (KeyError, ValueError, binascii.Error) as e:
+                FastAPILogger.warning(f'Skipping key {jwk.get("kid")} of {self.source}, {e!r}')
+                continue
+            keys[key.kid] = key
+
+        self.keys = keys
+
+    async def reload(self) -> None:
+        try:
+            await self.load()
+        except Exception as e:  # pylint:disable=broad-except
+            # the keys loaded before are kept
+            FastAPILogger.error(f'Loading the key set {self.source} failed, {e!r}')
+
+    async def get(self, kid: Optional[str]) -> Optional[JsonWebKey]:
+        key = self.find(kid)
+        if key is not None or self.source is None:
+            return key
+
+        # a key rotated in since the last refresh
+        async with self._lock:
+            if time.monotonic() - self.loaded_at >= UNKNOWN_KEY_REFRESH_SECONDS:
+                await self.reload()
+
+        return self.find(kid)
+
+    def find(self, kid: Optional[str]) -> Optional[JsonWebKey]:
+        if kid is None and len(self.keys) == 1:
+            return next(iter(self.keys.values()))
+
+        return self.keys.get(kid or '')
+
+    async def startup(self) -> None:
+        if self.source is None or self._refresh is not None:
+            return
+
+        await self.reload()
+        self._refresh = asyncio.create_task(self._refresh_periodically())
+
+    async def shutdown(self) -> None:
+        if self._refresh is not None:
+            self._refresh.cancel()
+            self._refresh = None
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            async with self._lock:
+                await self.reload()
+
+
+@dataclass
+class TokenCache:
+    """
+    LRU of the verified claims keyed by the token hash, so the raw tokens are never kept in
+    memory. Entries expire at their `expires_at`, i.e. the token `exp` at the latest.
+    """
+
+    max_size: int = AUTH_TOKEN_CACHE_SIZE
+    ttl: float = AUTH_TOKEN_CACHE_SECONDS
+
+    # token hash -> (claims, expires at)
+    _entries: OrderedDict[bytes, tuple[dict, float]] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+
+    def get(self, key: bytes, now: float) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        claims, expires_at = entry
+        if now >= expires_at:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return claims
+
+    def set(self, key: bytes, claims: dict, now: float) -> None:
+        expires_at = min(now + self.ttl, float(claims.get('exp', 'inf')))
+        if now >= expires_at or self.max_size <= 0:
+            return
+
+        self._entries[key] = (claims, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+@dataclass
+class TokenVerifier:
+    """
+    Local JWT verification, the signature against the key set, then `exp` / `nbf` with
+    `leeway` seconds of clock skew and the `issuer` / `audience` when configured.
+    """
+
+    key_set: KeySet
+    algorithms: tuple[str, ...] = AUTH_ALGORITHMS
+    issuer: Optional[str] = AUTH_ISSUER
+    audience: Optional[str] = AUTH_AUDIENCE
+    leeway: int = AUTH_LEEWAY_SECONDS
+    cache: TokenCache = field(default_factory=TokenCache)
+
+    async def verify(self, token: str) -> dict:
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        now = time.time()
+        claims = self.cache.get(key, now)
+        if claims is not None:
+            TOKEN_VERIFICATIONS.labels('cached').inc()
+            return claims
+
+        try:
+            claims = await self.decode(token, now)
+        except UnauthorizedException:
+            TOKEN_VERIFICATIONS.labels('rejected').inc()
+            raise
+
+        TOKEN_VERIFICATIONS.labels('verified').inc()
+        self.cache.set(key, claims, now)
+        return claims
+
+    def cached_subject(self, token: str) -> Optional[str]:
+        """
+        `sub` of the token when it was already verified, without verifying it
+        """
+
+        claims = self.cache.get(
+            hashlib.blake2b(token.encode(), digest_size=16).digest(), time.time()
+        )
+        return claims.get('sub') if claims is not None else None
+
+    async def decode(self, token: str, now: float) -> dict:
+        try:
+            signing_input, _, signature = token.encode('ascii').rpartition(b'.')
+            encoded_header, _, encoded_payload = signing_input.partition(b'.')
+            header = orjson.loads(b64decode(encoded_header.decode()))  # pylint:disable=no-member
+            algorithm = header['alg']
+            verification_key = await self.key_set.get(header.get('kid'))
+            if (
+                algorithm not in self.algorithms
+                or verification_key is None
+                or not verification_key.verify(
+                    algorithm, signing_input, b64decode(signature.decode())
+                )
+            ):
+                raise UnauthorizedException('Invalid token signature')
+            claims = orjson.loads(b64decode(encoded_payload.decode()))  # pylint:disable=no-member
+            expires_at, not_before = float(claims.get('exp', 'inf')), float(claims.get('nbf', 0))
+        except (AttributeError, KeyError, TypeError, ValueError, binascii.Error) as e:
+            raise UnauthorizedException('Malformed token') from e
+
+        if now >= expires_at + self.leeway:
+            raise UnauthorizedException('Token expired')
+        if now < not_before - self.leeway:
+            raise UnauthorizedException('Token not yet valid')
+        if self.issuer is not None and claims.get('iss') != self.issuer:
+            raise UnauthorizedException('Invalid token issuer')
+        if self.audience is not None:
+            audience = claims.get('aud')
+            if self.audience not in (audience if isinstance(audience, list) else [audience]):
+                raise UnauthorizedException('Invalid token audience')
+
+        return claims
+
+
+class BearerClaims(HTTPBearer):
+    """
+    Dependency of the claims of the verified bearer token, e.x.:
+        claims: dict = Depends(bearer_claims)
+
+    Its 401s carry the `WWW-Authenticate` challenge of RFC 6750, with `error="invalid_token"`
+    when a token was rejected.
+    """
+
+    def __init__(self, verifier: TokenVerifier):
+        super().__init__()
+        self.verifier = verifier
+
+    async def __call__(self, request: Request) -> dict:
+        token = await super().__call__(request)
+        if not token:
+            raise UnauthorizedException(
+                'Missing bearer token', headers={'WWW-Authenticate': 'Bearer'}
+            )
+
+        try:
+            return await self.verifier.verify(token)
+        except UnauthorizedException as e:
+            e.headers = {
+                'WWW-Authenticate': f'Bearer error="invalid_token", error_description="{e.message}"'
+            }
+            raise
+
+
+key_set = KeySet()
+token_verifier = TokenVerifier(key_set)
+bearer_claims = BearerClaims(token_verifier)
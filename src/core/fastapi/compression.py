@@ -0,0 +1,282 @@
+import zlib
+from dataclasses import dataclass, field
+from typing import Optional, Protocol
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Message, Send
+
+from settings import (
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_CONTENT_TYPES,
+    COMPRESSION_ENCODINGS,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MINIMUM_BYTES,
+    COMPRESSION_THREAD_BYTES,
+    COMPRESSION_ZSTD_LEVEL,
+)
+
+from ..metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSED_BYTES = metrics.counter(
+    'http_response_compressed_bytes_total',
+    'Response body bytes before (`in`) and after (`out`) compression',
+    ('encoding', 'direction'),
+)
+
+
+class Encoder(Protocol):
+    def encode(self, data: bytes, final: bool) -> bytes:
+        """
+        Compress `data`, flushed so the client can decode everything sent so far
+        """
+
+
+class GzipEncoder:
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.process(data) + (
+            self._compressor.finish() if final else self._compressor.flush()
+        )
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = COMPRESSION_ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+
+ENCODERS = {
+    'gzip': GzipEncoder,
+    **({'br': BrotliEncoder} if brotli is not None else {}),
+    **({'zstd': ZstdEncoder} if zstandard is not None else {}),
+}
+
+
+def parse_accept_encoding(value: str) -> dict[str, float]:
+    """
+    e.x.: `gzip, br;q=0.8, *;q=0` -> {'gzip': 1.0, 'br': 0.8, '*': 0.0}
+    """
+
+    qualities = {}
+    for item in value.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, argument = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(argument)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    return qualities
+
+
+@dataclass
+class Compression:
+    """
+    Response compression of `GatewayMiddleware`. The encoding is the acceptable one of
+    `encodings` with the highest `q`, the earliest on ties.
+
+    Bodies are compressed chunk by chunk and flushed, so streamed and proxied responses are
+    still delivered progressively. Bodies smaller than `minimum_bytes`, already encoded or of
+    other content types than `content_types` are sent as is.
+    """
+
+    encodings: tuple[str, ...] = COMPRESSION_ENCODINGS
+    minimum_bytes: int = COMPRESSION_MINIMUM_BYTES
+    content_types: tuple[str, ...] = COMPRESSION_CONTENT_TYPES
+    thread_bytes: int = COMPRESSION_THREAD_BYTES
+
+    # Accept-Encoding -> negotiated encoding, browsers send a handful of distinct values
+    _negotiated: dict[str, Optional[str]] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.encodings = tuple(encoding for encoding in self.encodings if encoding in ENCODERS)
+
+    def __bool__(self) -> bool:
+        return bool(self.encodings)
+
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        try:
+            return self._negotiated[accept_encoding]
+        except KeyError:
+            pass
+
+        qualities = parse_accept_encoding(accept_encoding)
+        wildcard = qualities.get('*', 0.0)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = qualities.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+
+        if len(self._negotiated) >= 1024:
+            self._negotiated.clear()
+        self._negotiated[accept_encoding] = best
+        return best
+
+    def is_compressible(self, message: Message) -> bool:
+        if message['status'] < 200 or message['status'] in (204, 206, 304):
+            return False
+
+        content_type = None
+        for key, value in message.get('headers', ()):
+            key = key.lower()
+            if key == b'content-encoding':
+                return False
+            if key == b'content-type':
+                content_type = value.decode('latin-1').lower()
+
+        return content_type is not None and content_type.startswith(self.content_types)
+
+    async def encode(self, encoder: Encoder, data: bytes, final: bool) -> bytes:
+        if len(data) >= self.thread_bytes:
+            # zlib, brotli and zstandard release the GIL while compressing
+            return await run_in_threadpool(encoder.encode, data, final)
+
+        return encoder.encode(data, final)
+
+    def responder(self, send: Send, encoding: str) -> 'CompressionResponder':
+        return CompressionResponder(self, send, encoding)
+
+
+class CompressionResponder:
+    """
+    `send` of a response compressed with `encoding`, the response start is held until the first
+    body message tells whether the body is worth compressing.
+
+    The body of a response served from `core.httpx.cache` is compressed as a whole and the
+    compressed variant cached along with it, see `core.httpx.cache.CachedBody`.
+    """
+
+    def __init__(self, compression_: Compression, send: Send, encoding: str):
+        self.compression = compression_
+        self.send = send
+        self.encoding = encoding
+        self.start: Optional[Message] = None
+        self.cached_body = None
+        self.chunks: Optional[list[bytes]] = None
+        self.encoder: Optional[Encoder] = None
+        self.passthrough = False
+        self.done = False
+
+    async def __call__(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            self.cached_body = message.pop('cached_body', None)
+            if self.compression.is_compressible(message):
+                self.start = message
+            else:
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.send(message)
+            return
+        if self.done:
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start is not None and self.chunks is None:  # first body message
+            if self.cached_body is not None:
+                variant = self.cached_body.get_variant(self.encoding)
+                if variant is not None:
+                    # the rest of the body is the cached content
+                    await self.send_whole(variant, len(self.cached_body.entry.content))
+                    return
+                self.chunks = []
+            elif not more_body:
+                await self.send_whole_body(body)
+                return
+            else:
+                self.encoder = ENCODERS[self.encoding]()
+                await self.send_start(None)
+
+        if self.chunks is not None:
+            self.chunks.append(body)
+            if not more_body:
+                await self.send_whole_body(b''.join(self.chunks))
+            return
+
+        content = await self.compression.encode(self.encoder, body, not more_body)
+        self.count(len(body), len(content))
+        await self.send({'type': 'http.response.body', 'body': content, 'more_body': more_body})
+
+    async def send_whole_body(self, body: bytes) -> None:
+        if len(body) < self.compression.minimum_bytes:
+            self.passthrough = True
+            start, self.start = self.start, None
+            await self.send(start)
+            await self.send({'type': 'http.response.body', 'body': body})
+            return
+
+        content = await self.compression.encode(ENCODERS[self.encoding](), body, True)
+        if self.cached_body is not None:
+            self.cached_body.set_variant(self.encoding, content)
+        await self.send_whole(content, len(body))
+
+    async def send_whole(self, content: bytes, size: int) -> None:
+        self.done = True
+        self.count(size, len(content))
+        await self.send_start(len(content))
+        await self.send({'type': 'http.response.body', 'body': content})
+
+    async def send_start(self, content_length: Optional[int]) -> None:
+        start, self.start = self.start, None
+        headers, vary = [], []
+        for key, value in start.get('headers', ()):
+            lowered = key.lower()
+            if lowered == b'vary':
+                vary.append(value)
+            elif lowered != b'content-length':
+                headers.append((key, value))
+
+        headers.append((b'content-encoding', self.encoding.encode('latin-1')))
+        vary_value = b', '.join(vary)
+        if b'accept-encoding' not in vary_value.lower() and vary_value.strip() != b'*':
+            vary.append(b'Accept-Encoding')
+        headers.append((b'vary', b', '.join(vary)))
+        if content_length is not None:
+            headers.append((b'content-length', str(content_length).encode('latin-1')))
+
+        await self.send({**start, 'headers': headers})
+
+    def count(self, size: int, compressed: int) -> None:
+        COMPRESSED_BYTES.labels(self.encoding, 'in').inc(size)
+        COMPRESSED_BYTES.labels(self.encoding, 'out').inc(compressed)
+
+
+compression = Compression()
@@ -7,6 +7,7 @@ class FastAPIError(_FastAPIError):
     code = 1001
     message = 'Unexpected'
     data = {}
+    headers = None
 
     def __init__(self, msg=None, **kwargs):
         if msg:
@@ -1,18 +1,112 @@
 import os
+import random
 import sys
 from contextvars import ContextVar
-from logging import Filter, LogRecord, getLogger
-from typing import Optional
+from dataclasses import dataclass
+from logging import WARNING, Filter, LogRecord, getLogger
+from typing import Callable, Iterable, Mapping, Optional
+
+from settings import (
+    HTTP_CAPTURE_ALLOWED_HEADERS,
+    HTTP_CAPTURE_DENIED_HEADERS,
+    HTTP_CAPTURE_REDACTED_HEADERS,
+    HTTP_CAPTURE_SAMPLE_RATE,
+    REQUEST_BODY_PREVIEW_BYTES,
+)
 
-http_context_var: ContextVar[Optional[dict]] = ContextVar('http_context_var', default=None)
 FastAPILogger = getLogger('fastapi')
+REDACTED = '[REDACTED]'
+
+
+@dataclass(frozen=True)
+class CapturePolicy:
+    """
+    What of a request / response is attached to log records: a sample of the successful
+    requests, capped bodies and filtered headers, credentials redacted.
+    """
+
+    sample_rate: float = HTTP_CAPTURE_SAMPLE_RATE
+    body_bytes: int = REQUEST_BODY_PREVIEW_BYTES
+    allowed_headers: frozenset[str] = HTTP_CAPTURE_ALLOWED_HEADERS  # all when empty
+    denied_headers: frozenset[str] = HTTP_CAPTURE_DENIED_HEADERS
+    redacted_headers: frozenset[str] = HTTP_CAPTURE_REDACTED_HEADERS
+
+    def sample(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def headers(self, headers: Iterable[tuple[str, str]]) -> dict[str, str]:
+        captured: dict[str, str] = {}
+        for k, v in headers:
+            name = k.lower()
+            if (self.allowed_headers and name not in self.allowed_headers) or (
+                name in self.denied_headers
+            ):
+                continue
+            captured.setdefault(k, REDACTED if name in self.redacted_headers else v)
+
+        return captured
+
+    def body(self, raw: Optional[bytes]) -> dict:
+        if raw is None:  # not read, e.g. streamed
+            return {'raw': None}
+
+        return {
+            'raw': str(raw[: self.body_bytes])[2:-1],  # 'b'abcde'' -> 'abcde'
+            'size': len(raw),
+            'truncated': len(raw) > self.body_bytes,
+        }
+
+
+capture_policy = CapturePolicy()
+
+
+class HTTPContext:
+    """
+    The request being served. It is only rendered for the log records that capture it, so the
+    requests that log nothing but a sampled-out access line pay nothing.
+    """
+
+    __slots__ = ('query_string', 'headers', 'body', 'sampled', 'policy')
+
+    def __init__(
+        self,
+        query_string: bytes,
+        headers: Mapping[str, str],
+        body: Callable[[], dict],
+        policy: CapturePolicy = capture_policy,
+    ):
+        self.query_string = query_string
+        self.headers = headers
+        self.body = body
+        self.sampled = policy.sample()
+        self.policy = policy
+
+    def captures(self, record: LogRecord) -> bool:
+        if self.sampled or record.levelno >= WARNING:
+            return True
+
+        # access lines are logged at INFO, their level is derived from the status by the formatter
+        if record.name != 'uvicorn.access':
+            return False
+        _, _, _, _, status_code = record.args
+        return status_code >= 400
+
+    def dict(self) -> dict:
+        return {
+            'query_params': self.query_string.decode('utf-8'),
+            'headers': self.policy.headers(self.headers.items()),
+            'body': self.body(),
+        }
+
+
+http_context_var: ContextVar[Optional[HTTPContext]] = ContextVar('http_context_var', default=None)
 
 
 class HTTPFilter(Filter):
     def filter(self, record: LogRecord) -> bool:
-        info: dict = http_context_var.get() or {}
-        for k, v in info.items():
-            setattr(record, k, v)
+        context = http_context_var.get()
+        if context is not None and context.captures(record):
+            record.request = context.dict()
 
         return True
 
@@ -31,17 +125,40 @@ class ASGIExceptionFilter(Filter):
 
 
 class RelativePathFilter(Filter):
+    """
+    Sets `record.relativepath`, the path of the source file relative to the longest matching
+    `sys.path` entry. Resolved paths are memoized per pathname until `sys.path` changes.
+    """
+
+    MAX_CACHED_PATHS = 1024
+
+    def __init__(self, name: str = ''):
+        super().__init__(name)
+        self._sys_path: list[str] = []
+        self._relative_paths: dict[str, str] = {}
+
     def filter(self, record):
-        pathname = record.pathname
-        record.relativepath = None
-        abs_sys_paths = map(os.path.abspath, sys.path)
-        for path in sorted(abs_sys_paths, key=len, reverse=True):  # longer paths first
+        if sys.path != self._sys_path:
+            self._sys_path = list(sys.path)
+            self._relative_paths.clear()
+
+        relativepath = self._relative_paths.get(record.pathname)
+        if relativepath is None:
+            if len(self._relative_paths) >= self.MAX_CACHED_PATHS:
+                self._relative_paths.clear()
+            relativepath = self._relative_paths[record.pathname] = self.resolve(record.pathname)
+        record.relativepath = relativepath
+
+        return True
+
+    @staticmethod
+    def resolve(pathname: str) -> str:
+        abs_sys_paths = sorted(map(os.path.abspath, sys.path), key=len, reverse=True)
+        for path in abs_sys_paths:  # longer paths first
             if not path.endswith(os.sep):
                 path += os.sep
             if pathname.startswith(path):
-                record.relativepath = os.path.relpath(pathname, path)
-                break
-        else:
-            record.relativepath = os.path.relpath(pathname, path)
+                return os.path.relpath(pathname, path)
 
-        return True
+        # relative to the shortest entry
+        return os.path.relpath(pathname, abs_sys_paths[-1]) if abs_sys_paths else pathname
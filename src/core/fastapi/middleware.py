@@ -1,17 +1,40 @@
 import asyncio
-from dataclasses import dataclass
-
+import functools
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Mapping, Optional
+
+from asgi_correlation_id.context import correlation_id
+from asgi_correlation_id.extensions.sentry import get_sentry_extension
+from asgi_correlation_id.middleware import FAILED_VALIDATION_MESSAGE, is_valid_uuid4
+from fastapi.concurrency import AsyncExitStack
 from fastapi.logger import logger
 from starlette import __version__ as starlette_version
 from starlette.concurrency import run_in_threadpool
 from starlette.datastructures import Headers
 from starlette.exceptions import ExceptionMiddleware as _ExceptionMiddleware
 from starlette.exceptions import HTTPException
+from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from settings import (
+    REQUEST_BODY_PREVIEW_BYTES,
+    REQUEST_BODY_PREVIEW_CONTENT_TYPES,
+    REQUEST_BODY_STREAMING,
+)
+
+from ..metrics import metrics
 from .exception import FastAPIError
-from .logging import http_context_var
+from .logging import CapturePolicy, HTTPContext, capture_policy, http_context_var
+
+if TYPE_CHECKING:
+    from .admission import AdmissionController
+    from .compression import Compression
+    from .ratelimit import RateLimiter
 
 
 class WrapperExceptionMiddleware(_ExceptionMiddleware):
@@ -56,74 +79,156 @@ class WrapperExceptionMiddleware(_ExceptionMiddleware):
         try:
             await self.app(scope, receive, sender)
         except Exception as exc:
-            handler = None
+            await self.handle_exception(exc, scope, receive, sender, response_started)
+
+    def lookup_handler(self, exc: Exception):
+        handler = None
+
+        if isinstance(exc, HTTPException):
+            handler = self._status_handlers.get(exc.status_code)
+
+        if handler is None:
+            handler = self._lookup_exception_handler(exc)
 
-            if isinstance(exc, HTTPException):
-                handler = self._status_handlers.get(exc.status_code)
+        return handler
 
-            if handler is None:
-                handler = self._lookup_exception_handler(exc)
+    async def handle_exception(
+        self, exc: Exception, scope: Scope, receive: Receive, send: Send, response_started: bool
+    ) -> None:
+        handler = self.lookup_handler(exc)
+        if handler is None:
+            raise exc
 
-            if handler is None:
-                raise exc
+        if response_started:
+            msg = 'Caught handled exception, but response already started.'
+            raise RuntimeError(msg) from exc
 
-            if response_started:
-                msg = 'Caught handled exception, but response already started.'
-                raise RuntimeError(msg) from exc
+        request = Request(scope, receive=receive)
+        if asyncio.iscoroutinefunction(handler):
+            response = await handler(request, exc)
+        else:
+            response = await run_in_threadpool(handler, request, exc)
+        await response(scope, receive, send)
 
-            request = Request(scope, receive=receive)
-            if asyncio.iscoroutinefunction(handler):
-                response = await handler(request, exc)
+        if isinstance(exc, (NotImplementedError, FastAPIError)):
+            kwargs = {
+                'msg': f'{type(exc).__name__}: {exc}',
+                'exc_info': exc,
+            }
+            http_status = getattr(exc, 'http_status', -1)
+            if http_status // 100 == 4:
+                logger.warning(**kwargs)
+            elif http_status == 503:
+                logger.critical(**kwargs)
             else:
-                response = await run_in_threadpool(handler, request, exc)
-            await response(scope, receive, sender)
-
-            if isinstance(exc, (NotImplementedError, FastAPIError)):
-                kwargs = {
-                    'msg': f'{type(exc).__name__}: {exc}',
-                    'exc_info': exc,
-                }
-                http_status = getattr(exc, 'http_status', -1)
-                if http_status // 100 == 4:
-                    logger.warning(**kwargs)
-                elif http_status == 503:
-                    logger.critical(**kwargs)
-                else:
-                    logger.error(**kwargs)
+                logger.error(**kwargs)
+
+
+@dataclass
+class RequestBodyPreview:
+    """
+    Bounded copy of the request body, filled while the app consumes the stream.
+
+    Only the first `limit` bytes are kept; the string rendering is deferred until a log record
+    actually needs it.
+    """
+
+    limit: int
+    buffer: bytearray = field(default_factory=bytearray)
+    size: int = 0
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        remaining = self.limit - len(self.buffer)
+        if remaining > 0 and chunk:
+            self.buffer += memoryview(chunk)[:remaining]
+
+    def dict(self) -> dict:
+        return {
+            'raw': str(bytes(self.buffer))[2:-1],  # 'b'abcde'' -> 'abcde'
+            'size': self.size,
+            'truncated': self.size > len(self.buffer),
+        }
 
 
 # https://github.com/encode/starlette/pull/1519#issuecomment-1060633787
 @dataclass
 class ParseRequestMiddleware:
+    """
+    Capture the request into `http_context_var` for logging, rendered by `policy` only when a
+    log record captures it.
+
+    - buffered (default): the whole body is read before dispatching and replayed to the app.
+    - streaming: the body is passed through untouched, only a bounded preview of allowed
+      content types is captured (see `REQUEST_BODY_PREVIEW_*` settings).
+    """
+
     app: ASGIApp
+    streaming: bool = REQUEST_BODY_STREAMING
+    preview_bytes: int = REQUEST_BODY_PREVIEW_BYTES
+    preview_content_types: tuple[str, ...] = REQUEST_BODY_PREVIEW_CONTENT_TYPES
+    policy: CapturePolicy = capture_policy
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         if scope['type'] != 'http':
             await self.app(scope, receive, send)
             return
 
+        receive = await self.capture(scope, receive, Headers(scope=scope))
+        await self.app(scope, receive, send)
+
+    async def capture(self, scope: Scope, receive: Receive, headers: Headers) -> Receive:
+        """
+        Set `http_context_var` of the request, returns the `receive` to call the app with.
+        """
+
+        if self.streaming:
+            return self.stream(scope, receive, headers)
+
         # Ingest all body messages from the ASGI `receive` callable.
-        chunks = await self.get_chunks(receive)
-        headers = await self.get_headers(scope)
+        messages = self.join_chunks(await self.get_chunks(receive))
         http_context_var.set(
-            {
-                'request': {
-                    'query_params': await self.get_params(scope),
-                    'headers': dict(headers),
-                    'body': await self.get_body(chunks, headers),
-                },
-            }
+            HTTPContext(
+                scope['query_string'],
+                headers,
+                body=functools.partial(self.policy.body, messages[0]['body']),
+                policy=self.policy,
+            )
         )
 
-        # Dispatch to the ASGI callable
         async def wrapped_receive():
             # First up we want to return any messages we've stashed.
-            if chunks:
-                return chunks.pop(0)
+            if messages:
+                return messages.popleft()
             # Once that's done we can just await any other messages.
             return await receive()
 
-        await self.app(scope, wrapped_receive, send)
+        return wrapped_receive
+
+    def stream(self, scope: Scope, receive: Receive, headers: Headers) -> Receive:
+        preview = None
+        if headers.get('content-type', '').startswith(self.preview_content_types):
+            preview = RequestBodyPreview(limit=min(self.preview_bytes, self.policy.body_bytes))
+
+        http_context_var.set(
+            HTTPContext(
+                scope['query_string'],
+                headers,
+                body=preview.dict if preview else functools.partial(self.policy.body, None),
+                policy=self.policy,
+            )
+        )
+
+        if preview is None:
+            return receive
+
+        async def wrapped_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                preview.feed(message.get('body', b''))
+            return message
+
+        return wrapped_receive
 
     @staticmethod
     async def get_chunks(receive: Receive) -> list[dict[str, bytes]]:
@@ -137,20 +242,314 @@ class ParseRequestMiddleware:
         return chunks
 
     @staticmethod
-    async def get_params(scope: Scope) -> str:
-        return scope['query_string'].decode('utf-8')
+    def join_chunks(chunks: list[dict]) -> deque[dict]:
+        """
+        Collapse the body chunks into a single `http.request` message, keeping any other message
+        (e.g. `http.disconnect`) after it, so the body is only held once while replaying.
+        """
 
-    @staticmethod
-    async def get_headers(scope: Scope) -> Headers:
-        return Headers(scope=scope)
+        messages: deque[dict] = deque(chunk for chunk in chunks if chunk['type'] != 'http.request')
+        body = b''.join(
+            chunk.get('body', b'') for chunk in chunks if chunk['type'] == 'http.request'
+        )
+        messages.appendleft({'type': 'http.request', 'body': body, 'more_body': False})
 
-    @staticmethod
-    async def get_body(chunks: list[dict], headers) -> dict:
-        stream: list[bytes] = [chunk.get('body', b'') for chunk in chunks]
-        if stream[-1] != b'':
-            stream.append(b'')  # Request.stream(), The last one is `b''`
+        return messages
+
+
+HTTP_REQUESTS = metrics.counter(
+    'http_requests_total', 'Requests served', ('method', 'route', 'status')
+)
+HTTP_REQUEST_DURATION = metrics.histogram(
+    'http_request_duration_seconds', 'Request latency', ('method', 'route')
+)
+HTTP_REQUESTS_IN_FLIGHT = metrics.gauge('http_requests_in_flight', 'Requests being served')
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Path template of the matched route (the prefix of proxied routes), so the label values stay
+    bounded whatever the requested paths are.
+    """
+
+    route = scope.get('route')
+    if route is None:
+        return 'unmatched'
 
-        body: dict[str, str] = {}
-        body['raw'] = str(b''.join(stream))[2:-1]  # 'b'abcde'' -> 'abcde'
+    return scope.get('root_path', '') + route.path
 
-        return body
+
+def observe_request(scope: Scope, status_code: int, duration: float) -> None:
+    method, route = scope['method'], route_label(scope)
+    HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+    HTTP_REQUEST_DURATION.labels(method, route).observe(duration)
+
+
+@dataclass
+class MetricsMiddleware:
+    """
+    Count and time the requests, labeled by method, route and status. Recording is a few dict
+    lookups and additions, exposed by `core.metrics.metrics`.
+    """
+
+    app: ASGIApp
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def sender(message: Message) -> None:
+            nonlocal status_code
+
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, sender)
+        finally:
+            in_flight.dec()
+            observe_request(scope, status_code, time.perf_counter() - start)
+
+
+def set_headers(raw: list[tuple[bytes, bytes]], updates: dict[bytes, bytes]) -> None:
+    """
+    `MutableHeaders.__setitem__` of each of `updates` (lowercase names) in one pass over `raw`
+    """
+
+    headers = []
+    updated = set()
+    for key, value in raw:
+        if key in updates:
+            if key in updated:
+                continue
+            updated.add(key)
+            value = updates[key]
+        headers.append((key, value))
+    headers.extend((key, value) for key, value in updates.items() if key not in updated)
+
+    raw[:] = headers
+
+
+class GatewayMiddleware(WrapperExceptionMiddleware):
+    """
+    CORS, correlation id, request capture, metrics and exception mapping in a single layer: the
+    request headers are parsed once and `send` is wrapped once. Behaves as the stack of
+    `MetricsMiddleware`, `CORSMiddleware`, `CorrelationIdMiddleware`, `ParseRequestMiddleware`,
+    `WrapperExceptionMiddleware` and `AsyncExitStackMiddleware`, outermost first.
+
+    Requests over the limits of `rate_limiter` get their 429 and requests turned down by
+    `admission` their 503, before their body is read. Responses are compressed by `compression`.
+
+    `FastAPI.build_middleware_stack` passes it the exception handlers, in place of the last two.
+
+    e.x.:
+        app.add_middleware(GatewayMiddleware, cors={'allow_origin_regex': '.*'})
+    """
+
+    correlation_id_logger = logging.getLogger('asgi_correlation_id')
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        handlers: Optional[Mapping] = None,
+        debug: bool = False,
+        error_handler: Optional[Callable] = None,
+        cors: Optional[dict] = None,
+        request_id_header: str = 'X-Request-ID',
+        parser: Optional[ParseRequestMiddleware] = None,
+        admission: Optional['AdmissionController'] = None,
+        rate_limiter: Optional['RateLimiter'] = None,
+        compression: Optional['Compression'] = None,
+    ):
+        super().__init__(app, handlers=handlers, debug=debug)
+        self.error_handler = error_handler
+        # the CORS policy, its `app` is never called
+        self.cors = CORSMiddleware(app, **cors) if cors is not None else None
+        self.request_id_header = request_id_header
+        self.request_id_key = request_id_header.lower().encode('latin-1')
+        self.cors_headers = {
+            key.lower().encode('latin-1'): value.encode('latin-1')
+            for key, value in (self.cors.simple_headers if self.cors else {}).items()
+        }
+        self.parser = parser or ParseRequestMiddleware(app)
+        self.admission = admission
+        # no rules, no limits
+        self.rate_limiter = rate_limiter if rate_limiter else None
+        self.compression = compression if compression else None
+        self.sentry_extension = get_sentry_extension()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        origin = request_id = authorization = accept_encoding = forwarded_for = None
+        preflight = has_cookie = False
+        for key, value in scope['headers']:
+            if key == b'origin':
+                if origin is None:
+                    origin = value.decode('latin-1')
+            elif key == self.request_id_key:
+                if request_id is None:
+                    request_id = value.decode('latin-1')
+            elif key == b'access-control-request-method':
+                preflight = True
+            elif key == b'cookie':
+                has_cookie = True
+            elif key == b'authorization':
+                authorization = value.decode('latin-1')
+            elif key == b'accept-encoding':
+                accept_encoding = value.decode('latin-1')
+            elif key == b'x-forwarded-for':
+                # each proxy may add its own header line
+                addresses = value.decode('latin-1')
+                forwarded_for = (
+                    addresses if forwarded_for is None else f'{forwarded_for},{addresses}'
+                )
+
+        cors = self.cors if origin is not None else None
+        status_code = 500
+        response_started = False
+
+        async def sender(message: Message) -> None:
+            nonlocal status_code, response_started
+
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                response_started = True
+                # set by the proxy for the compression of cached bodies
+                message.pop('cached_body', None)
+                self.add_response_headers(message, cors, origin, has_cookie)
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            if cors is not None and preflight and scope['method'] == 'OPTIONS':
+                response = cors.preflight_response(request_headers=headers)
+                await response(scope, receive, send)
+                status_code = response.status_code
+                return
+
+            self.set_correlation_id(request_id)
+            rate_limiter = self.rate_limiter
+            if rate_limiter is not None and (
+                wait := rate_limiter.check(scope, authorization, forwarded_for)
+            ):
+                await rate_limiter.reject(sender, wait)
+                return
+
+            admission = self.admission
+            if admission is not None and not admission.acquire(admission.priority(scope['path'])):
+                await admission.reject(sender)
+                return
+
+            compression = self.compression
+            encoding = (
+                compression.negotiate(accept_encoding)
+                if compression is not None and accept_encoding
+                else None
+            )
+            try:
+                receive = await self.parser.capture(scope, receive, headers)
+                try:
+                    await self.call_app(
+                        scope,
+                        receive,
+                        compression.responder(sender, encoding) if encoding else sender,
+                    )
+                except Exception as exc:
+                    await self.handle_exception(exc, scope, receive, sender, response_started)
+            finally:
+                if admission is not None:
+                    admission.release()
+        finally:
+            in_flight.dec()
+            observe_request(scope, status_code, time.perf_counter() - start)
+
+    def set_correlation_id(self, header_value: Optional[str]) -> None:
+        if not header_value:
+            id_value = uuid.uuid4().hex
+        elif not is_valid_uuid4(header_value):
+            id_value = uuid.uuid4().hex
+            self.correlation_id_logger.warning(FAILED_VALIDATION_MESSAGE, header_value)
+        else:
+            id_value = header_value
+
+        correlation_id.set(id_value)
+        self.sentry_extension(id_value)
+
+    def add_response_headers(
+        self,
+        message: Message,
+        cors: Optional[CORSMiddleware],
+        origin: Optional[str],
+        has_cookie: bool,
+    ) -> None:
+        # in the order the stacked middlewares add them: correlation id, then CORS
+        raw = message.setdefault('headers', [])
+        request_id = correlation_id.get()
+        if request_id:
+            raw.append((self.request_id_key, request_id.encode('latin-1')))
+            raw.append((b'access-control-expose-headers', self.request_id_header.encode('latin-1')))
+
+        if cors is None:
+            return
+
+        updates = self.cors_headers
+        # mirror the origin when cookies are sent or only some origins are allowed
+        if (cors.allow_all_origins and has_cookie) or (
+            not cors.allow_all_origins and cors.is_allowed_origin(origin=origin)
+        ):
+            vary = next((value for key, value in raw if key == b'vary'), None)
+            updates = {
+                **updates,
+                b'access-control-allow-origin': origin.encode('latin-1'),
+                b'vary': vary + b', Origin' if vary else b'Origin',
+            }
+        set_headers(raw, updates)
+
+    async def handle_exception(
+        self, exc: Exception, scope: Scope, receive: Receive, send: Send, response_started: bool
+    ) -> None:
+        if (
+            self.error_handler is None
+            or self.debug
+            or response_started
+            or self.lookup_handler(exc) is not None
+        ):
+            await super().handle_exception(exc, scope, receive, send, response_started)
+            return
+
+        # unhandled errors get the error response with the headers of this middleware, as the
+        # ServerErrorMiddleware of the versioned apps gave them, the outer one re-raises it
+        request = Request(scope, receive=receive)
+        if asyncio.iscoroutinefunction(self.error_handler):
+            response = await self.error_handler(request, exc)
+        else:
+            response = await run_in_threadpool(self.error_handler, request, exc)
+        await response(scope, receive, send)
+        raise exc
+
+    async def call_app(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # `AsyncExitStackMiddleware`, closes the dependencies with yield before the exception
+        # handlers run
+        dependency_exception: Optional[Exception] = None
+        async with AsyncExitStack() as stack:
+            scope['fastapi_astack'] = stack
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                dependency_exception = e
+                raise e
+        if dependency_exception:
+            raise dependency_exception
@@ -0,0 +1,293 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Protocol
+
+import orjson
+from starlette.types import Scope, Send
+
+from settings import (
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_RULES,
+    RATE_LIMIT_SHARED_FILE,
+    RATE_LIMIT_TRUSTED_PROXIES,
+)
+
+from ..exception import TooManyRequestsException
+from ..handler import HTTP_ERRORS
+from ..metrics import metrics
+from .auth import token_verifier
+
+TOO_MANY_REQUESTS_CONTENT = orjson.dumps(  # pylint:disable=no-member
+    {
+        'message': TooManyRequestsException.message,
+        'code': int(TooManyRequestsException.code),
+        'data': None,
+    }
+)
+
+LIMITED_REQUESTS = metrics.counter(
+    'http_requests_limited_total', 'Requests rejected by the rate limiter', ('rule',)
+)
+TOO_MANY_REQUESTS_ERRORS = HTTP_ERRORS.labels(str(int(TooManyRequestsException.code)))
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    path: str
+    rate: float  # tokens refilled per second
+    burst: int  # bucket capacity
+
+    @classmethod
+    def parse(cls, path: str, value: str) -> 'RateLimitRule':
+        """
+        e.x.: `20:40`, 20 requests per second with bursts of 40, `20` for bursts of 20
+        """
+
+        rate_value, _, burst_value = value.partition(':')
+        rate = float(rate_value)
+        # a rate of 0 would divide by zero, an empty bucket waits `1 / rate` for its next token
+        if not 0 < rate < math.inf:
+            raise ValueError(f'Invalid rate limit {value} of {path}, the rate must be > 0')
+        burst = int(burst_value) if burst_value else max(1, math.ceil(rate))
+        if burst < 1:
+            raise ValueError(f'Invalid rate limit {value} of {path}, the burst must be > 0')
+
+        return cls(path, rate, burst)
+
+
+def take_token(tokens: float, updated: float, rate: float, burst: int, now: float):
+    """
+    Refill the bucket for the time elapsed since `updated` and take a token, returns the tokens
+    left and 0 when a token was taken, the seconds until the next token otherwise.
+    """
+
+    tokens = min(float(burst), tokens + max(now - updated, 0.0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+
+    return tokens, (1 - tokens) / rate
+
+
+class Buckets(Protocol):
+    def take(self, key: bytes, rate: float, burst: int, now: float) -> float:
+        ...
+
+
+@dataclass
+class MemoryBuckets:
+    """
+    Buckets of the process, the least recently used are dropped past `max_keys`.
+    """
+
+    max_keys: int = RATE_LIMIT_MAX_KEYS
+
+    # key -> [tokens, updated]
+    _buckets: OrderedDict[bytes, list[float]] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+
+    def take(self, key: bytes, rate: float, burst: int, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        bucket[0], wait = take_token(bucket[0], bucket[1], rate, burst, now)
+        bucket[1] = now
+        return wait
+
+
+# key hash, tokens, updated
+SLOT = struct.Struct('<Qdd')
+GROUP_SLOTS = 8
+GROUP_SIZE = SLOT.size * GROUP_SLOTS
+
+
+@dataclass
+class SharedBuckets:
+    """
+    Buckets of all the workers of the host in a memory mapped file, so they enforce one budget.
+
+    A key hashes to a group of `GROUP_SLOTS` slots, locked with `fcntl.lockf` while its bucket
+    is updated; a new key takes the least recently updated slot of the group. Timestamps are
+    `time.monotonic()`, shared by the processes of the host.
+    """
+
+    path: str = RATE_LIMIT_SHARED_FILE
+    max_keys: int = RATE_LIMIT_MAX_KEYS
+
+    groups: int = field(init=False)
+    _fd: int = field(default=-1, init=False, repr=False)
+    _mmap: Optional[mmap.mmap] = field(default=None, init=False, repr=False)
+    _pid: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        self.groups = max(1, math.ceil(self.max_keys / GROUP_SLOTS))
+
+    def open(self) -> mmap.mmap:
+        # after a fork, the child maps the file itself
+        if self._mmap is None or self._pid != os.getpid():
+            size = self.groups * GROUP_SIZE
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._mmap = mmap.mmap(self._fd, size)
+            self._pid = os.getpid()
+
+        return self._mmap
+
+    def take(self, key: bytes, rate: float, burst: int, now: float) -> float:
+        buffer = self.open()
+        hashed = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+        start = (hashed % self.groups) * GROUP_SIZE
+
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, GROUP_SIZE, start)
+        try:
+            # an empty slot was never updated, it is taken first
+            free, oldest = start, math.inf
+            for offset in range(start, start + GROUP_SIZE, SLOT.size):
+                slot_hash, tokens, updated = SLOT.unpack_from(buffer, offset)
+                if slot_hash == hashed:
+                    break
+                if updated < oldest:
+                    free, oldest = offset, updated
+            else:
+                offset, tokens, updated = free, float(burst), now
+
+            tokens, wait = take_token(tokens, updated, rate, burst, now)
+            SLOT.pack_into(buffer, offset, hashed, tokens, now)
+            return wait
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, GROUP_SIZE, start)
+
+
+@dataclass
+class RateLimiter:
+    """
+    Token buckets per client and rule, checked by `GatewayMiddleware` before the request body is
+    read. The client is the bearer subject once its token was verified, see
+    `core.fastapi.auth.TokenVerifier`, the IP otherwise. Behind `trusted_proxies` proxies, the
+    IP is the entry of X-Forwarded-For the outermost of them appended, the entries before it
+    are sent by the client and could be forged.
+
+    A rejected client is also rejected locally until its next token, without reading the buckets.
+    """
+
+    rules: dict[str, str] = field(default_factory=lambda: dict(RATE_LIMIT_RULES))
+    buckets: Buckets = field(
+        default_factory=lambda: (
+            SharedBuckets() if RATE_LIMIT_SHARED_FILE is not None else MemoryBuckets()
+        )
+    )
+    subject: Optional[Callable[[str], Optional[str]]] = token_verifier.cached_subject
+    trusted_proxies: int = RATE_LIMIT_TRUSTED_PROXIES
+
+    _paths: dict[str, RateLimitRule] = field(default_factory=dict, init=False, repr=False)
+    _prefixes: list[RateLimitRule] = field(default_factory=list, init=False, repr=False)
+    # key -> rejected until
+    _rejected: dict[bytes, float] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        for path, value in self.rules.items():
+            if path.endswith('/*'):
+                self._prefixes.append(RateLimitRule.parse(path[:-1], value))
+            else:
+                self._paths[path] = RateLimitRule.parse(path, value)
+        # the longest prefix wins
+        self._prefixes.sort(key=lambda rule: len(rule.path), reverse=True)
+
+    def __bool__(self) -> bool:
+        return bool(self._paths or self._prefixes)
+
+    def rule(self, path: str) -> Optional[RateLimitRule]:
+        rule = self._paths.get(path)
+        if rule is not None:
+            return rule
+
+        for rule in self._prefixes:
+            if path.startswith(rule.path):
+                return rule
+
+        return None
+
+    def client(
+        self, scope: Scope, authorization: Optional[str], forwarded_for: Optional[str] = None
+    ) -> str:
+        if authorization is not None and self.subject is not None:
+            scheme, _, token = authorization.partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                subject = self.subject(token)
+                if subject is not None:
+                    return f'sub:{subject}'
+
+        if forwarded_for is not None and self.trusted_proxies > 0:
+            addresses = forwarded_for.split(',')
+            # fewer entries than proxies, the request skipped the outer ones
+            address = addresses[-min(self.trusted_proxies, len(addresses))].strip()
+            if address:
+                return f'ip:{address}'
+
+        client = scope.get('client')
+        return f'ip:{client[0]}' if client else 'ip:'
+
+    def check(
+        self, scope: Scope, authorization: Optional[str], forwarded_for: Optional[str] = None
+    ) -> float:
+        """
+        0 when the request is allowed, the seconds until it would be otherwise
+        """
+
+        rule = self.rule(scope['path'])
+        if rule is None:
+            return 0.0
+
+        key = f'{rule.path}|{self.client(scope, authorization, forwarded_for)}'.encode()
+        now = time.monotonic()
+        rejected_until = self._rejected.get(key)
+        if rejected_until is not None:
+            if now < rejected_until:
+                LIMITED_REQUESTS.labels(rule.path).inc()
+                return rejected_until - now
+            del self._rejected[key]
+
+        wait = self.buckets.take(key, rule.rate, rule.burst, now)
+        if wait:
+            LIMITED_REQUESTS.labels(rule.path).inc()
+            if len(self._rejected) >= RATE_LIMIT_MAX_KEYS:
+                self._rejected.clear()
+            self._rejected[key] = now + wait
+
+        return wait
+
+    @staticmethod
+    async def reject(send: Send, wait: float) -> None:
+        """
+        The 429 of `TooManyRequestsException`, sent without going through the exception handlers.
+        """
+
+        TOO_MANY_REQUESTS_ERRORS.inc()
+        await send(
+            {
+                'type': 'http.response.start',
+                'status': TooManyRequestsException.http_status,
+                'headers': [
+                    (b'content-length', str(len(TOO_MANY_REQUESTS_CONTENT)).encode('latin-1')),
+                    (b'content-type', b'application/json'),
+                    (b'retry-after', str(math.ceil(wait)).encode('latin-1')),
+                ],
+            }
+        )
+        await send({'type': 'http.response.body', 'body': TOO_MANY_REQUESTS_CONTENT})
+
+
+rate_limiter = RateLimiter()
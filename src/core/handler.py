@@ -1,9 +1,11 @@
-from typing import Union
+from typing import Any, Union
 
+import orjson
 from fastapi import Request, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import HTTPException as FastAPIHTTPException
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from core.pydantic.field import Int32
@@ -12,6 +14,7 @@ from core.pydantic.model import BaseModel
 from .enum import ErrorCode
 from .exception import BaseException_
 from .fastapi.exception import FastAPIError
+from .metrics import metrics
 
 
 class ExceptionResponseContent(BaseModel):
@@ -20,13 +23,37 @@ class ExceptionResponseContent(BaseModel):
     data: Union[dict, list, None]
 
 
+def exception_content(message: Any, code: int, data: Union[dict, list, None] = None) -> dict:
+    """
+    Same shape as `ExceptionResponseContent`, built without model validation for the hot error path,
+    `data` such as models or datetimes is still encoded by `jsonable_encoder`
+    """
+
+    return {
+        'message': str(message),
+        'code': int(code),
+        'data': jsonable_encoder(data) if data else data,
+    }
+
+
+HTTP_ERRORS = metrics.counter('http_errors_total', 'Error responses by error code', ('code',))
+
+
+# pre-serialised bodies of the fixed-message errors
+BASE_EXCEPTION_CONTENT = orjson.dumps(  # pylint:disable=no-member
+    exception_content(BaseException_.message, BaseException_.code)
+)
+NOT_IMPLEMENTED_CONTENT = orjson.dumps(  # pylint:disable=no-member
+    exception_content('Not Implemented', ErrorCode.GENERAL_NOT_IMPLEMENTED)
+)
+
+
 async def base_exception_handler(_: Request, exp: Union[Exception, None]):
-    return JSONResponse(
+    HTTP_ERRORS.labels(str(BaseException_.code)).inc()
+    return Response(
+        content=BASE_EXCEPTION_CONTENT,
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content=ExceptionResponseContent(
-            message=BaseException_.message,
-            code=BaseException_.code,
-        ).dict(),
+        media_type=ORJSONResponse.media_type,
     )
 
 
@@ -34,43 +61,36 @@ async def http_exception_handler(
     _: Request,
     exp: Union[FastAPIHTTPException, StarletteHTTPException],
 ):
-    return JSONResponse(
+    HTTP_ERRORS.labels(str(ErrorCode.GENERAL_HTTP_SERVICE_ERROR)).inc()
+    return ORJSONResponse(
         status_code=exp.status_code,
-        content=ExceptionResponseContent(
-            message=exp.detail,
-            code=ErrorCode.GENERAL_HTTP_SERVICE_ERROR,
-        ).dict(),
+        content=exception_content(exp.detail, ErrorCode.GENERAL_HTTP_SERVICE_ERROR),
     )
 
 
 async def request_validation_exception_handler(_: Request, exp: RequestValidationError):
-    return JSONResponse(
+    HTTP_ERRORS.labels(str(ErrorCode.GENERAL_REQUEST_VALIDATION_FAILED)).inc()
+    return ORJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-        content=ExceptionResponseContent(
-            message=str(exp),
-            code=ErrorCode.GENERAL_REQUEST_VALIDATION_FAILED,
-        ).dict(),
+        content=exception_content(exp, ErrorCode.GENERAL_REQUEST_VALIDATION_FAILED),
     )
 
 
 async def not_implemented_exception_handler(_: Request, exp: NotImplementedError):
-    return JSONResponse(
+    HTTP_ERRORS.labels(str(ErrorCode.GENERAL_NOT_IMPLEMENTED)).inc()
+    return Response(
+        content=NOT_IMPLEMENTED_CONTENT,
         status_code=status.HTTP_501_NOT_IMPLEMENTED,
-        content=ExceptionResponseContent(
-            message='Not Implemented',
-            code=ErrorCode.GENERAL_NOT_IMPLEMENTED,
-        ).dict(),
+        media_type=ORJSONResponse.media_type,
     )
 
 
 async def fastapi_exception_handler(_: Request, exp: FastAPIError):
-    return JSONResponse(
+    HTTP_ERRORS.labels(str(int(exp.code))).inc()
+    return ORJSONResponse(
         status_code=exp.http_status,
-        content=ExceptionResponseContent(
-            message=exp.message,
-            code=exp.code,
-            data=exp.data,
-        ).dict(),
+        content=exception_content(exp.message, exp.code, exp.data),
+        headers=exp.headers,
     )
 
 
@@ -0,0 +1,167 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from settings import (
+    CIRCUIT_BREAKER_FAILURE_RATE,
+    CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+    CIRCUIT_BREAKER_MINIMUM_CALLS,
+    CIRCUIT_BREAKER_OPEN_SECONDS,
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+    CIRCUIT_BREAKER_WINDOW_SECONDS,
+    UPSTREAM_MAX_CONCURRENCY,
+)
+
+from ..enum import StrEnum
+
+
+class CircuitState(StrEnum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker with a concurrency bulkhead.
+
+    - closed: calls pass, failures (5xx, connection errors, calls slower than `slow_call_seconds`)
+      are counted in a rolling window of one-second buckets; the circuit opens once at least
+      `minimum_calls` were made and the failure rate reaches `failure_rate`.
+    - open: calls are rejected until `open_seconds` elapsed.
+    - half_open: up to `half_open_calls` trial calls pass, a failure re-opens the circuit and
+      `half_open_calls` successes close it.
+
+    Independently, at most `max_concurrency` calls may be in flight.
+    """
+
+    name: str
+    failure_rate: float = CIRCUIT_BREAKER_FAILURE_RATE
+    slow_call_seconds: float = CIRCUIT_BREAKER_SLOW_CALL_SECONDS
+    minimum_calls: int = CIRCUIT_BREAKER_MINIMUM_CALLS
+    window_seconds: int = CIRCUIT_BREAKER_WINDOW_SECONDS
+    open_seconds: float = CIRCUIT_BREAKER_OPEN_SECONDS
+    half_open_calls: int = CIRCUIT_BREAKER_HALF_OPEN_CALLS
+    max_concurrency: int = UPSTREAM_MAX_CONCURRENCY
+
+    state: CircuitState = field(default=CircuitState.CLOSED, init=False)
+    opened_at: float = field(default=0.0, init=False)
+    in_flight: int = field(default=0, init=False)
+    rejected: int = field(default=0, init=False)
+    _trials: int = field(default=0, init=False, repr=False)
+    _trial_successes: int = field(default=0, init=False, repr=False)
+    # [second, calls, failures] per bucket
+    _buckets: list[list[int]] = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self):
+        self._buckets = [[0, 0, 0] for _ in range(self.window_seconds)]
+
+    def acquire(self) -> bool:
+        if self.state is CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._transition(CircuitState.HALF_OPEN)
+
+        half_open = self.state is CircuitState.HALF_OPEN
+        if (half_open and self._trials >= self.half_open_calls) or (
+            self.in_flight >= self.max_concurrency
+        ):
+            self.rejected += 1
+            return False
+
+        if half_open:
+            self._trials += 1
+        self.in_flight += 1
+        return True
+
+    def release(self, failed: bool, elapsed: float) -> None:
+        self.in_flight -= 1
+        failed = failed or elapsed >= self.slow_call_seconds
+
+        if self.state is CircuitState.HALF_OPEN:
+            if failed:
+                self._transition(CircuitState.OPEN)
+            else:
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self._transition(CircuitState.CLOSED)
+            return
+
+        if self.state is CircuitState.CLOSED:
+            calls, failures = self._record(failed)
+            if calls >= self.minimum_calls and failures / calls >= self.failure_rate:
+                self._transition(CircuitState.OPEN)
+
+    def abandon(self) -> None:
+        """
+        Release a call whose outcome is unknown, e.g. cancelled by its caller, without counting
+        it. A trial call frees its slot for another one.
+        """
+
+        self.in_flight -= 1
+        if self.state is CircuitState.HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def snapshot(self) -> dict:
+        calls, failures = self._count(int(time.monotonic()))
+        return {
+            'state': self.state.value,
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'calls': calls,
+            'failures': failures,
+            'rejected': self.rejected,
+        }
+
+    def _record(self, failed: bool) -> tuple[int, int]:
+        now = int(time.monotonic())
+        bucket = self._buckets[now % self.window_seconds]
+        if bucket[0] != now:
+            bucket[:] = [now, 0, 0]
+        bucket[1] += 1
+        bucket[2] += failed
+
+        return self._count(now)
+
+    def _count(self, now: int) -> tuple[int, int]:
+        calls = failures = 0
+        for second, bucket_calls, bucket_failures in self._buckets:
+            if now - second < self.window_seconds:
+                calls += bucket_calls
+                failures += bucket_failures
+
+        return calls, failures
+
+    def _transition(self, state: CircuitState) -> None:
+        self.state = state
+        self._trials = self._trial_successes = 0
+        if state is CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        elif state is CircuitState.CLOSED:
+            for bucket in self._buckets:
+                bucket[:] = [0, 0, 0]
+
+
+class CircuitBreakerRegistry:
+    def __init__(self):
+        self._options: dict[str, dict] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def configure(self, name: str, **options) -> None:
+        self._options[name] = options
+        self._breakers.pop(name, None)
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker: Optional[CircuitBreaker] = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name, **self._options.get(name, {}))
+
+        return breaker
+
+    def snapshot(self) -> dict[str, dict]:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
+
+
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,413 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
+
+from httpx import AsyncBaseTransport, AsyncByteStream, ByteStream, Request, Response
+
+from settings import (
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    RESPONSE_CACHE_VARY_HEADERS,
+)
+
+from ..fastapi import FastAPILogger
+from ..metrics import metrics
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+CACHEABLE_STATUS_CODES = (200, 203, 300, 301, 404, 410)
+
+RESPONSE_CACHE_EVENTS = metrics.counter(
+    'response_cache_events_total',
+    'Lookups (`hits`, `stale_hits`, `misses`), revalidations and evictions of the response cache',
+    ('event',),
+)
+
+
+def parse_cache_control(value: str) -> dict[str, Optional[str]]:
+    directives: dict[str, Optional[str]] = {}
+    for directive in value.split(','):
+        name, _, argument = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+
+    return directives
+
+
+def build_cache_key(
+    request: Request, vary_headers: tuple[str, ...] = RESPONSE_CACHE_VARY_HEADERS
+) -> tuple:
+    """
+    Key on method, URL, the configured vary headers and the caller identity, i.e. the bearer token
+    taken by `core.fastapi.security.HTTPBearer` and forwarded as the upstream `Authorization`
+    header and the session cookies, hashed so they are never kept in memory.
+    """
+
+    authorization = request.headers.get('authorization', '')
+    cookie = request.headers.get('cookie', '')
+    identity = (
+        hashlib.blake2b(f'{authorization}\n{cookie}'.encode(), digest_size=16).digest()
+        if authorization or cookie
+        else b''
+    )
+
+    return (
+        request.method,
+        str(request.url),
+        tuple(request.headers.get(header, '') for header in vary_headers),
+        identity,
+    )
+
+
+@dataclass
+class CacheEntry:
+    status_code: int
+    headers: list[tuple[bytes, bytes]]
+    content: bytes
+    fresh_until: float
+    stale_until: float
+    etag: Optional[str] = None
+    extensions: dict = field(default_factory=dict)
+    # content-coding -> compressed content, see `core.fastapi.compression`
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return (
+            len(self.content)
+            + sum(len(k) + len(v) for k, v in self.headers)
+            + sum(len(variant) for variant in self.variants.values())
+        )
+
+    def to_response(self, cached_body: Optional['CachedBody'] = None) -> Response:
+        extensions = self.extensions
+        if cached_body is not None:
+            extensions = {**extensions, 'cached_body': cached_body}
+
+        return Response(
+            self.status_code,
+            headers=self.headers,
+            stream=ByteStream(self.content),
+            extensions=extensions,
+        )
+
+
+class ResponseCache:
+    """
+    In-memory LRU bounded by the total size of the cached bodies and headers.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.size = 0
+        self._entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def count(self, event: str) -> None:
+        """
+        Count one of the events of `stats()`, also exposed as `response_cache_events_total`
+        """
+
+        setattr(self, event, getattr(self, event) + 1)
+        RESPONSE_CACHE_EVENTS.labels(event).inc()
+
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+
+        return entry
+
+    def set(self, key: tuple, entry: CacheEntry) -> None:
+        if entry.size > self.max_entry_bytes:
+            return
+
+        self.pop(key)
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            self.count('evictions')
+
+    def add_variant(self, key: tuple, entry: CacheEntry, encoding: str, content: bytes) -> None:
+        # the entry may have been evicted or replaced since it was read
+        if self._entries.get(key) is not entry or entry.size + len(content) > self.max_entry_bytes:
+            return
+
+        self.size += len(content) - len(entry.variants.get(encoding, b''))
+        entry.variants[encoding] = content
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            self.count('evictions')
+
+    def pop(self, key: tuple) -> Optional[CacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+        }
+
+
+@dataclass
+class CachedBody:
+    """
+    Handle on the body of a cached response, set as its `cached_body` extension so the
+    compressed variants of the body are cached along with it.
+    """
+
+    cache: ResponseCache
+    key: tuple
+    entry: CacheEntry
+
+    def get_variant(self, encoding: str) -> Optional[bytes]:
+        return self.entry.variants.get(encoding)
+
+    def set_variant(self, encoding: str, content: bytes) -> None:
+        self.cache.add_variant(self.key, self.entry, encoding, content)
+
+
+class CachingStream(AsyncByteStream):
+    """
+    Tee the upstream body into the cache while the caller consumes it, so cacheable responses are
+    never buffered up front. Bodies larger than the entry cap are simply not stored.
+    """
+
+    def __init__(self, stream: AsyncByteStream, limit: int, on_complete):
+        self._stream = stream
+        self._limit = limit
+        self._on_complete = on_complete
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        chunks: Optional[list[bytes]] = []
+        size = 0
+        async for chunk in self._stream:
+            if chunks is not None:
+                size += len(chunk)
+                if size > self._limit:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+
+        if chunks is not None:
+            self._on_complete(b''.join(chunks))
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class CacheTransport(AsyncBaseTransport):
+    """
+    Opt-in response cache in front of an upstream transport, honouring `Cache-Control`
+    (`no-store`, `private`, `no-cache`, `max-age`, `s-maxage`, `stale-while-revalidate`),
+    `Expires` and `ETag` revalidation.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        cache: Optional[ResponseCache] = None,
+        vary_headers: tuple[str, ...] = RESPONSE_CACHE_VARY_HEADERS,
+    ):
+        self._transport = transport
+        self.cache = cache if cache is not None else response_cache
+        self.vary_headers = vary_headers
+        self._revalidating: dict[tuple, asyncio.Task] = {}
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.method not in CACHEABLE_METHODS:
+            return await self._transport.handle_async_request(request)
+
+        request_directives = parse_cache_control(request.headers.get('cache-control', ''))
+        if 'no-store' in request_directives:
+            return await self._transport.handle_async_request(request)
+
+        key = build_cache_key(request, self.vary_headers)
+        entry = self.cache.get(key)
+        now = time.monotonic()
+        if entry is not None and 'no-cache' not in request_directives:
+            if now < entry.fresh_until:
+                self.cache.count('hits')
+                return entry.to_response(CachedBody(self.cache, key, entry))
+            if now < entry.stale_until:
+                self.cache.count('stale_hits')
+                if key not in self._revalidating:
+                    self._revalidating[key] = asyncio.create_task(
+                        self._revalidate(request, key, entry)
+                    )
+                return entry.to_response(CachedBody(self.cache, key, entry))
+
+        self.cache.count('misses')
+        return await self._fetch(request, key, entry)
+
+    async def aclose(self) -> None:
+        for task in self._revalidating.values():
+            task.cancel()
+        await self._transport.aclose()
+
+    async def _fetch(self, request: Request, key: tuple, entry: Optional[CacheEntry]) -> Response:
+        if entry is not None and entry.etag:
+            # the caller's request is left as is, it may be retried or logged
+            headers = request.headers.copy()
+            headers['If-None-Match'] = entry.etag
+            request = Request(
+                request.method,
+                request.url,
+                headers=headers,
+                stream=request.stream,
+                extensions=request.extensions,
+            )
+
+        response = await self._transport.handle_async_request(request)
+        if entry is not None and response.status_code == 304:
+            await response.aclose()
+            self.cache.count('revalidations')
+            self._refresh(key, entry, response)
+            return entry.to_response(CachedBody(self.cache, key, entry))
+
+        if not self._is_storable(response):
+            return response
+
+        return Response(
+            response.status_code,
+            headers=response.headers.raw,
+            stream=CachingStream(
+                response.stream,
+                limit=self.cache.max_entry_bytes,
+                on_complete=lambda content: self._store(key, response, content),
+            ),
+            extensions=response.extensions,
+        )
+
+    async def _revalidate(self, request: Request, key: tuple, entry: CacheEntry) -> None:
+        try:
+            response = await self._fetch(request, key, entry)
+            await response.aread()
+            await response.aclose()
+        except Exception as e:
+            FastAPILogger.warning(f'Revalidating cached response of {request.url} failed, {e}')
+        finally:
+            self._revalidating.pop(key, None)
+
+    def _is_storable(self, response: Response) -> bool:
+        if response.status_code not in CACHEABLE_STATUS_CODES:
+            return False
+
+        directives = parse_cache_control(response.headers.get('cache-control', ''))
+        if 'no-store' in directives or 'private' in directives:
+            return False
+        vary = {
+            header.strip().lower()
+            for header in response.headers.get('vary', '').split(',')
+            if header.strip()
+        }
+        if not vary <= set(self.vary_headers):
+            return False
+        content_length = response.headers.get('content-length')
+        try:
+            if content_length and int(content_length) > self.cache.max_entry_bytes:
+                return False
+        except ValueError:
+            return False
+
+        return self._get_lifetime(response) is not None
+
+    def _store(self, key: tuple, response: Response, content: bytes) -> None:
+        lifetime, stale = self._get_lifetime(response)
+        now = time.monotonic()
+        self.cache.set(
+            key,
+            CacheEntry(
+                status_code=response.status_code,
+                headers=response.headers.raw,
+                content=content,
+                fresh_until=now + lifetime,
+                stale_until=now + lifetime + stale,
+                etag=response.headers.get('etag'),
+                extensions={k: v for k, v in response.extensions.items() if k == 'http_version'},
+            ),
+        )
+
+    def _refresh(self, key: tuple, entry: CacheEntry, response: Response) -> None:
+        lifetime, stale = self._get_lifetime(response) or (0, 0)
+        now = time.monotonic()
+        entry.fresh_until = now + lifetime
+        entry.stale_until = now + lifetime + stale
+        self.cache.set(key, entry)
+
+    @staticmethod
+    def _get_lifetime(response: Response) -> Optional[tuple[float, float]]:
+        """
+        Return `(fresh seconds, stale-while-revalidate seconds)`, or `None` if the response does
+        not allow caching or its headers are malformed. `no-cache` responses are stored but
+        revalidated on every use.
+        """
+
+        directives = parse_cache_control(response.headers.get('cache-control', ''))
+        try:
+            stale = float(directives.get('stale-while-revalidate') or 0)
+        except ValueError:
+            return None
+        if 'no-cache' in directives:
+            return (0, 0) if response.headers.get('etag') else None
+
+        max_age = directives.get('s-maxage') or directives.get('max-age')
+        if max_age is not None:
+            try:
+                return max(float(max_age) - float(response.headers.get('age', 0)), 0), stale
+            except ValueError:
+                return None
+
+        if 'expires' in response.headers:
+            try:
+                expires = parsedate_to_datetime(response.headers['expires']).timestamp()
+            except (TypeError, ValueError):
+                return None
+            return max(expires - time.time(), 0), stale
+
+        return None
+
+
+response_cache = ResponseCache()
+metrics.gauge(
+    'response_cache_entries',
+    'Responses in the response cache',
+    collect=lambda: {(): len(response_cache)},
+)
+metrics.gauge(
+    'response_cache_bytes',
+    'Size of the bodies and headers in the response cache',
+    collect=lambda: {(): response_cache.size},
+)
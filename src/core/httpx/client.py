@@ -1,19 +1,197 @@
+import importlib.util
+from dataclasses import dataclass, field
+from typing import Optional
+
 from asgi_correlation_id.context import correlation_id
-from httpx import AsyncClient, Limits
+from httpx import AsyncBaseTransport, AsyncClient, AsyncHTTPTransport, Limits, Request, Timeout
+
+from settings import (
+    TIMEOUT_SECONDS,
+    UPSTREAM_HTTP2,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    UPSTREAM_POOL_TIMEOUT_SECONDS,
+)
+
+from ..fastapi import FastAPILogger
+from ..metrics import metrics
+from .breaker import circuit_breakers
+from .cache import CacheTransport
+from .discovery import DiscoveryTransport, upstream_registry
+from .metrics import MetricsTransport, get_pool, pool_connections
+from .retry import HedgePolicy, RetryPolicy, RetryTransport
+from .singleflight import CoalescingTransport
+
+DEFAULT_SERVICE = 'default'
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+async def inject_request_id(request: Request) -> None:
+    """
+    Forward the correlation id of the current request, the hook runs in the caller's context.
+    """
+
+    request_id = correlation_id.get()
+    if request_id and 'X-Request-ID' not in request.headers:
+        request.headers['X-Request-ID'] = request_id
+
+
+@dataclass
+class UpstreamConfig:
+    base_url: str = ''
+    max_connections: int = UPSTREAM_MAX_CONNECTIONS
+    max_keepalive_connections: int = UPSTREAM_MAX_KEEPALIVE_CONNECTIONS
+    keepalive_expiry: float = TIMEOUT_SECONDS
+    timeout: float = TIMEOUT_SECONDS
+    # requests multiplexed on a few connections, the pool limits still apply
+    http2: bool = UPSTREAM_HTTP2
+    pool_timeout: float = UPSTREAM_POOL_TIMEOUT_SECONDS
+    cache: bool = False
+    coalesce: bool = False
+    retry: Optional[dict] = None
+    hedge: Optional[dict] = None
+    circuit_breaker: dict = field(default_factory=dict)
+
+    @property
+    def use_http2(self) -> bool:
+        return self.http2 and HTTP2_AVAILABLE
+
+    def build_transport(self, name: str = DEFAULT_SERVICE) -> AsyncBaseTransport:
+        if self.http2 and not HTTP2_AVAILABLE:
+            FastAPILogger.warning(f'HTTP/1.1 to upstream {name}, HTTP/2 needs `h2` installed')
+
+        transport: AsyncBaseTransport = AsyncHTTPTransport(
+            # no ALPN without TLS, `http://` upstreams are spoken HTTP/2 with prior knowledge
+            http1=not (self.use_http2 and self.base_url.startswith('http://')),
+            http2=self.use_http2,
+            limits=Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        transport = MetricsTransport(transport, upstream=name)
+        # under the retries, so a retried request may go to another endpoint
+        transport = DiscoveryTransport(transport, service=name)
+        if self.retry is not None or self.hedge is not None:
+            transport = RetryTransport(
+                transport,
+                policy=RetryPolicy(**self.retry) if self.retry is not None else None,
+                hedge=HedgePolicy(**self.hedge) if self.hedge is not None else None,
+            )
+        if self.coalesce:
+            transport = CoalescingTransport(transport)
+        if self.cache:
+            transport = CacheTransport(transport)
+
+        return transport
+
+    def build_client(self, name: str = DEFAULT_SERVICE) -> AsyncClient:
+        return AsyncClient(
+            base_url=self.base_url,
+            transport=self.build_transport(name),
+            timeout=Timeout(self.timeout, pool=self.pool_timeout or self.timeout),
+            event_hooks={'request': [inject_request_id]},
+        )
+
+
+class ClientRegistry:
+    """
+    Process-wide upstream clients, one connection pool per service.
+
+    Clients are opened on app startup (or lazily on first use) and closed on shutdown. Services
+    listed in `core.httpx.discovery.upstream_registry` need no registration.
+    """
 
-from settings import TIMEOUT_SECONDS
+    def __init__(self):
+        self._configs: dict[str, UpstreamConfig] = {DEFAULT_SERVICE: UpstreamConfig()}
+        self._clients: dict[str, AsyncClient] = {}
 
-ASYNC_SESSION_PARAMS = {
-    'limits': Limits(
-        max_connections=100,
-        max_keepalive_connections=20,
-        keepalive_expiry=TIMEOUT_SECONDS,
-    ),
-    'headers': {'X-Request-ID': str(correlation_id.get())},
-    'timeout': TIMEOUT_SECONDS,
-}
+    def register(self, name: str, config: Optional[UpstreamConfig] = None, **kwargs) -> None:
+        if name in self._clients:
+            raise RuntimeError(f'Upstream client {name} is already opened')
+
+        self._configs[name] = config = config or UpstreamConfig(**kwargs)
+        circuit_breakers.configure(name, **config.circuit_breaker)
+
+    def get(self, name: str = DEFAULT_SERVICE) -> AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            config = self._configs.get(name)
+            if config is None and upstream_registry.get(name) is not None:
+                # a service of the registry only, its endpoints replace the host of `base_url`
+                self.register(name, base_url=f'http://{name}')
+                config = self._configs[name]
+            if config is None:
+                raise KeyError(f'Upstream service {name} is not registered')
+            client = self._clients[name] = config.build_client(name)
+
+        return client
+
+    def pool_connections(self) -> dict[tuple[str, str], int]:
+        """
+        Connections of the opened pools by (service, state), e.x. `{('member', 'idle'): 3}`
+        """
+
+        connections = {}
+        for name, client in self._clients.items():
+            pool = None if client.is_closed else get_pool(client)
+            if pool is None:
+                continue
+            for state, count in pool_connections(pool).items():
+                connections[name, state] = count
+
+        return connections
+
+    def pools(self) -> dict[str, dict]:
+        """
+        Protocol, limits and connections of the opened pools, e.x.:
+            {'member': {'http2': True, 'max_connections': 100, 'active': 1, 'idle': 0, 'waiting': 0}}
+        """
+
+        pools = {}
+        for name, client in self._clients.items():
+            pool = None if client.is_closed else get_pool(client)
+            if pool is None:
+                continue
+            config = self._configs[name]
+            pools[name] = {
+                'http2': config.use_http2,
+                'max_connections': config.max_connections,
+                **pool_connections(pool),
+            }
+
+        return pools
+
+    async def startup(self) -> None:
+        for name in self._configs:
+            self.get(name)
+
+    async def shutdown(self) -> None:
+        opened, self._clients = self._clients, {}
+        for client in opened.values():
+            await client.aclose()
+
+
+clients = ClientRegistry()
+metrics.gauge(
+    'upstream_pool_connections',
+    'Connections of the upstream pools by state, `waiting` counts the requests queued for one',
+    ('upstream', 'state'),
+    collect=clients.pool_connections,
+)
 
 
 async def get_session():
-    async with AsyncClient(**ASYNC_SESSION_PARAMS) as client:
-        yield client
+    yield clients.get()
+
+
+def get_client(name: str = DEFAULT_SERVICE):
+    """
+    Dependency factory, e.x.: `client: AsyncClient = Depends(get_client('member'))`
+    """
+
+    async def dependency() -> AsyncClient:
+        return clients.get(name)
+
+    return dependency
@@ -1,24 +1,28 @@
+import asyncio
 import functools
+import time
 from json import JSONDecodeError
 from typing import Callable, Optional, Union
 
 from fastapi import status
-from httpx import HTTPError, Request, Response
+from httpx import HTTPError, Request, RequestNotRead, Response, ResponseNotRead
 
 from settings import IS_DEBUG, IS_LOCAL_ENV
 
 from ..fastapi import FastAPILogger
+from ..fastapi.logging import capture_policy
+from .breaker import circuit_breakers
 
 
 def get_headers(input_: Union[Request, Response]) -> dict:
-    return dict(input_.headers)
+    return capture_policy.headers(input_.headers.items())
 
 
 def get_body(input_: Union[Request, Response]) -> Optional[Union[dict, str]]:
-    body: dict[str, str] = {}
-    body['raw'] = str(input_.content)
-
-    return body
+    try:
+        return capture_policy.body(input_.content)
+    except (RequestNotRead, ResponseNotRead):  # streamed, e.g. proxied requests
+        return capture_policy.body(None)
 
 
 def http_error_handler(func: Callable):
@@ -28,10 +32,26 @@ def http_error_handler(func: Callable):
 
         # FIXME
         # assert inspect.isclass(class_ := args[0]), args[0]
+        breaker = circuit_breakers.get(class_.__service_name__)
+        if not breaker.acquire():
+            # open circuit or too many calls in flight, fail fast without touching the upstream
+            raise class_.__exception__(
+                f'{class_.__service_name__} service unavailable',
+                http_status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                data={},
+            )
+
+        failed = cancelled = False
+        started_at = time.perf_counter()
         try:
-            return await func(*args, **kwargs)
+            result = await func(*args, **kwargs)
+            # streamed responses, e.g. proxied ones, are returned without `raise_for_status`
+            if isinstance(result, Response):
+                failed = result.status_code // 100 == 5
+            return result
         except HTTPError as e:
             response = getattr(e, 'response', None)
+            failed = not response or response.status_code // 100 == 5
             extra = {
                 'request': {
                     'method': str(e.request.method),
@@ -48,7 +68,8 @@ def http_error_handler(func: Callable):
                 else {},
             }
             FastAPILogger.warning(
-                f'{func.__qualname__}.{type(e).__name__}: {response.text if response else str(e)}',
+                f'{func.__qualname__}.{type(e).__name__}: '
+                f'{response.text[: capture_policy.body_bytes] if response else str(e)}',
                 extra=extra,
             )
             if IS_DEBUG and IS_LOCAL_ENV:
@@ -71,5 +92,17 @@ def http_error_handler(func: Callable):
                     msg = response.text
 
             raise class_.__exception__(msg, http_status=http_status, data=extra_data)
+        except asyncio.CancelledError:
+            # the caller went away, nothing is known of the upstream
+            cancelled = True
+            raise
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if cancelled:
+                breaker.abandon()
+            else:
+                breaker.release(failed, time.perf_counter() - started_at)
 
     return wrapper
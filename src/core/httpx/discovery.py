@@ -0,0 +1,341 @@
+import asyncio
+import ipaddress
+import itertools
+import os
+import random
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Optional, Union
+
+import yaml
+from httpx import URL, AsyncBaseTransport, AsyncByteStream, ConnectError, Request, Response
+
+from settings import (
+    DNS_CACHE_SECONDS,
+    DNS_NEGATIVE_CACHE_SECONDS,
+    UPSTREAM_BALANCER,
+    UPSTREAM_REGISTRY_CHECK_SECONDS,
+    UPSTREAM_REGISTRY_FILE,
+)
+
+from ..fastapi import FastAPILogger
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+@dataclass
+class Resolver:
+    """
+    Cached `getaddrinfo`, addresses are kept for `ttl` seconds and failures for `negative_ttl`.
+    Concurrent lookups of a host share one query, and the last addresses are served while the
+    name server fails.
+    """
+
+    ttl: float = DNS_CACHE_SECONDS
+    negative_ttl: float = DNS_NEGATIVE_CACHE_SECONDS
+
+    # (host, port) -> (addresses or the lookup error, expires at)
+    _entries: dict[tuple[str, int], tuple[Union[list[str], OSError], float]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _lookups: dict[tuple[str, int], asyncio.Future] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    async def resolve(self, host: str, port: int) -> list[str]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            if isinstance(entry[0], OSError):
+                raise entry[0]
+            return entry[0]
+
+        lookup = self._lookups.get(key)
+        if lookup is None:
+            lookup = self._lookups[key] = asyncio.ensure_future(self._lookup(key))
+            lookup.add_done_callback(lambda _: self._lookups.pop(key, None))
+
+        # a cancelled caller does not cancel the lookup of the others
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, key: tuple[str, int]) -> list[str]:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(*key, type=socket.SOCK_STREAM)
+        except OSError as e:
+            previous = self._entries.get(key)
+            if previous is not None and not isinstance(previous[0], OSError):
+                FastAPILogger.warning(f'Resolving {key[0]} failed, {e!r}, using the last addresses')
+                self._entries[key] = (previous[0], time.monotonic() + self.negative_ttl)
+                return previous[0]
+            self._entries[key] = (e, time.monotonic() + self.negative_ttl)
+            raise
+
+        # the addresses of the preferred family, the connections are not retried on the other one
+        family = infos[0][0]
+        addresses = list(dict.fromkeys(info[4][0] for info in infos if info[0] == family))
+        self._entries[key] = (addresses, time.monotonic() + self.ttl)
+        return addresses
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+@dataclass(eq=False)
+class Endpoint:
+    url: str
+    scheme: str = field(init=False)
+    host: str = field(init=False)
+    port: int = field(init=False)
+    netloc: str = field(init=False)
+    # the host is resolved by `Resolver`, except for IP addresses and HTTPS, whose certificate is
+    # verified against the host name
+    resolve: bool = field(init=False)
+    outstanding: int = field(default=0, init=False)
+    _addresses: itertools.count = field(default_factory=itertools.count, init=False, repr=False)
+
+    def __post_init__(self):
+        url = URL(self.url)
+        if url.scheme not in ('http', 'https') or not url.host:
+            raise ValueError(f'Invalid upstream endpoint {self.url}')
+
+        self.scheme = url.scheme
+        self.host = url.host
+        self.port = url.port or DEFAULT_PORTS[url.scheme]
+        self.netloc = url.netloc.decode('ascii')
+        try:
+            ipaddress.ip_address(self.host)
+            self.resolve = False
+        except ValueError:
+            self.resolve = self.scheme == 'http'
+
+    def pick_address(self, addresses: list[str]) -> str:
+        return addresses[next(self._addresses) % len(addresses)]
+
+    def release(self) -> None:
+        self.outstanding -= 1
+
+
+class RoundRobinBalancer:
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, endpoints: list[Endpoint]) -> Endpoint:
+        return endpoints[next(self._counter) % len(endpoints)]
+
+
+class LeastOutstandingBalancer(RoundRobinBalancer):
+    """
+    The endpoint with the fewest requests in flight, ties are broken round-robin.
+    """
+
+    def choose(self, endpoints: list[Endpoint]) -> Endpoint:
+        start = next(self._counter) % len(endpoints)
+        return min(endpoints[start:] + endpoints[:start], key=lambda endpoint: endpoint.outstanding)
+
+
+class PowerOfTwoChoicesBalancer:
+    """
+    The one of two random endpoints with fewer requests in flight, nearly as good as the least
+    outstanding one without herding every worker to the same endpoint.
+    """
+
+    def choose(self, endpoints: list[Endpoint]) -> Endpoint:
+        if len(endpoints) == 1:
+            return endpoints[0]
+
+        first, second = random.sample(endpoints, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+
+BALANCERS = {
+    'round_robin': RoundRobinBalancer,
+    'least_outstanding': LeastOutstandingBalancer,
+    'p2c': PowerOfTwoChoicesBalancer,
+}
+
+
+@dataclass
+class Service:
+    name: str
+    endpoints: list[Endpoint]
+    balancer: str = UPSTREAM_BALANCER
+
+    _balancer: Union[RoundRobinBalancer, PowerOfTwoChoicesBalancer] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.balancer not in BALANCERS:
+            raise ValueError(f'Unknown balancer {self.balancer} of upstream service {self.name}')
+        self._balancer = BALANCERS[self.balancer]()
+
+    def choose(self) -> Endpoint:
+        return self._balancer.choose(self.endpoints)
+
+
+@dataclass
+class UpstreamRegistry:
+    """
+    Endpoints of the upstream services from a YAML file, see `configs/upstream_registry.yaml`,
+    reloaded once its mtime changes. The endpoints kept across reloads keep their requests in
+    flight, so the balancing is not reset.
+    """
+
+    path: str = UPSTREAM_REGISTRY_FILE
+    check_seconds: float = UPSTREAM_REGISTRY_CHECK_SECONDS
+
+    services: dict[str, Service] = field(default_factory=dict, init=False)
+    mtime: Optional[float] = field(default=None, init=False)
+    loaded: bool = field(default=False, init=False)
+    _watcher: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    def get(self, name: str) -> Optional[Service]:
+        if not self.loaded:
+            self.reload_if_changed()
+
+        return self.services.get(name)
+
+    def reload_if_changed(self) -> None:
+        self.loaded = True
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return
+
+        try:
+            self.services = self.load() if mtime is not None else {}
+        except Exception as e:  # pylint:disable=broad-except
+            # the services loaded before are kept
+            FastAPILogger.error(f'Loading the upstream registry {self.path} failed, {e!r}')
+        self.mtime = mtime
+
+    def load(self) -> dict[str, Service]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            config = yaml.load(f, Loader=yaml.FullLoader) or {}
+
+        endpoints = {
+            endpoint.url: endpoint
+            for service in self.services.values()
+            for endpoint in service.endpoints
+        }
+        services = {}
+        for name, options in (config.get('services') or {}).items():
+            options = options or {}
+            services[name] = Service(
+                name,
+                [endpoints.get(url) or Endpoint(url) for url in options.get('endpoints') or []],
+                balancer=options.get('balancer') or UPSTREAM_BALANCER,
+            )
+
+        return services
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            name: {
+                'balancer': service.balancer,
+                'endpoints': {endpoint.url: endpoint.outstanding for endpoint in service.endpoints},
+            }
+            for name, service in self.services.items()
+        }
+
+    async def startup(self) -> None:
+        self.reload_if_changed()
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def shutdown(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_seconds)
+            self.reload_if_changed()
+
+
+class ReleasingStream(AsyncByteStream):
+    """
+    Release the endpoint once the response is closed, streamed bodies count as in flight.
+    """
+
+    def __init__(self, stream: AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class DiscoveryTransport(AsyncBaseTransport):
+    """
+    Send the requests of `service` to the endpoints of the registry chosen by its balancer, the
+    upstream `base_url` is used as is while the service has no endpoints. Plain HTTP endpoints
+    are connected to the addresses of `Resolver`, the `Host` header keeps their name.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        service: str,
+        registry: Optional[UpstreamRegistry] = None,
+        resolver: Optional[Resolver] = None,
+    ):
+        self._transport = transport
+        self.service = service
+        self.registry = registry if registry is not None else upstream_registry
+        self.resolver = resolver if resolver is not None else dns_resolver
+
+    async def handle_async_request(self, request: Request) -> Response:
+        service = self.registry.get(self.service)
+        if service is None or not service.endpoints:
+            return await self._transport.handle_async_request(request)
+
+        endpoint = service.choose()
+        host = endpoint.host
+        if endpoint.resolve:
+            try:
+                host = endpoint.pick_address(await self.resolver.resolve(host, endpoint.port))
+            except OSError as e:
+                raise ConnectError(f'Resolving {host} failed, {e!r}', request=request) from e
+
+        headers = request.headers.copy()
+        headers['Host'] = endpoint.netloc
+        request = Request(
+            request.method,
+            request.url.copy_with(scheme=endpoint.scheme, host=host, port=endpoint.port),
+            headers=headers,
+            stream=request.stream,
+            extensions=dict(request.extensions),
+        )
+
+        endpoint.outstanding += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            endpoint.release()
+            raise
+
+        return Response(
+            response.status_code,
+            headers=response.headers,
+            stream=ReleasingStream(response.stream, endpoint.release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+dns_resolver = Resolver()
+upstream_registry = UpstreamRegistry()
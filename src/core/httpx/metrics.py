@@ -0,0 +1,108 @@
+import time
+from typing import Optional
+
+from httpcore import AsyncConnectionPool
+from httpx import AsyncBaseTransport, AsyncClient, AsyncHTTPTransport, Request, Response
+
+from ..metrics import metrics
+
+UPSTREAM_REQUESTS = metrics.counter(
+    'upstream_requests_total',
+    'Requests sent to upstream services, status is `error` when no response was received',
+    ('upstream', 'method', 'status'),
+)
+UPSTREAM_REQUEST_DURATION = metrics.histogram(
+    'upstream_request_duration_seconds',
+    'Latency of upstream services until the response headers',
+    ('upstream',),
+)
+UPSTREAM_REQUESTS_IN_FLIGHT = metrics.gauge(
+    'upstream_requests_in_flight', 'Requests waiting for upstream response headers', ('upstream',)
+)
+UPSTREAM_POOL_ACQUIRE_DURATION = metrics.histogram(
+    'upstream_pool_acquire_seconds',
+    'Time requests waited for a connection of the upstream pool',
+    ('upstream',),
+)
+UPSTREAM_CONNECTIONS_OPENED = metrics.counter(
+    'upstream_connections_opened_total', 'Connections opened to upstream services', ('upstream',)
+)
+
+
+class MetricsTransport(AsyncBaseTransport):
+    """
+    Count and time the requests of an upstream, wraps the connection pool transport so retries
+    and hedged requests are counted one by one.
+
+    The time until the first event of the httpcore `trace` extension is the time the pool took to
+    assign the request a connection, new connections start with `connection.connect_tcp`.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport, upstream: str):
+        self._transport = transport
+        self.upstream = upstream
+        self._in_flight = UPSTREAM_REQUESTS_IN_FLIGHT.labels(upstream)
+        self._duration = UPSTREAM_REQUEST_DURATION.labels(upstream)
+        self._acquire_duration = UPSTREAM_POOL_ACQUIRE_DURATION.labels(upstream)
+        self._connections_opened = UPSTREAM_CONNECTIONS_OPENED.labels(upstream)
+
+    async def handle_async_request(self, request: Request) -> Response:
+        status = 'error'
+        self._in_flight.inc()
+        start = time.perf_counter()
+        acquired = False
+        previous_trace = request.extensions.get('trace')
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal acquired
+            if not acquired:
+                acquired = True
+                self._acquire_duration.observe(time.perf_counter() - start)
+            if event == 'connection.connect_tcp.started':
+                self._connections_opened.inc()
+            if previous_trace is not None:
+                await previous_trace(event, info)
+
+        request.extensions['trace'] = trace
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            self._duration.observe(time.perf_counter() - start)
+            self._in_flight.dec()
+            UPSTREAM_REQUESTS.labels(self.upstream, request.method, status).inc()
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def get_pool(client: AsyncClient) -> Optional[AsyncConnectionPool]:
+    """
+    The httpcore connection pool under the transports wrapping it
+    """
+
+    transport = client._transport  # pylint:disable=protected-access
+    while not isinstance(transport, AsyncHTTPTransport):
+        transport = getattr(transport, '_transport', None)
+        if transport is None:
+            return None
+
+    return transport._pool  # pylint:disable=protected-access
+
+
+def pool_connections(pool: AsyncConnectionPool) -> dict[str, int]:
+    active = idle = 0
+    for connection in pool.connections:
+        if connection.is_idle():
+            idle += 1
+        else:
+            active += 1
+    # requests queued until a connection is available
+    waiting = sum(
+        1
+        for request in pool._requests  # pylint:disable=protected-access
+        if request.connection is None
+    )
+
+    return {'active': active, 'idle': idle, 'waiting': waiting}
@@ -0,0 +1,199 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from httpx import AsyncBaseTransport, ByteStream, Request, Response, TransportError
+
+from settings import RETRY_BUDGET_RATIO, RETRY_MAX_ATTEMPTS
+
+from ..fastapi import FastAPILogger
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    backoff_seconds: float = 0.05
+    max_backoff_seconds: float = 1.0
+    status_codes: frozenset[int] = frozenset((502, 503, 504))
+    methods: frozenset[str] = IDEMPOTENT_METHODS
+
+    def __post_init__(self):
+        self.status_codes = frozenset(self.status_codes)
+        self.methods = frozenset(method.upper() for method in self.methods)
+
+    def backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt))
+
+
+@dataclass
+class HedgePolicy:
+    """
+    Fire a second request once the first one is slower than the `percentile` latency observed
+    so far (`delay_seconds` until `min_samples` were collected), the first response wins.
+    """
+
+    percentile: float = 0.95
+    delay_seconds: float = 0.1
+    min_delay_seconds: float = 0.005
+    min_samples: int = 100
+    sample_size: int = 1000
+
+
+class RetryBudget:
+    """
+    Every request deposits `ratio` token, every retry or hedge withdraws one, so the extra load
+    stays within `ratio` of the traffic. `reserve` tokens allow retries at low traffic.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, reserve: float = 10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = reserve
+
+    def deposit(self) -> None:
+        self.tokens = min(self.tokens + self.ratio, self.reserve + 100 * self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+@dataclass
+class LatencyTracker:
+    sample_size: int
+    _samples: deque = field(init=False, repr=False)
+    _sorted: Optional[list[float]] = field(default=None, init=False, repr=False)
+    _stale: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        self._samples = deque(maxlen=self.sample_size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._stale += 1
+
+    def percentile(self, percentile: float) -> float:
+        # re-sort at most every 10% of the window
+        if self._sorted is None or self._stale > self.sample_size // 10:
+            self._sorted = sorted(self._samples)
+            self._stale = 0
+
+        return self._sorted[min(int(len(self._sorted) * percentile), len(self._sorted) - 1)]
+
+
+def _discard(task: asyncio.Task) -> None:
+    def close(task_: asyncio.Task) -> None:
+        if not task_.cancelled() and task_.exception() is None:
+            asyncio.create_task(task_.result().aclose())
+
+    task.cancel()
+    task.add_done_callback(close)
+
+
+class RetryTransport(AsyncBaseTransport):
+    """
+    Retry idempotent requests on transport errors and `policy.status_codes`, optionally hedging
+    slow requests. Retries happen below the client, so `http_error_handler` only sees (logs and
+    converts) the final outcome.
+
+    Requests with a streamed body cannot be replayed and are sent once.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        policy: Optional[RetryPolicy] = None,
+        hedge: Optional[HedgePolicy] = None,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self._transport = transport
+        self.policy = policy or RetryPolicy(max_attempts=1)
+        self.hedge = hedge
+        self.budget = budget or RetryBudget()
+        self.latency = LatencyTracker(hedge.sample_size) if hedge else None
+        self.retries = 0
+        self.hedges = 0
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.method not in self.policy.methods or not isinstance(request.stream, ByteStream):
+            return await self._transport.handle_async_request(request)
+
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                response = await self._send(request)
+            except TransportError as e:
+                if attempt >= self.policy.max_attempts or not self.budget.withdraw():
+                    raise
+                FastAPILogger.debug(f'Retrying {request.method} {request.url} after {e!r}')
+            else:
+                if (
+                    response.status_code not in self.policy.status_codes
+                    or attempt >= self.policy.max_attempts
+                    or not self.budget.withdraw()
+                ):
+                    return response
+                await response.aclose()
+                FastAPILogger.debug(
+                    f'Retrying {request.method} {request.url} after {response.status_code}'
+                )
+
+            self.retries += 1
+            await asyncio.sleep(self.policy.backoff(attempt))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    async def _send(self, request: Request) -> Response:
+        if self.hedge is None:
+            return await self._transport.handle_async_request(request)
+
+        first = asyncio.create_task(self._timed_send(request))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self._hedge_delay())
+            if done or not self.budget.withdraw():
+                return await first
+
+            self.hedges += 1
+            pending.add(asyncio.create_task(self._timed_send(request)))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # a response over an error when both completed at once
+                winner = min(done, key=lambda task: task.exception() is not None)
+                for task in done - {winner}:
+                    _discard(task)
+                if winner.exception() is None or not pending:
+                    return winner.result()
+        finally:
+            # the losing request, or every request when the caller is cancelled
+            for task in pending:
+                if not task.done():
+                    _discard(task)
+
+    async def _timed_send(self, request: Request) -> Response:
+        started_at = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        self.latency.add(time.perf_counter() - started_at)
+
+        return response
+
+    def _hedge_delay(self) -> float:
+        if len(self.latency) < self.hedge.min_samples:
+            return self.hedge.delay_seconds
+
+        return max(self.latency.percentile(self.hedge.percentile), self.hedge.min_delay_seconds)
@@ -0,0 +1,141 @@
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from httpx import AsyncBaseTransport, AsyncByteStream, ByteStream, Request, Response
+
+from settings import RESPONSE_CACHE_MAX_ENTRY_BYTES
+
+from .cache import build_cache_key
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+
+@dataclass(frozen=True)
+class SharedResponse:
+    status_code: int
+    headers: list[tuple[bytes, bytes]]
+    content: bytes
+    extensions: dict
+
+    def to_response(self) -> Response:
+        return Response(
+            self.status_code,
+            headers=self.headers,
+            stream=ByteStream(self.content),
+            extensions=self.extensions,
+        )
+
+
+class ResumedStream(AsyncByteStream):
+    """
+    The chunks read ahead of a body followed by the rest of it, still read from upstream.
+    """
+
+    def __init__(self, chunks: list[bytes], rest: AsyncIterator[bytes], stream: AsyncByteStream):
+        self._chunks = chunks
+        self._rest = rest
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        for chunk in chunks:
+            yield chunk
+        async for chunk in self._rest:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+def get_content_length(response: Response) -> Optional[int]:
+    try:
+        return int(response.headers['content-length'])
+    except (KeyError, ValueError):
+        return None
+
+
+class CoalescingTransport(AsyncBaseTransport):
+    """
+    Single-flight for idempotent requests: concurrent identical requests (same key as
+    `core.httpx.cache`) share one in-flight upstream call, and every waiter gets a copy of the
+    response or the very same exception, which `http_error_handler` then converts for each caller.
+
+    Responses larger than `max_body_bytes` are not shared, waiters then issue their own request,
+    as they do if the leading request is cancelled. Bodies without a length are counted while they
+    are read, past `max_body_bytes` the rest is streamed to the leading caller alone.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        max_body_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    ):
+        self._transport = transport
+        self.max_body_bytes = max_body_bytes
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.method not in IDEMPOTENT_METHODS:
+            return await self._transport.handle_async_request(request)
+
+        key = build_cache_key(request)
+        future = self._inflight.get(key)
+        if future is not None:
+            shared: Optional[SharedResponse] = await asyncio.shield(future)
+            if shared is not None:
+                self.coalesced += 1
+                return shared.to_response()
+            return await self._transport.handle_async_request(request)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._transport.handle_async_request(request)
+            content_length = get_content_length(response)
+            if content_length is not None and content_length > self.max_body_bytes:
+                future.set_result(None)
+                return response
+
+            chunks, size = [], 0
+            stream = aiter(response.stream)
+            try:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size > self.max_body_bytes:
+                        future.set_result(None)
+                        return Response(
+                            response.status_code,
+                            headers=response.headers.raw,
+                            stream=ResumedStream(chunks, stream, response.stream),
+                            extensions=response.extensions,
+                        )
+            except BaseException:
+                await response.aclose()
+                raise
+            await response.aclose()
+
+            shared = SharedResponse(
+                status_code=response.status_code,
+                headers=response.headers.raw,
+                content=b''.join(chunks),
+                extensions={k: v for k, v in response.extensions.items() if k == 'http_version'},
+            )
+            future.set_result(shared)
+
+            return shared.to_response()
+        except asyncio.CancelledError:
+            if not future.done():
+                future.set_result(None)
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # retrieved by the waiters, if any
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
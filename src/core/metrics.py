@@ -0,0 +1,415 @@
+import asyncio
+import fcntl
+import glob
+import os
+import tempfile
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Union
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+from settings import METRICS_FLUSH_SECONDS, METRICS_MULTIPROC_DIR
+
+from .process import is_alive, process_identity
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4'  # starlette appends the charset
+
+Labels = tuple[str, ...]
+
+
+class CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def value(self) -> list[float]:
+        return [*self.counts, self.sum]
+
+
+class Metric:
+    type_ = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[Labels, Union[CounterValue, HistogramValue]] = {}
+
+    def labels(self, *values) -> Union[CounterValue, GaugeValue, HistogramValue]:
+        """
+        The series of the label values, kept so hot paths can hold on to it, e.x.:
+            requests = REQUESTS.labels('GET', '/members')
+            requests.inc()
+        """
+
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            series = self._series[values] = self._new_series()
+
+        return series
+
+    def snapshot(self) -> dict:
+        return {
+            'type': self.type_,
+            'documentation': self.documentation,
+            'labelnames': self.labelnames,
+            'series': [[labels, series.value] for labels, series in self._series.items()],
+        }
+
+    def _new_series(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_ = 'counter'
+
+    def _new_series(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric):
+    """
+    Either set by the application, or read from `collect` (label values -> value) when the
+    metrics are snapshotted, e.x. the connections of a pool.
+    """
+
+    type_ = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        collect: Optional[Callable[[], dict[Labels, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def snapshot(self) -> dict:
+        if self.collect is not None:
+            self._series.clear()
+            for labels, value in self.collect().items():
+                self.labels(*labels).set(value)
+
+        return super().snapshot()
+
+    def _new_series(self) -> GaugeValue:
+        return GaugeValue()
+
+
+class Histogram(Metric):
+    type_ = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), 'buckets': self.buckets}
+
+    def _new_series(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+
+def merge(into: dict, snapshot: dict, gauges: bool = True) -> None:
+    """
+    Add the series of `snapshot` to `into`, both map metric names to `Metric.snapshot()`
+    """
+
+    for name, metric in snapshot.items():
+        if metric['type'] == 'gauge' and not gauges:
+            continue
+
+        merged = into.setdefault(name, {**metric, 'series': []})
+        series = {tuple(labels): value for labels, value in merged['series']}
+        for labels, value in metric['series']:
+            labels = tuple(labels)
+            current = series.get(labels)
+            if current is None:
+                series[labels] = value
+            elif isinstance(value, list):
+                series[labels] = [a + b for a, b in zip(current, value)]
+            else:
+                series[labels] = current + value
+        merged['series'] = [[labels, value] for labels, value in series.items()]
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+
+    return repr(float(value))
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra: str) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(f'{name}="{escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def render(snapshot: dict) -> str:
+    """
+    Prometheus text exposition format 0.0.4
+    """
+
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f'# HELP {name} {escape(metric["documentation"])}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        labelnames = tuple(metric['labelnames'])
+        for labels, value in metric['series']:
+            labels = tuple(labels)
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{format_labels(labelnames, labels)} {format_value(value)}')
+                continue
+
+            *counts, sum_ = value
+            cumulative = 0
+            for bound, count in zip((*metric['buckets'], float('inf')), counts):
+                cumulative += count
+                bucket_labels = format_labels(labelnames, labels, le=format_value(bound))
+                lines.append(f'{name}_bucket{bucket_labels} {format_value(cumulative)}')
+            lines.append(f'{name}_sum{format_labels(labelnames, labels)} {format_value(sum_)}')
+            lines.append(
+                f'{name}_count{format_labels(labelnames, labels)} {format_value(cumulative)}'
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsRegistry:
+    """
+    Process metrics, recorded in plain Python objects (no locks, no syscalls on the request
+    path).
+
+    With `directory` set (gunicorn workers), each worker snapshots its metrics to its own file
+    every `flush_seconds`, and the worker serving the scrape merges the files: counters and
+    histograms of every worker, gauges of the live ones. Files of dead workers are folded into
+    an archive, so counters never go backwards. A worker folds its own file when it shuts down.
+
+    The files are named after the identity of the worker process (boot id, PID and start time,
+    see `core.process`), so a worker reusing the PID of a dead one writes its own file instead
+    of overwriting the dead worker's counters, whose file is archived.
+    """
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(
+        self,
+        directory: Optional[str] = METRICS_MULTIPROC_DIR,
+        flush_seconds: float = METRICS_FLUSH_SECONDS,
+    ):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._metrics: dict[str, Metric] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # (pid, path) of the file of this process, a forked child gets its own
+        self._file: Optional[tuple[int, str]] = None
+        # set once the file is folded into the archive, a flush still running in the threadpool
+        # must not write it again
+        self._archived = False
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        collect: Optional[Callable[[], dict[Labels, float]]] = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect=collect))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Duplicated metric {metric.name}')
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    async def startup(self) -> None:
+        if self.directory is None or self._flusher is not None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._archived = False
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def shutdown(self) -> None:
+        if self._flusher is None:
+            return
+
+        self._flusher.cancel()
+        self._flusher = None
+        await run_in_threadpool(self.archive, self.snapshot())
+
+    async def expose(self) -> str:
+        snapshot = self.snapshot()
+        if self.directory is None:
+            return render(snapshot)
+
+        return await run_in_threadpool(lambda: render(self.collect(snapshot)))
+
+    def flush(self, snapshot: dict) -> None:
+        with self._lock():
+            if not self._archived:
+                self._write(self.file, snapshot)
+
+    def archive(self, snapshot: dict) -> None:
+        """
+        Fold the final snapshot of this worker into the archive
+        """
+
+        with self._lock():
+            archive_path = os.path.join(self.directory, self.ARCHIVE)
+            archive = self._read(archive_path) or {}
+            merge(archive, snapshot, gauges=False)
+            self._write(archive_path, archive)
+            self._archived = True
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def file(self) -> str:
+        pid = os.getpid()
+        if self._file is None or self._file[0] != pid:
+            self._file = (pid, self._path(process_identity(pid).replace(':', '_')))
+
+        return self._file[1]
+
+    def collect(self, own: dict) -> dict:
+        """
+        Merge the snapshots of all workers, `own` being the live one of this worker
+        """
+
+        collected: dict = {}
+        merge(collected, own)
+        with self._lock():
+            archive = self._read(os.path.join(self.directory, self.ARCHIVE)) or {}
+            archived = False
+            live, dead = self._worker_files()
+            for path in dead:
+                snapshot = self._read(path)
+                if snapshot is not None:
+                    merge(archive, snapshot, gauges=False)
+                    os.remove(path)
+                    archived = True
+            for path in live:
+                snapshot = self._read(path)
+                if snapshot is not None:
+                    merge(collected, snapshot)
+            if archived:
+                self._write(os.path.join(self.directory, self.ARCHIVE), archive)
+
+        merge(collected, archive)
+        return collected
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            # gauges are collected on the event loop, the file is written off it
+            await run_in_threadpool(self.flush, self.snapshot())
+            await asyncio.sleep(self.flush_seconds)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f'metrics_{name}.json')
+
+    def _worker_files(self) -> tuple[list[str], list[str]]:
+        """
+        Files of the other live workers and of the dead ones
+        """
+
+        live, dead = [], []
+        for path in glob.glob(self._path('*')):
+            if path == self.file:
+                continue
+            identity = os.path.basename(path)[len('metrics_') : -len('.json')].replace('_', ':')
+            (live if is_alive(identity) else dead).append(path)
+
+        return live, dead
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        with open(os.path.join(self.directory, '.lock'), 'a', encoding='utf-8') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path, 'rb') as f:
+                return orjson.loads(f.read())  # pylint:disable=no-member
+        except (FileNotFoundError, orjson.JSONDecodeError):  # pylint:disable=no-member
+            return None
+
+    @staticmethod
+    def _write(path: str, snapshot: dict) -> None:
+        # write then rename, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(orjson.dumps(snapshot))  # pylint:disable=no-member
+        os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,57 @@
+import os
+from typing import Optional
+
+
+def read_boot_id() -> str:
+    try:
+        with open('/proc/sys/kernel/random/boot_id', 'r', encoding='ascii') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+BOOT_ID = read_boot_id()
+
+
+def process_start_time(pid: int) -> str:
+    """
+    Start time of the process in clock ticks since boot, '' when unknown (no procfs)
+    """
+
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return ''
+
+    # `comm` may contain spaces and parentheses, `starttime` is the 20th field after it
+    return stat.rpartition(b')')[2].split()[19].decode('ascii')
+
+
+def process_identity(pid: Optional[int] = None) -> str:
+    """
+    `boot id:pid:start time`, a PID alone may be reused by another process once its owner exited
+    """
+
+    pid = pid or os.getpid()
+    return f'{BOOT_ID}:{pid}:{process_start_time(pid)}'
+
+
+def is_alive(identity: str) -> bool:
+    """
+    Whether the process of `identity` (see `process_identity`) is still running
+    """
+
+    boot_id, _, identity = identity.partition(':')
+    pid, _, started = identity.partition(':')
+    if boot_id != BOOT_ID or not pid.isdigit():
+        return False
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return process_start_time(int(pid)) == started
@@ -0,0 +1,2 @@
+from .app import ProxyApp
+from .route import ProxyConfig, ProxyRoute, RouteTable
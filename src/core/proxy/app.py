@@ -0,0 +1,178 @@
+import urllib.parse
+from typing import AsyncIterator, Optional
+
+import httpx
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..exception import UpstreamException
+from ..httpx.client import clients
+from ..httpx.decorator import http_error_handler
+from .route import ProxyRoute, RouteTable
+
+# https://www.rfc-editor.org/rfc/rfc9110#section-7.6.1
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        b'connection',
+        b'keep-alive',
+        b'proxy-authenticate',
+        b'proxy-authorization',
+        b'te',
+        b'trailer',
+        b'transfer-encoding',
+        b'upgrade',
+    )
+)
+
+
+def hop_by_hop_headers(headers: list[tuple[bytes, bytes]]) -> frozenset[bytes]:
+    """
+    The fixed hop-by-hop headers and those listed by `Connection`, e.x. `Connection: close, X-Foo`
+    """
+
+    listed = [
+        name.strip().lower()
+        for key, value in headers
+        if key.lower() == b'connection'
+        for name in value.split(b',')
+    ]
+    return HOP_BY_HOP_HEADERS.union(listed) if listed else HOP_BY_HOP_HEADERS
+
+
+class ProxyUpstream:
+    __exception__ = UpstreamException
+
+    def __init__(self, name: str):
+        self.__service_name__ = name
+
+    @http_error_handler
+    async def send(self, request: httpx.Request) -> httpx.Response:
+        return await clients.get(self.__service_name__).send(request, stream=True)
+
+
+class ProxyApp:
+    """
+    Forward requests matched by the route table to their upstream, streaming the bodies in both
+    directions. Unmatched requests are handed to `fallback` (the router's 404 by default).
+    """
+
+    def __init__(self, table: RouteTable, fallback: ASGIApp):
+        self.table = table
+        self.fallback = fallback
+        self._upstreams: dict[str, ProxyUpstream] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = (
+            self.table.match(scope['method'], scope['path']) if scope['type'] == 'http' else None
+        )
+        if route is None:
+            await self.fallback(scope, receive, send)
+            return
+
+        scope['route'] = route
+        upstream = self._upstreams.get(route.upstream)
+        if upstream is None:
+            upstream = self._upstreams[route.upstream] = ProxyUpstream(route.upstream)
+
+        request = clients.get(route.upstream).build_request(
+            scope['method'],
+            self.get_url(self.get_path(scope, route), scope['query_string']),
+            headers=self.get_headers(scope),
+            content=self.stream_request(receive) if self.has_body(scope) else None,
+        )
+        response = await upstream.send(request)
+        try:
+            excluded = hop_by_hop_headers(response.headers.raw)
+            start = {
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [
+                    (key, value)
+                    for key, value in response.headers.raw
+                    if key.lower() not in excluded
+                ],
+            }
+            if (cached_body := response.extensions.get('cached_body')) is not None:
+                # the compressed variants of the body are cached with it, see `GatewayMiddleware`
+                start['cached_body'] = cached_body
+            await send(start)
+            async for chunk in response.aiter_raw():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    def get_path(scope: Scope, route: ProxyRoute) -> str:
+        """
+        The upstream path, percent-encoded as received. `scope['path']` is decoded, so an encoded
+        `/` (`%2F`) can only be told apart from a segment separator in `scope['raw_path']`.
+        """
+
+        path = scope['path']
+        raw_path = scope.get('raw_path')
+        if raw_path is not None:
+            # `raw_path` is relative to the server, `root_path` holds the version prefix
+            raw_path = raw_path.partition(b'?')[0].decode('latin-1')
+            root_path = scope.get('root_path', '')
+            if raw_path.startswith(root_path):
+                raw_path = raw_path[len(root_path) :]
+                if urllib.parse.unquote(raw_path) == path and (
+                    route.prefix == '/' or raw_path.startswith(route.prefix)
+                ):
+                    return route.rewrite(raw_path)
+
+        # e.x. a percent-encoded route prefix
+        return urllib.parse.quote(route.rewrite(path))
+
+    @staticmethod
+    def get_url(path: str, query_string: bytes) -> str:
+        url = path
+        if query_string:
+            url = f'{url}?{query_string.decode("ascii")}'
+
+        return url
+
+    @staticmethod
+    def get_headers(scope: Scope) -> list[tuple[bytes, bytes]]:
+        excluded = hop_by_hop_headers(scope['headers'])
+        headers = [
+            (key, value)
+            for key, value in scope['headers']
+            if key not in excluded and key != b'host'
+        ]
+
+        request_headers = Headers(scope=scope)
+        client: Optional[tuple[str, int]] = scope.get('client')
+        if client:
+            forwarded_for = request_headers.get('x-forwarded-for')
+            forwarded_for = f'{forwarded_for}, {client[0]}' if forwarded_for else client[0]
+            headers = [(key, value) for key, value in headers if key != b'x-forwarded-for']
+            headers.append((b'x-forwarded-for', forwarded_for.encode('latin-1')))
+        if 'host' in request_headers and 'x-forwarded-host' not in request_headers:
+            headers.append((b'x-forwarded-host', request_headers['host'].encode('latin-1')))
+        if 'x-forwarded-proto' not in request_headers:
+            headers.append((b'x-forwarded-proto', scope.get('scheme', 'http').encode('latin-1')))
+
+        return headers
+
+    @staticmethod
+    def has_body(scope: Scope) -> bool:
+        for key, _ in scope['headers']:
+            if key in (b'content-length', b'transfer-encoding'):
+                return True
+
+        return False
+
+    @staticmethod
+    async def stream_request(receive: Receive) -> AsyncIterator[bytes]:
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnect()
+
+            more_body = message.get('more_body', False)
+            if body := message.get('body', b''):
+                yield body
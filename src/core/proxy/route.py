@@ -0,0 +1,109 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import yaml
+
+from ..httpx.client import UpstreamConfig
+
+ANY_METHOD = '*'
+
+
+@dataclass(frozen=True)
+class ProxyRoute:
+    prefix: str
+    upstream: str
+    methods: frozenset[str] = frozenset()
+    version: Optional[tuple[int, int]] = None
+    upstream_prefix: Optional[str] = None
+
+    def __post_init__(self):
+        object.__setattr__(self, 'prefix', '/' + self.prefix.strip('/'))
+        object.__setattr__(self, 'methods', frozenset(method.upper() for method in self.methods))
+        if self.version is not None:
+            object.__setattr__(self, 'version', tuple(self.version))
+
+    @property
+    def path(self) -> str:
+        # the label of the route in metrics, like `APIRoute.path`
+        return self.prefix
+
+    def rewrite(self, path: str) -> str:
+        if self.upstream_prefix is None:
+            return path
+
+        remainder = path[len(self.prefix) :] if self.prefix != '/' else path
+        return self.upstream_prefix.rstrip('/') + remainder if remainder else self.upstream_prefix
+
+
+@dataclass
+class _Node:
+    children: dict[str, '_Node'] = field(default_factory=dict)
+    routes: dict[str, ProxyRoute] = field(default_factory=dict)
+
+
+class RouteTable:
+    """
+    Prefix trie keyed on path segments, matching costs O(path length) regardless of the number
+    of routes. The longest registered prefix wins.
+    """
+
+    def __init__(self, routes: Optional[list[ProxyRoute]] = None):
+        self._root = _Node()
+        for route in routes or []:
+            self.add(route)
+
+    def add(self, route: ProxyRoute) -> None:
+        node = self._root
+        for segment in self._split(route.prefix):
+            node = node.children.setdefault(segment, _Node())
+
+        for method in route.methods or (ANY_METHOD,):
+            if method in node.routes:
+                raise ValueError(f'Duplicated proxy route: {method} {route.prefix}')
+            node.routes[method] = route
+
+    def match(self, method: str, path: str) -> Optional[ProxyRoute]:
+        node = self._root
+        matched = self._match_node(node, method)
+        for segment in self._split(path):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            matched = self._match_node(node, method) or matched
+
+        return matched
+
+    @staticmethod
+    def _match_node(node: _Node, method: str) -> Optional[ProxyRoute]:
+        if not node.routes:
+            return None
+
+        return node.routes.get(method) or node.routes.get(ANY_METHOD)
+
+    @staticmethod
+    def _split(path: str) -> list[str]:
+        return [segment for segment in path.split('/') if segment]
+
+
+@dataclass
+class ProxyConfig:
+    upstreams: dict[str, UpstreamConfig] = field(default_factory=dict)
+    routes: list[ProxyRoute] = field(default_factory=list)
+
+    @classmethod
+    def from_yaml(cls, path: str) -> 'ProxyConfig':
+        with open(path, 'r', encoding='utf-8') as f:
+            config = yaml.load(f, Loader=yaml.FullLoader) or {}
+
+        upstreams = {
+            name: UpstreamConfig(**(options or {}))
+            for name, options in (config.get('upstreams') or {}).items()
+        }
+        routes = [ProxyRoute(**options) for options in config.get('routes') or []]
+        for route in routes:
+            if route.upstream not in upstreams:
+                raise ValueError(
+                    f'Proxy route {route.prefix} refers to unknown upstream {route.upstream}'
+                )
+
+        return cls(upstreams=upstreams, routes=routes)
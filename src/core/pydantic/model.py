@@ -1,11 +1,15 @@
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from decimal import Decimal
-from typing import TYPE_CHECKING, Any, Optional, Union
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Optional, Union
 
 import orjson
 from pydantic import BaseModel as _BaseModel
 from pydantic import StrictFloat, root_validator
 from pydantic.fields import SHAPE_SINGLETON, ModelField
+from pydantic.json import ENCODERS_BY_TYPE
+from pydantic.utils import ROOT_KEY
 from pydantic_factories import ModelFactory as _ModelFactory
 
 from .field import ISO8601Datetime, UTCDatetime
@@ -14,38 +18,196 @@ if TYPE_CHECKING:
     from pydantic.typing import AbstractSetIntStr, MappingIntStrAny, TupleGenerator
 
 
+JSON_NATIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def jsonable_key(key: Any) -> str:
+    # the same conversion json.dumps applies to dict keys
+    if isinstance(key, str):
+        return str.__str__(key)
+    if key is None or isinstance(key, bool):
+        return orjson.dumps(key).decode()  # pylint:disable=no-member
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return float.__repr__(key)
+
+    raise TypeError(f'keys must be str, int, float, bool or None, not {type(key).__name__}')
+
+
+class JsonablePlan:
+    """
+    Converts values to what `orjson.loads(model.json())` gives for them, without encoding and
+    decoding a JSON document. The conversion of each type is resolved once, following the order
+    of `.json()`: JSON native types, models, `Config.json_encoders`, then the pydantic encoders.
+    """
+
+    def __init__(
+        self,
+        encoder: Callable[[Any], Any],
+        json_encoders: Optional[dict] = None,
+        by_alias: bool = False,
+        exclude_none: bool = False,
+    ):
+        self.encoder = encoder
+        # only resolvable when `encoder` is the model's own `__json_encoder__`
+        self.json_encoders = json_encoders
+        self.by_alias = by_alias
+        self.exclude_none = exclude_none
+        self.converters: dict[type, Callable[[Any], Any]] = {}
+
+    def __call__(self, value: Any) -> Any:
+        type_ = type(value)
+        if type_ in JSON_NATIVE_TYPES:
+            return value
+
+        converter = self.converters.get(type_)
+        if converter is None:
+            converter = self.converters[type_] = self._resolve(type_)
+
+        return converter(value)
+
+    def _resolve(self, type_: type) -> Callable[[Any], Any]:
+        # pylint:disable=too-many-return-statements
+        if issubclass(type_, dict):
+            return lambda v: {
+                k if type(k) is str else jsonable_key(k): self(item) for k, item in v.items()
+            }
+        if issubclass(type_, (list, tuple)):
+            return lambda v: [self(item) for item in v]
+        if issubclass(type_, BaseModel):
+            return lambda v: v._jsonable(self)
+        if issubclass(type_, _BaseModel):
+            return lambda v: self(v.dict(by_alias=self.by_alias, exclude_none=self.exclude_none))
+        # subclasses of JSON native types, including str and int enums
+        if issubclass(type_, str):
+            return str.__str__
+        if issubclass(type_, int):
+            return int
+        if issubclass(type_, float):
+            return float
+
+        if self.json_encoders is not None:
+            for encoders in (self.json_encoders, ENCODERS_BY_TYPE):
+                for base in type_.__mro__[:-1]:
+                    if base in encoders:
+                        encoder = encoders[base]
+                        return lambda v: self(encoder(v))
+
+        return lambda v: self(self.encoder(v))
+
+
+@dataclass(frozen=True)
+class ModelMetadata:
+    """
+    Facts about a model class computed once when the class is created, instead of on every
+    validation or serialization.
+    """
+
+    properties: tuple[str, ...]
+    aliases: dict[str, str]
+    non_nullable_fields: tuple[str, ...]
+    datetime_fields: tuple[str, ...]
+    # fields excluded as a whole by `Field(exclude=True)` or `Config.fields`
+    excluded_fields: frozenset[str]
+    # nested exclude or include settings, which only the walk of `.dict()` applies
+    filters_fields: bool
+    # JsonablePlan by (by_alias, exclude_none)
+    jsonable_plans: dict[tuple[bool, bool], JsonablePlan] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+
+    @classmethod
+    def build(cls, model: type['BaseModel']) -> 'ModelMetadata':
+        exclude_fields = model.__exclude_fields__ or {}
+        return cls(
+            properties=tuple(
+                prop
+                for prop in dir(model)
+                # abc sets __abstractmethods__ after __init_subclass__
+                if isinstance(getattr(model, prop, None), property)
+                and prop not in ('__values__', 'fields')
+            ),
+            aliases={name: field_.alias for name, field_ in model.__fields__.items()},
+            non_nullable_fields=tuple(
+                name
+                for name, field_ in model.__fields__.items()
+                if field_.field_info.extra.get('nullable') is False
+            ),
+            datetime_fields=tuple(
+                name for name, field_ in model.__fields__.items() if field_.type_ is datetime
+            ),
+            excluded_fields=frozenset(
+                name for name, value in exclude_fields.items() if value is True or value is ...
+            ),
+            filters_fields=bool(model.__include_fields__)
+            or any(value is not True and value is not ... for value in exclude_fields.values()),
+        )
+
+    def jsonable_plan(
+        self, model: type['BaseModel'], by_alias: bool, exclude_none: bool
+    ) -> JsonablePlan:
+        plan = self.jsonable_plans.get((by_alias, exclude_none))
+        if plan is None:
+            plan = self.jsonable_plans[by_alias, exclude_none] = JsonablePlan(
+                model.__json_encoder__, model.__config__.json_encoders, by_alias, exclude_none
+            )
+
+        return plan
+
+
 class BaseModel(_BaseModel):
+    __model_metadata__: ClassVar[ModelMetadata]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_metadata()
+
+    @classmethod
+    def update_forward_refs(cls, **localns: Any) -> None:
+        super().update_forward_refs(**localns)
+        cls._build_metadata()
+
+    @classmethod
+    def _build_metadata(cls) -> None:
+        metadata = cls.__model_metadata__ = ModelMetadata.build(cls)
+
+        # models without non-nullable / datetime fields skip the corresponding root validators
+        check_nullable = BaseModel.check_nullable.__func__
+        transfer_datetime = BaseModel.transfer_datetime_format_to_utc.__func__
+        pre_validators = [v for v in cls.__pre_root_validators__ if v is not check_nullable]
+        post_validators = [v for v in cls.__post_root_validators__ if v[1] is not transfer_datetime]
+        if metadata.non_nullable_fields:
+            pre_validators.insert(0, check_nullable)
+        if metadata.datetime_fields:
+            post_validators.insert(0, (False, transfer_datetime))
+
+        cls.__pre_root_validators__ = pre_validators
+        cls.__post_root_validators__ = post_validators
+
     @staticmethod
-    def is_optional(field: ModelField):
-        if field.allow_none and (field.shape != SHAPE_SINGLETON or not field.sub_fields):
+    def is_optional(field_: ModelField):
+        if field_.allow_none and (field_.shape != SHAPE_SINGLETON or not field_.sub_fields):
             return True
 
         return False
 
     @classmethod
     def get_properties(cls):
-        return [
-            prop
-            for prop in dir(cls)
-            if isinstance(getattr(cls, prop), property) and prop not in ('__values__', 'fields')
-        ]
+        return list(cls.__model_metadata__.properties)
 
     @root_validator(pre=True)
     def check_nullable(cls, values):
-        for k, field in cls.__fields__.items():
-            if k not in values:
-                continue
-
-            nullable = field.field_info.extra.get('nullable')
-            if nullable is False and values[k] is None:
+        for k in cls.__model_metadata__.non_nullable_fields:
+            if k in values and values[k] is None:
                 raise ValueError(f'{k} is not allowed to be null')
 
         return values
 
     @root_validator
     def transfer_datetime_format_to_utc(cls, values: dict):
-        for name, field in cls.__fields__.items():
-            if field.type_ is datetime and values.get(name) and values.get(name).tzinfo:
+        for name in cls.__model_metadata__.datetime_fields:
+            if values.get(name) and values.get(name).tzinfo:
                 values[name] = (values[name].astimezone(timezone.utc)).replace(tzinfo=None)
 
         return values
@@ -62,7 +224,7 @@ class BaseModel(_BaseModel):
     ) -> 'TupleGenerator':
         yield from super()._iter(to_dict, by_alias, include, exclude, exclude_unset, exclude_defaults, exclude_none)
 
-        props = self.get_properties()
+        props = self.__model_metadata__.properties
         if include:
             props = (prop for prop in props if prop in include)
         if exclude:
@@ -81,16 +243,67 @@ class BaseModel(_BaseModel):
         exclude_none: bool = False,
         **kwargs,
     ) -> dict:
-        json_ = self.json(
-            by_alias=by_alias,
-            skip_defaults=skip_defaults,
-            exclude_unset=exclude_unset,
-            exclude_defaults=exclude_defaults,
-            exclude_none=exclude_none,
-            **kwargs,
-        )
+        encoder = kwargs.pop('encoder', None)
+        kwargs.pop('models_as_dict', None)
+        if encoder is None:
+            plan = self.__model_metadata__.jsonable_plan(type(self), by_alias, exclude_none)
+        else:
+            plan = JsonablePlan(encoder, by_alias=by_alias, exclude_none=exclude_none)
+
+        if skip_defaults or exclude_unset or exclude_defaults or any(kwargs.values()):
+            # include / exclude need the generic walk of pydantic
+            data = self.dict(
+                by_alias=by_alias,
+                skip_defaults=skip_defaults,
+                exclude_unset=exclude_unset,
+                exclude_defaults=exclude_defaults,
+                exclude_none=exclude_none,
+                **kwargs,
+            )
+            return plan(data[ROOT_KEY] if self.__custom_root_type__ else data)
+
+        return self._jsonable(plan)
+
+    def json_bytes(self, **kwargs) -> bytes:
+        """
+        `.json()` encoded by orjson, takes the keyword arguments of `.jsonable_dict()`
+
+        e.x.:
+            Response(content=model.json_bytes(exclude_none=True), media_type='application/json')
+        """
+
+        try:
+            return orjson.dumps(self.jsonable_dict(**kwargs))  # pylint:disable=no-member
+        except orjson.JSONEncodeError:  # pylint:disable=no-member
+            # e.g. integers over 64 bits, which only the json module can encode
+            return self.json(**kwargs).encode()
+
+    def _jsonable(self, plan: JsonablePlan) -> Any:
+        # single pass over the values, the equivalent of `.dict()` then converting every value
+        metadata = self.__model_metadata__
+        if metadata.filters_fields:
+            data = self.dict(by_alias=plan.by_alias, exclude_none=plan.exclude_none)
+            return plan(data[ROOT_KEY] if self.__custom_root_type__ else data)
+
+        excluded = metadata.excluded_fields
+        aliases = metadata.aliases if plan.by_alias else {}
+        exclude_none = plan.exclude_none
+        data = {}
+        for name, value in self.__dict__.items():
+            if (value is None and exclude_none) or name in excluded:
+                continue
+            data[aliases.get(name, name)] = (
+                value if type(value) in JSON_NATIVE_TYPES else plan(value)
+            )
+        for prop in metadata.properties:
+            data[prop] = plan(getattr(self, prop))
+
+        if self.__custom_root_type__:
+            return data[ROOT_KEY]
+        return data
+
 
-        return orjson.loads(json_)  # pylint:disable=no-member
+BaseModel.__model_metadata__ = ModelMetadata.build(BaseModel)
 
 
 class ModelFactory(_ModelFactory[Any]):
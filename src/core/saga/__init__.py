@@ -0,0 +1,2 @@
+from .journal import SagaJournal, SagaStatus, StepStatus
+from .orchestrator import Saga, SagaContext, SagaOrchestrator, SagaStep, saga_orchestrator
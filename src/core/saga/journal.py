@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+from ..enum import StrEnum
+from ..process import is_alive, process_identity
+
+
+class SagaStatus(StrEnum):
+    RUNNING = 'running'
+    COMPENSATING = 'compensating'
+    COMPLETED = 'completed'
+    COMPENSATED = 'compensated'
+    COMPENSATION_UNDONE = 'compensation_undone'
+
+
+class StepStatus(StrEnum):
+    DONE = 'done'
+    COMPENSATED = 'compensated'
+    COMPENSATION_FAILED = 'compensation_failed'
+
+
+@dataclass
+class SagaRecord:
+    id: str
+    name: str
+    status: SagaStatus
+    data: dict
+    error: Optional[str] = None
+    steps: dict[str, StepStatus] = field(default_factory=dict)
+    results: dict[str, Any] = field(default_factory=dict)
+
+
+class SagaJournal:
+    """
+    Append-style SQLite journal of saga progress, shared by the workers of a host, so sagas
+    interrupted by a crashed worker can be resumed by another one.
+    """
+
+    SCHEMA = (
+        '''
+        CREATE TABLE IF NOT EXISTS sagas (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            data TEXT NOT NULL,
+            error TEXT,
+            owner TEXT,
+            updated_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS saga_steps (
+            saga_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            PRIMARY KEY (saga_id, name)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS sagas_status ON sagas (status)',
+    )
+    UNFINISHED = (SagaStatus.RUNNING, SagaStatus.COMPENSATING)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA busy_timeout=5000')
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._connection = connection
+
+        return self._connection
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connect().execute(sql, parameters).fetchall()
+
+    def _update(self, sql: str, parameters: tuple = ()) -> int:
+        with self._lock:
+            return self._connect().execute(sql, parameters).rowcount
+
+    async def execute(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        return await run_in_threadpool(self._execute, sql, parameters)
+
+    async def start(self, saga_id: str, name: str, data: dict) -> None:
+        await self.execute(
+            'INSERT INTO sagas (id, name, status, data, owner, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                saga_id,
+                name,
+                SagaStatus.RUNNING,
+                orjson.dumps(data),  # pylint:disable=no-member
+                process_identity(),
+                time.time(),
+            ),
+        )
+
+    async def set_status(self, saga_id: str, status: SagaStatus, error: Optional[str] = None):
+        await self.execute(
+            'UPDATE sagas SET status = ?, error = COALESCE(?, error), updated_at = ? WHERE id = ?',
+            (status, error, time.time(), saga_id),
+        )
+
+    async def set_step(
+        self, saga_id: str, name: str, status: StepStatus, result: Any = None
+    ) -> None:
+        await self.execute(
+            '''
+            INSERT INTO saga_steps (saga_id, name, status, result) VALUES (?, ?, ?, ?)
+            ON CONFLICT (saga_id, name) DO UPDATE SET status = excluded.status
+            ''',
+            (saga_id, name, status, orjson.dumps(result)),  # pylint:disable=no-member
+        )
+
+    async def claim_unfinished(self, names: list[str]) -> list[SagaRecord]:
+        """
+        Take over the unfinished sagas whose owner process is gone, or that were released.
+        """
+
+        return await run_in_threadpool(self._claim_unfinished, names)
+
+    def _claim_unfinished(self, names: list[str]) -> list[SagaRecord]:
+        identity = process_identity()
+        records = []
+        rows = self._execute(
+            f'''
+            SELECT id, name, status, data, error, owner FROM sagas
+            WHERE status IN (?, ?) AND name IN ({", ".join("?" * len(names))})
+            ''',
+            (*self.UNFINISHED, *names),
+        )
+        for saga_id, name, status, data, error, owner in rows:
+            if owner == identity or (owner is not None and is_alive(owner)):
+                continue
+            claimed = self._update(
+                'UPDATE sagas SET owner = ? WHERE id = ? AND owner IS ?', (identity, saga_id, owner)
+            )
+            if not claimed:  # taken over by another worker
+                continue
+
+            record = SagaRecord(
+                saga_id,
+                name,
+                SagaStatus(status),
+                orjson.loads(data),  # pylint:disable=no-member
+                error,
+            )
+            for step, step_status, result in self._execute(
+                'SELECT name, status, result FROM saga_steps WHERE saga_id = ?', (saga_id,)
+            ):
+                record.steps[step] = StepStatus(step_status)
+                record.results[step] = (
+                    orjson.loads(result) if result else None  # pylint:disable=no-member
+                )
+            records.append(record)
+
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
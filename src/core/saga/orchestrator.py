@@ -0,0 +1,282 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from settings import SAGA_COMPENSATION_ATTEMPTS, SAGA_JOURNAL_FILE
+
+from ..exception import SagaCompensationUndoneException
+from ..fastapi import FastAPILogger
+from .journal import SagaJournal, SagaRecord, SagaStatus, StepStatus
+
+
+@dataclass
+class SagaContext:
+    saga_id: str
+    data: dict
+    results: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class SagaStep:
+    name: str
+    action: Callable[[SagaContext], Awaitable[Any]]
+    compensation: Optional[Callable[[SagaContext], Awaitable[None]]] = None
+    depends_on: tuple[str, ...] = ()
+
+
+class Saga:
+    """
+    A multi-service write declared as steps with compensating actions. Steps run as soon as the
+    steps they depend on are done, so independent steps run concurrently.
+
+    The results of actions are journaled and must be JSON serialisable. A step interrupted by a
+    crash is run again on recovery, so actions and compensations should be idempotent.
+
+    e.x.:
+        order_saga = Saga('create_order')
+
+        @order_saga.step('reserve_stock')
+        async def reserve_stock(context: SagaContext):
+            return await stock_service.reserve(context.data['items'])
+
+        @order_saga.compensation('reserve_stock')
+        async def release_stock(context: SagaContext):
+            await stock_service.release(context.results['reserve_stock']['reservation_id'])
+
+        @order_saga.step('charge', depends_on=['reserve_stock'])
+        async def charge(context: SagaContext):
+            ...
+
+        saga_orchestrator.register(order_saga)
+        results = await saga_orchestrator.execute(order_saga, {'items': [...]})
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.steps: dict[str, SagaStep] = {}
+
+    def step(self, name: str, depends_on: tuple[str, ...] = ()):
+        def decorator(func: Callable[[SagaContext], Awaitable[Any]]):
+            if name in self.steps:
+                raise ValueError(f'Duplicated step {name} in saga {self.name}')
+            for dependency in depends_on:
+                if dependency not in self.steps:
+                    raise ValueError(f'Step {name} depends on undeclared step {dependency}')
+
+            self.steps[name] = SagaStep(name, func, depends_on=tuple(depends_on))
+            return func
+
+        return decorator
+
+    def compensation(self, name: str):
+        def decorator(func: Callable[[SagaContext], Awaitable[None]]):
+            self.steps[name].compensation = func
+            return func
+
+        return decorator
+
+    def dependents(self, name: str) -> list[str]:
+        return [step.name for step in self.steps.values() if name in step.depends_on]
+
+
+class SagaOrchestrator:
+    def __init__(
+        self,
+        journal: SagaJournal,
+        compensation_attempts: int = SAGA_COMPENSATION_ATTEMPTS,
+    ):
+        self.journal = journal
+        self.compensation_attempts = compensation_attempts
+        self.sagas: dict[str, Saga] = {}
+        # the recovery, and compensations of the sagas whose caller was cancelled
+        self._background: set[asyncio.Task] = set()
+
+    def register(self, saga: Saga) -> None:
+        self.sagas[saga.name] = saga
+
+    async def execute(self, saga: Saga, data: dict) -> dict[str, Any]:
+        """
+        Run the saga and return the results of its steps. If a step fails, the completed steps
+        are compensated and the error is raised again, `SagaCompensationUndoneException` is
+        raised instead if a compensation can't complete.
+
+        If the caller is cancelled, the running steps are cancelled and the saga is compensated
+        in the background.
+        """
+
+        self.register(saga)
+        context = SagaContext(saga_id=uuid.uuid4().hex, data=data)
+        await self.journal.start(context.saga_id, saga.name, data)
+
+        return await self._run(saga, context, done=set())
+
+    async def startup(self) -> None:
+        """
+        Recover the unfinished sagas in the background, the worker serves requests meanwhile
+        """
+
+        self._spawn(self.recover())
+
+    async def recover(self) -> None:
+        """
+        Resume the sagas left unfinished by a crashed worker: running sagas continue forward,
+        compensating sagas continue compensating.
+        """
+
+        if not self.sagas:
+            return
+
+        for record in await self.journal.claim_unfinished(list(self.sagas)):
+            FastAPILogger.warning(f'Resuming saga {record.name} ({record.id}), {record.status}')
+            try:
+                await self._resume(record)
+            except Exception as e:
+                FastAPILogger.error(f'Resuming saga {record.name} ({record.id}) failed, {e!r}')
+
+    async def _resume(self, record: SagaRecord) -> None:
+        saga = self.sagas[record.name]
+        context = SagaContext(saga_id=record.id, data=record.data, results=record.results)
+        done = {name for name, status in record.steps.items() if status == StepStatus.DONE}
+        if record.status == SagaStatus.RUNNING:
+            await self._run(saga, context, done=done)
+        else:
+            # compensations given up on before the crash still leave the saga undone
+            failed = [
+                name
+                for name, status in record.steps.items()
+                if status == StepStatus.COMPENSATION_FAILED
+            ]
+            await self._compensate(saga, context, done, error=record.error, failed=failed)
+
+    async def _run(self, saga: Saga, context: SagaContext, done: set[str]) -> dict[str, Any]:
+        pending = {name: step for name, step in saga.steps.items() if name not in done}
+        running: dict[asyncio.Task, str] = {}
+        error: Optional[Exception] = None
+
+        try:
+            while pending or running:
+                if error is None:
+                    for name, step in list(pending.items()):
+                        if all(dependency in done for dependency in step.depends_on):
+                            del pending[name]
+                            running[asyncio.create_task(step.action(context))] = name
+
+                if not running:
+                    break
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    if task.cancelled():
+                        # let the running steps finish, then compensate everything done so far
+                        error = error or RuntimeError(f'Saga step {name} cancelled')
+                        continue
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+
+                    context.results[name] = task.result()
+                    done.add(name)
+                    await self.journal.set_step(
+                        context.saga_id, name, StepStatus.DONE, context.results[name]
+                    )
+        except asyncio.CancelledError:
+            for task in running:
+                task.cancel()
+            self._spawn(self._compensate_cancelled(saga, context, done, running))
+            raise
+
+        if error is not None:
+            await self._compensate(saga, context, done, error=repr(error))
+            raise error
+
+        await self.journal.set_status(context.saga_id, SagaStatus.COMPLETED)
+        return context.results
+
+    def _spawn(self, coroutine: Awaitable[None]) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _compensate_cancelled(
+        self, saga: Saga, context: SagaContext, done: set[str], running: dict[asyncio.Task, str]
+    ) -> None:
+        # a step may have completed before its cancellation took effect
+        await asyncio.gather(*running, return_exceptions=True)
+        for task, name in running.items():
+            if not task.cancelled() and task.exception() is None:
+                context.results[name] = task.result()
+                await self.journal.set_step(
+                    context.saga_id, name, StepStatus.DONE, context.results[name]
+                )
+                done.add(name)
+
+        try:
+            await self._compensate(saga, context, done, error='Cancelled')
+        except Exception as e:
+            FastAPILogger.error(
+                f'Compensating cancelled saga {saga.name} ({context.saga_id}), {e!r}'
+            )
+
+    async def _compensate(
+        self,
+        saga: Saga,
+        context: SagaContext,
+        done: set[str],
+        error: Optional[str],
+        failed: Optional[list[str]] = None,
+    ) -> None:
+        """
+        Compensate the done steps in reverse dependency order, a step is compensated once all of
+        its dependents are, independent compensations run concurrently.
+        """
+
+        await self.journal.set_status(context.saga_id, SagaStatus.COMPENSATING, error=error)
+
+        undone = set(done)
+        failed = list(failed or [])
+        while undone:
+            ready = [
+                name
+                for name in undone
+                if not any(dependent in undone for dependent in saga.dependents(name))
+            ]
+            undone.difference_update(ready)
+            results = await asyncio.gather(
+                *(self._compensate_step(saga.steps[name], context) for name in ready)
+            )
+            failed.extend(name for name, compensated in zip(ready, results) if not compensated)
+
+        if failed:
+            await self.journal.set_status(context.saga_id, SagaStatus.COMPENSATION_UNDONE)
+            raise SagaCompensationUndoneException(
+                f'Saga {saga.name} compensation undone: {", ".join(sorted(failed))}',
+                data={'saga_id': context.saga_id, 'steps': sorted(failed)},
+            )
+
+        await self.journal.set_status(context.saga_id, SagaStatus.COMPENSATED)
+
+    async def _compensate_step(self, step: SagaStep, context: SagaContext) -> bool:
+        if step.compensation is not None:
+            for attempt in range(self.compensation_attempts):
+                if attempt:
+                    await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+                try:
+                    await step.compensation(context)
+                    break
+                except Exception as e:
+                    FastAPILogger.warning(
+                        f'Compensating saga step {step.name} ({context.saga_id}) failed, {e!r}'
+                    )
+            else:
+                await self.journal.set_step(
+                    context.saga_id, step.name, StepStatus.COMPENSATION_FAILED
+                )
+                return False
+
+        await self.journal.set_step(context.saga_id, step.name, StepStatus.COMPENSATED)
+        return True
+
+
+saga_orchestrator = SagaOrchestrator(SagaJournal(SAGA_JOURNAL_FILE))
@@ -1,13 +1,15 @@
-from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi.exceptions import HTTPException as FastAPIHTTPException
 from fastapi.exceptions import RequestValidationError
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from core.fastapi import FastAPI
+from core.fastapi.admission import admission_controller
+from core.fastapi.auth import key_set
+from core.fastapi.compression import compression
 from core.fastapi.exception import FastAPIError
-from core.fastapi.middleware import ParseRequestMiddleware
+from core.fastapi.middleware import GatewayMiddleware
+from core.fastapi.ratelimit import rate_limiter
 from core.handler import (
     base_exception_handler,
     fastapi_exception_handler,
@@ -15,15 +17,45 @@ from core.handler import (
     not_implemented_exception_handler,
     request_validation_exception_handler,
 )
+from core.httpx.breaker import circuit_breakers
+from core.httpx.cache import response_cache
+from core.httpx.client import clients
+from core.httpx.discovery import upstream_registry
+from core.metrics import CONTENT_TYPE, metrics
+from core.proxy import ProxyConfig
 from core.response import build_default_responses
-from settings import API_DOCS, API_VERSION, APP_TITLE, APP_URL_VERSION, ORIGIN_REGEX
+from core.saga import saga_orchestrator
+from settings import (
+    API_DOCS,
+    API_VERSION,
+    APP_TITLE,
+    APP_URL_VERSION,
+    ORIGIN_REGEX,
+    PROXY_CONFIG_FILE,
+)
 from settings.logging import DictConfigurator
 
 _default_fastapi_parameters = {
     'title': APP_TITLE,
     'version': API_VERSION,
-    'on_startup': [lambda: DictConfigurator().configure()],
+    'on_startup': [
+        lambda: DictConfigurator().configure(),
+        clients.startup,
+        metrics.startup,
+        admission_controller.startup,
+        key_set.startup,
+        upstream_registry.startup,
+        saga_orchestrator.startup,
+    ],
+    'on_shutdown': [
+        clients.shutdown,
+        metrics.shutdown,
+        admission_controller.shutdown,
+        key_set.shutdown,
+        upstream_registry.shutdown,
+    ],
     'responses': build_default_responses(),
+    'default_response_class': ORJSONResponse,
 }
 if not API_DOCS:
     app = FastAPI(**_default_fastapi_parameters, openapi_url=None, docs=None, redoc_url=None)
@@ -31,14 +63,17 @@ else:
     app = FastAPI(**_default_fastapi_parameters)
 
 
-app.add_middleware(ParseRequestMiddleware)
-app.add_middleware(CorrelationIdMiddleware)
 app.add_middleware(
-    CORSMiddleware,
-    allow_origin_regex=ORIGIN_REGEX,
-    allow_credentials=True,
-    allow_methods=['*'],
-    allow_headers=['*'],
+    GatewayMiddleware,
+    cors={
+        'allow_origin_regex': ORIGIN_REGEX,
+        'allow_credentials': True,
+        'allow_methods': ['*'],
+        'allow_headers': ['*'],
+    },
+    admission=admission_controller,
+    rate_limiter=rate_limiter,
+    compression=compression,
 )
 app.add_exception_handler(FastAPIHTTPException, http_exception_handler)
 app.add_exception_handler(StarletteHTTPException, http_exception_handler)
@@ -46,12 +81,37 @@ app.add_exception_handler(RequestValidationError, request_validation_exception_h
 app.add_exception_handler(NotImplementedError, not_implemented_exception_handler)
 app.add_exception_handler(FastAPIError, fastapi_exception_handler)
 app.add_exception_handler(Exception, base_exception_handler)
+
+proxy_config = ProxyConfig.from_yaml(PROXY_CONFIG_FILE)
+for name, upstream_config in proxy_config.upstreams.items():
+    clients.register(name, upstream_config)
+app.add_proxy(proxy_config.routes)
 app.add_versioning(APP_URL_VERSION)
 
 
 app.add_api_route(
     '/',
-    lambda: JSONResponse({'APP': APP_TITLE}),
+    lambda: ORJSONResponse({'APP': APP_TITLE}),
+    methods=['GET'],
+    include_in_schema=False,
+)
+app.add_api_route(
+    '/upstreams',
+    lambda: ORJSONResponse(
+        {
+            'circuit_breakers': circuit_breakers.snapshot(),
+            'pools': clients.pools(),
+            'response_cache': response_cache.stats(),
+            'services': upstream_registry.snapshot(),
+        }
+    ),
     methods=['GET'],
     include_in_schema=False,
 )
+
+
+async def expose_metrics() -> Response:
+    return Response(await metrics.expose(), media_type=CONTENT_TYPE)
+
+
+app.add_api_route('/metrics', expose_metrics, methods=['GET'], include_in_schema=False)
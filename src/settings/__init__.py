@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 APP_TITLE = os.getenv('APP') or 'ECIP API Gateway'
 API_VERSION = os.getenv('API_VERSION') or '?'
@@ -15,3 +16,192 @@ IS_DEBUG: bool = True if DEBUG else False
 IS_TEST: bool = True if TEST else False
 
 TIMEOUT_SECONDS: int = int(os.getenv('TIMEOUT_SECOND') or '60')
+
+# server of `cli.py serve`, the workers are sized from the CPUs of the container when 0
+SERVER_HOST = os.getenv('SERVER_HOST') or '0.0.0.0'
+SERVER_PORT: int = int(os.getenv('SERVER_PORT') or '8000')
+GUNICORN_WORKERS: int = int(os.getenv('GUNICORN_WORKERS') or '0')
+SERVER_BACKLOG: int = int(os.getenv('SERVER_BACKLOG') or '2048')
+SERVER_KEEPALIVE_SECONDS: int = int(os.getenv('SERVER_KEEPALIVE_SECONDS') or '5')
+# connections + requests per worker answered with 503 above it, unlimited when 0
+SERVER_LIMIT_CONCURRENCY: int = int(os.getenv('SERVER_LIMIT_CONCURRENCY') or '0')
+# workers are gracefully restarted after max requests + random(0, jitter), never when 0
+SERVER_MAX_REQUESTS: int = int(os.getenv('SERVER_MAX_REQUESTS') or '10000')
+SERVER_MAX_REQUESTS_JITTER: int = int(os.getenv('SERVER_MAX_REQUESTS_JITTER') or '1000')
+# every worker also listens on its own SO_REUSEPORT socket, the kernel spreads the connections.
+# The connections queued on the socket of a worker restarted after max requests are reset,
+# unless net.ipv4.tcp_migrate_req=1 (Linux 5.14+)
+SERVER_REUSE_PORT: bool = True if os.getenv('SERVER_REUSE_PORT', '').lower() == 'true' else False
+
+# admission control of each worker: requests are rejected with 503 before their body is read
+# once the in-flight requests or the event loop lag exceed the share of their priority
+ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv('ADMISSION_MAX_IN_FLIGHT') or '0')  # 0: unlimited
+ADMISSION_MAX_LOOP_LAG_SECONDS: float = float(os.getenv('ADMISSION_MAX_LOOP_LAG_SECONDS') or '0.25')
+ADMISSION_LAG_INTERVAL_SECONDS: float = float(os.getenv('ADMISSION_LAG_INTERVAL_SECONDS') or '0.05')
+# `path=priority` (critical, high, normal or low), `/*` suffixed paths match as prefixes
+ADMISSION_ROUTE_PRIORITIES: dict[str, str] = dict(
+    rule.strip().split('=', 1)
+    for rule in (
+        os.getenv('ADMISSION_ROUTE_PRIORITIES')
+        or '/=critical,/metrics=critical,/upstreams=critical'
+    ).split(',')
+    if rule.strip()
+)
+ADMISSION_DEFAULT_PRIORITY = os.getenv('ADMISSION_DEFAULT_PRIORITY') or 'normal'
+
+# token buckets per client (verified bearer subject, IP otherwise) and rule, `path=rate:burst`
+# with the rate in requests per second, `/*` suffixed paths match as prefixes, e.x.:
+# `/v1/*=20:40,/v1/orders=5:10`, disabled when empty
+RATE_LIMIT_RULES: dict[str, str] = dict(
+    rule.strip().split('=', 1)
+    for rule in (os.getenv('RATE_LIMIT_RULES') or '').split(',')
+    if rule.strip()
+)
+# the workers of the host share the buckets through this file, e.x. under /dev/shm, they are per
+# process when unset
+RATE_LIMIT_SHARED_FILE = os.getenv('RATE_LIMIT_SHARED_FILE') or None
+RATE_LIMIT_MAX_KEYS: int = int(os.getenv('RATE_LIMIT_MAX_KEYS') or '65536')
+# proxies in front of the gateway appending to X-Forwarded-For, e.x. 1 behind the load balancer.
+# Anonymous clients are keyed on the address the outermost of them saw, the peer address when 0
+RATE_LIMIT_TRUSTED_PROXIES: int = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES') or '0')
+
+# format and write log records on a background thread, enabled by default outside local env
+LOGGING_ASYNC: bool = (
+    True if (os.getenv('LOGGING_ASYNC') or str(not IS_LOCAL_ENV)).lower() == 'true' else False
+)
+LOGGING_QUEUE_SIZE: int = int(os.getenv('LOGGING_QUEUE_SIZE') or '10000')
+LOGGING_BATCH_SIZE: int = int(os.getenv('LOGGING_BATCH_SIZE') or '256')
+
+REQUEST_BODY_STREAMING: bool = (
+    True if os.getenv('REQUEST_BODY_STREAMING', '').lower() == 'true' else False
+)
+REQUEST_BODY_PREVIEW_BYTES: int = int(os.getenv('REQUEST_BODY_PREVIEW_BYTES') or '4096')
+REQUEST_BODY_PREVIEW_CONTENT_TYPES: tuple[str, ...] = tuple(
+    content_type.strip()
+    for content_type in (
+        os.getenv('REQUEST_BODY_PREVIEW_CONTENT_TYPES')
+        or 'application/json,application/x-www-form-urlencoded,text/'
+    ).split(',')
+    if content_type.strip()
+)
+
+# share of successful requests whose http context is attached to their log records, records of
+# WARNING and above and access logs of 4xx / 5xx responses always get it
+HTTP_CAPTURE_SAMPLE_RATE: float = float(os.getenv('HTTP_CAPTURE_SAMPLE_RATE') or '1')
+# captured headers, all when empty
+HTTP_CAPTURE_ALLOWED_HEADERS: frozenset[str] = frozenset(
+    header.strip().lower()
+    for header in (os.getenv('HTTP_CAPTURE_ALLOWED_HEADERS') or '').split(',')
+    if header.strip()
+)
+HTTP_CAPTURE_DENIED_HEADERS: frozenset[str] = frozenset(
+    header.strip().lower()
+    for header in (os.getenv('HTTP_CAPTURE_DENIED_HEADERS') or '').split(',')
+    if header.strip()
+)
+HTTP_CAPTURE_REDACTED_HEADERS: frozenset[str] = frozenset(
+    header.strip().lower()
+    for header in (
+        os.getenv('HTTP_CAPTURE_REDACTED_HEADERS')
+        or 'authorization,proxy-authorization,cookie,set-cookie,x-api-key'
+    ).split(',')
+    if header.strip()
+)
+
+# bearer tokens are verified locally against the JWKS of a file or an URL, refreshed periodically
+AUTH_JWKS = os.getenv('AUTH_JWKS') or None
+AUTH_JWKS_REFRESH_SECONDS: float = float(os.getenv('AUTH_JWKS_REFRESH_SECONDS') or '300')
+AUTH_ALGORITHMS: tuple[str, ...] = tuple(
+    algorithm.strip()
+    for algorithm in (os.getenv('AUTH_ALGORITHMS') or 'RS256').split(',')
+    if algorithm.strip()
+)
+AUTH_ISSUER = os.getenv('AUTH_ISSUER') or None
+AUTH_AUDIENCE = os.getenv('AUTH_AUDIENCE') or None
+AUTH_LEEWAY_SECONDS: int = int(os.getenv('AUTH_LEEWAY_SECONDS') or '30')
+# verified claims are cached per token until its `exp`, at most for the TTL
+AUTH_TOKEN_CACHE_SIZE: int = int(os.getenv('AUTH_TOKEN_CACHE_SIZE') or '10000')
+AUTH_TOKEN_CACHE_SECONDS: float = float(os.getenv('AUTH_TOKEN_CACHE_SECONDS') or '300')
+
+# response encodings by preference, `br` / `zstd` only when `brotli` / `zstandard` are installed,
+# disabled when empty
+COMPRESSION_ENCODINGS: tuple[str, ...] = tuple(
+    encoding.strip().lower()
+    for encoding in (os.getenv('COMPRESSION_ENCODINGS') or 'br,zstd,gzip').split(',')
+    if encoding.strip()
+)
+COMPRESSION_MINIMUM_BYTES: int = int(os.getenv('COMPRESSION_MINIMUM_BYTES') or '1024')
+COMPRESSION_CONTENT_TYPES: tuple[str, ...] = tuple(
+    content_type.strip()
+    for content_type in (
+        os.getenv('COMPRESSION_CONTENT_TYPES')
+        or 'application/json,application/javascript,application/xml,image/svg+xml,text/'
+    ).split(',')
+    if content_type.strip()
+)
+COMPRESSION_GZIP_LEVEL: int = int(os.getenv('COMPRESSION_GZIP_LEVEL') or '6')
+COMPRESSION_BROTLI_QUALITY: int = int(os.getenv('COMPRESSION_BROTLI_QUALITY') or '4')
+COMPRESSION_ZSTD_LEVEL: int = int(os.getenv('COMPRESSION_ZSTD_LEVEL') or '3')
+# chunks at least this large are compressed in the thread pool instead of the event loop
+COMPRESSION_THREAD_BYTES: int = int(os.getenv('COMPRESSION_THREAD_BYTES') or str(64 * 1024))
+
+UPSTREAM_MAX_CONNECTIONS: int = int(os.getenv('UPSTREAM_MAX_CONNECTIONS') or '100')
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = int(
+    os.getenv('UPSTREAM_MAX_KEEPALIVE_CONNECTIONS') or '20'
+)
+# HTTP/2 to the upstreams (needs `h2`), `http://` upstreams are then expected to speak h2c, the
+# pool of each upstream is configured in `proxy_conf.yaml`
+UPSTREAM_HTTP2: bool = True if os.getenv('UPSTREAM_HTTP2', '').lower() == 'true' else False
+# seconds a request waits for a connection of a saturated pool, the upstream timeout when 0
+UPSTREAM_POOL_TIMEOUT_SECONDS: float = float(os.getenv('UPSTREAM_POOL_TIMEOUT_SECONDS') or '0')
+
+# service name -> endpoints, reloaded when the file changes, see `core.httpx.discovery`. The file
+# is deployment config, kept in `configs/` at the root of the repository
+UPSTREAM_REGISTRY_FILE = os.getenv('UPSTREAM_REGISTRY_FILE') or os.path.normpath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'configs', 'upstream_registry.yaml')
+)
+UPSTREAM_REGISTRY_CHECK_SECONDS: float = float(os.getenv('UPSTREAM_REGISTRY_CHECK_SECONDS') or '1')
+# round_robin, least_outstanding or p2c, unless set per service in the registry
+UPSTREAM_BALANCER = os.getenv('UPSTREAM_BALANCER') or 'round_robin'
+# resolved addresses of the upstream hosts are kept for the TTL, failed lookups for the negative one
+DNS_CACHE_SECONDS: float = float(os.getenv('DNS_CACHE_SECONDS') or '30')
+DNS_NEGATIVE_CACHE_SECONDS: float = float(os.getenv('DNS_NEGATIVE_CACHE_SECONDS') or '5')
+
+PROXY_CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'proxy_conf.yaml')
+
+RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv('RESPONSE_CACHE_MAX_BYTES') or str(64 * 1024 * 1024))
+RESPONSE_CACHE_MAX_ENTRY_BYTES: int = int(
+    os.getenv('RESPONSE_CACHE_MAX_ENTRY_BYTES') or str(1024 * 1024)
+)
+RESPONSE_CACHE_VARY_HEADERS: tuple[str, ...] = tuple(
+    header.strip().lower()
+    for header in (
+        os.getenv('RESPONSE_CACHE_VARY_HEADERS') or 'accept,accept-encoding,accept-language'
+    ).split(',')
+    if header.strip()
+)
+
+CIRCUIT_BREAKER_FAILURE_RATE: float = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE') or '0.5')
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS: float = float(
+    os.getenv('CIRCUIT_BREAKER_SLOW_CALL_SECONDS') or str(TIMEOUT_SECONDS / 2)
+)
+CIRCUIT_BREAKER_MINIMUM_CALLS: int = int(os.getenv('CIRCUIT_BREAKER_MINIMUM_CALLS') or '20')
+CIRCUIT_BREAKER_WINDOW_SECONDS: int = int(os.getenv('CIRCUIT_BREAKER_WINDOW_SECONDS') or '10')
+CIRCUIT_BREAKER_OPEN_SECONDS: float = float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS') or '30')
+CIRCUIT_BREAKER_HALF_OPEN_CALLS: int = int(os.getenv('CIRCUIT_BREAKER_HALF_OPEN_CALLS') or '5')
+UPSTREAM_MAX_CONCURRENCY: int = int(os.getenv('UPSTREAM_MAX_CONCURRENCY') or '100')
+
+RETRY_MAX_ATTEMPTS: int = int(os.getenv('RETRY_MAX_ATTEMPTS') or '3')
+RETRY_BUDGET_RATIO: float = float(os.getenv('RETRY_BUDGET_RATIO') or '0.1')
+
+SAGA_JOURNAL_FILE = os.getenv('SAGA_JOURNAL_FILE') or os.path.join(
+    tempfile.gettempdir(), 'saga_journal.sqlite3'
+)
+SAGA_COMPENSATION_ATTEMPTS: int = int(os.getenv('SAGA_COMPENSATION_ATTEMPTS') or '3')
+
+# directory where the gunicorn workers share their metrics, metrics are per process when unset
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR') or None
+METRICS_FLUSH_SECONDS: float = float(os.getenv('METRICS_FLUSH_SECONDS') or '1')
+
+# entries memoized by each of the phone number / datetime / date validators of core.pydantic.field
+FIELD_VALIDATOR_CACHE_SIZE: int = int(os.getenv('FIELD_VALIDATOR_CACHE_SIZE') or '4096')
@@ -1,15 +1,40 @@
+import atexit
+import os
+import threading
 import urllib
-from logging import CRITICAL, DEBUG, ERROR, INFO, WARNING, getLevelName, getLogger
+from logging import (
+    CRITICAL,
+    DEBUG,
+    ERROR,
+    INFO,
+    WARNING,
+    Handler,
+    LogRecord,
+    StreamHandler,
+    getLevelName,
+    getLogger,
+)
 from logging.config import DictConfigurator as _DictConfigurator
+from queue import Empty, Full, Queue
+from typing import Optional
 
 import click
 import gunicorn.glogging
+import orjson
 import uvicorn.protocols.utils
 import yaml
+from pythonjsonlogger.jsonlogger import JsonEncoder
 from pythonjsonlogger.jsonlogger import JsonFormatter as _JsonFormatter
 from uvicorn.logging import AccessFormatter, ColourizedFormatter, DefaultFormatter
 
-from . import IS_DEBUG, IS_LOCAL_ENV, LOGGING_CONFIG_FILE
+from . import (
+    IS_DEBUG,
+    IS_LOCAL_ENV,
+    LOGGING_ASYNC,
+    LOGGING_BATCH_SIZE,
+    LOGGING_CONFIG_FILE,
+    LOGGING_QUEUE_SIZE,
+)
 
 
 def http_status_code_to_log_level(code: int) -> int:
@@ -32,6 +57,140 @@ def overwride_get_path_with_query_string(scope) -> str:
     return path_with_query_string
 
 
+class LogListener:
+    """
+    Formats and writes the records queued by `QueueLogHandler`s on a background thread, so
+    logging never blocks the event loop. Records are written in batches, one write and flush per
+    stream per batch. When the queue is full, records are dropped (and counted) instead of
+    blocking the caller.
+    """
+
+    def __init__(self, queue_size: int = LOGGING_QUEUE_SIZE, batch_size: int = LOGGING_BATCH_SIZE):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.enqueued = 0
+        self.dropped = 0
+        self._queue: Queue = Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='log-listener', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write the queued records, then stop the thread
+        """
+
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def put(self, handler: Handler, record: LogRecord) -> None:
+        try:
+            self._queue.put_nowait((handler, record))
+        except Full:
+            self.dropped += 1
+        else:
+            self.enqueued += 1
+
+    def stats(self) -> dict:
+        return {'queued': self._queue.qsize(), 'enqueued': self.enqueued, 'dropped': self.dropped}
+
+    def after_fork_in_child(self) -> None:
+        # neither the thread nor the state of the queue locks survive a fork (gunicorn workers)
+        running = self._thread is not None
+        self._queue = Queue(self.queue_size)
+        self._thread = None
+        if running:
+            self.start()
+
+    def _run(self) -> None:
+        queue_ = self._queue
+        while True:
+            batch = [queue_.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue_.get_nowait())
+                except Empty:
+                    break
+
+            self._write([item for item in batch if item is not None])
+            if None in batch:
+                return
+
+    @staticmethod
+    def _write(batch: list[tuple[Handler, LogRecord]]) -> None:
+        streams: dict[StreamHandler, tuple[list[str], LogRecord]] = {}
+        for handler, record in batch:
+            try:
+                if isinstance(handler, StreamHandler):
+                    lines, _ = streams.setdefault(handler, ([], record))
+                    lines.append(handler.format(record) + handler.terminator)
+                else:
+                    handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+        for handler, (lines, record) in streams.items():
+            handler.acquire()
+            try:
+                handler.stream.write(''.join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(record)
+            finally:
+                handler.release()
+
+
+SCALAR_TYPES = (str, int, float, type(None))
+
+
+class QueueLogHandler(Handler):
+    """
+    Runs the filters of `handler` in the emitting thread, since they read context variables (the
+    correlation id, the http context), then hands the record to the listener thread.
+    """
+
+    def __init__(self, handler: Handler, listener: LogListener):
+        super().__init__(handler.level)
+        self.handler = handler
+        self.listener = listener
+        self.filters, handler.filters = handler.filters, []
+
+    def handle(self, record: LogRecord) -> bool:
+        # the queue is thread-safe, skip the handler lock
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+
+        return rv
+
+    def emit(self, record: LogRecord) -> None:
+        # like `QueueHandler.prepare`, merge the arguments now, they may be mutated or no longer
+        # safe to read once the listener formats the record. Scalar arguments are kept, since the
+        # access formatters unpack them, e.g. the status code of `uvicorn.access`.
+        args = record.args
+        if args and not (
+            isinstance(args, tuple) and all(isinstance(arg, SCALAR_TYPES) for arg in args)
+        ):
+            try:
+                record.msg = record.getMessage()
+            except Exception:
+                self.handleError(record)
+                return
+            record.args = None
+
+        self.listener.put(self.handler, record)
+
+
+log_listener = LogListener()
+atexit.register(log_listener.stop)
+os.register_at_fork(after_in_child=log_listener.after_fork_in_child)
+
+
 class DictConfigurator(_DictConfigurator):
     def __init__(self):
         # To start Uvicorn from the command line, the --log-format parameter must be set to preload the source code to complete the Monkey-Patch
@@ -48,6 +207,23 @@ class DictConfigurator(_DictConfigurator):
 
             super().__init__(config)
 
+    def configure(self):
+        # flush the records queued for the handlers about to be replaced
+        log_listener.stop()
+        super().configure()
+        if not LOGGING_ASYNC:
+            return
+
+        queue_handlers: dict[Handler, QueueLogHandler] = {}
+        loggers = [getLogger(), *(getLogger(name) for name in self.config.get('loggers', {}))]
+        for logger in loggers:
+            for i, handler in enumerate(logger.handlers):
+                if handler not in queue_handlers:
+                    queue_handlers[handler] = QueueLogHandler(handler, log_listener)
+                logger.handlers[i] = queue_handlers[handler]
+
+        log_listener.start()
+
 
 class UvicornFormatter(DefaultFormatter, AccessFormatter):
     status_code_colours = {
@@ -85,6 +261,21 @@ class UvicornFormatter(DefaultFormatter, AccessFormatter):
 
 
 class JsonFormatter(_JsonFormatter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._orjson_default = self.json_default or JsonEncoder().default
+
+    def jsonify_log_record(self, log_record):
+        try:
+            return orjson.dumps(  # pylint:disable=no-member
+                log_record,
+                default=self._orjson_default,
+                option=orjson.OPT_NON_STR_KEYS,  # pylint:disable=no-member
+            ).decode()
+        except orjson.JSONEncodeError:  # pylint:disable=no-member
+            # e.g. integers over 64 bits
+            return super().jsonify_log_record(log_record)
+
     def format(self, record):
         if record.name == 'uvicorn.access':
             _, _, _, _, status_code = record.args
@@ -0,0 +1,201 @@
+import importlib.util
+import math
+import os
+import socket
+from typing import Optional
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.util import import_app
+from uvicorn.workers import UvicornWorker as _UvicornWorker
+
+from settings import (
+    GUNICORN_WORKERS,
+    SERVER_BACKLOG,
+    SERVER_HOST,
+    SERVER_KEEPALIVE_SECONDS,
+    SERVER_LIMIT_CONCURRENCY,
+    SERVER_MAX_REQUESTS,
+    SERVER_MAX_REQUESTS_JITTER,
+    SERVER_PORT,
+    SERVER_REUSE_PORT,
+    TIMEOUT_SECONDS,
+)
+
+CGROUP_DIR = '/sys/fs/cgroup'
+# cpu.shares given by docker when the container has no CPU reservation
+DEFAULT_CPU_SHARES = 1024
+DEFAULT_CPU_WEIGHT = 100
+
+
+def read_cgroup(*path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(CGROUP_DIR, *path), encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """
+    CPUs of the CFS quota of the container, e.x. `--cpus 1.5`
+    """
+
+    if (cpu_max := read_cgroup('cpu.max')) is not None:  # cgroup v2
+        quota, period = cpu_max.split()
+        return int(quota) / int(period) if quota != 'max' else None
+
+    quota, period = read_cgroup('cpu', 'cpu.cfs_quota_us'), read_cgroup('cpu', 'cpu.cfs_period_us')
+    if quota is not None and period is not None and int(quota) > 0:
+        return int(quota) / int(period)
+
+    return None
+
+
+def cgroup_cpu_shares() -> Optional[float]:
+    """
+    CPUs of the CPU reservation of the container, e.x. the `cpu` units of an ECS task definition
+    (1024 units per CPU), they only set the relative weight of the container.
+    """
+
+    if (weight := read_cgroup('cpu.weight')) is not None:  # cgroup v2
+        if int(weight) == DEFAULT_CPU_WEIGHT:
+            return None
+        # inverse of the shares to weight conversion of the container runtimes
+        return (2 + (int(weight) - 1) * 262142 / 9999) / 1024
+
+    shares = read_cgroup('cpu', 'cpu.shares')
+    if shares is None or int(shares) == DEFAULT_CPU_SHARES:
+        return None
+
+    return int(shares) / 1024
+
+
+def available_cpus() -> float:
+    cpus = [float(len(os.sched_getaffinity(0)))]
+    for limit in (cgroup_cpu_quota(), cgroup_cpu_shares()):
+        if limit is not None:
+            cpus.append(limit)
+
+    return min(cpus)
+
+
+def default_workers() -> int:
+    """
+    One worker per available CPU, a fraction of CPU still gets one.
+    """
+
+    return max(1, math.ceil(available_cpus()))
+
+
+def reuse_port_sockets(listeners: list, backlog: int) -> list[socket.socket]:
+    """
+    A SO_REUSEPORT socket of the worker per TCP listener of the arbiter. The kernel spreads the
+    new connections evenly over the sockets, instead of waking up every worker on a shared one.
+
+    The listener of the arbiter is part of the same group, so the workers keep accepting on it,
+    the connections the kernel assigns to it would never be served otherwise. With n workers,
+    1 / (n + 1) of the connections still wake up every worker.
+    """
+
+    sockets = []
+    for listener in listeners:
+        if listener.family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+
+        sock = socket.socket(listener.family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(listener.getsockname())
+        sock.listen(backlog)
+        sock.setblocking(False)
+        sockets.append(sock)
+
+    return sockets
+
+
+def migrates_requests() -> bool:
+    """
+    Whether the kernel hands the connections queued on a closed SO_REUSEPORT socket to the
+    other sockets of its group, instead of resetting them
+    """
+
+    try:
+        with open('/proc/sys/net/ipv4/tcp_migrate_req', encoding='ascii') as f:
+            return f.read().strip() == '1'
+    except OSError:
+        return False
+
+
+class UvicornWorker(_UvicornWorker):
+    """
+    uvloop and httptools are used when installed (`pip install uvicorn[standard]`), asyncio and
+    h11 otherwise.
+    """
+
+    CONFIG_KWARGS = {
+        'loop': 'auto',
+        'http': 'auto',
+        'limit_concurrency': SERVER_LIMIT_CONCURRENCY or None,
+    }
+
+    def init_process(self) -> None:
+        self.log.info(
+            'Booting worker with loop=%s http=%s',
+            'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio',
+            'httptools' if importlib.util.find_spec('httptools') else 'h11',
+        )
+        super().init_process()
+
+    async def _serve(self) -> None:
+        if self.cfg.reuse_port and hasattr(socket, 'SO_REUSEPORT'):
+            # the arbiter's sockets are kept, they get the connections the kernel assigns them
+            self.sockets = [*self.sockets, *reuse_port_sockets(self.sockets, self.cfg.backlog)]
+            if self.cfg.max_requests > 0 and not migrates_requests():
+                self.log.warning(
+                    'Connections queued on the socket of a worker restarted after max_requests '
+                    'are reset, set net.ipv4.tcp_migrate_req=1 (Linux 5.14+) to hand them to '
+                    'the other workers'
+                )
+
+        await super()._serve()
+
+
+class GunicornApplication(BaseApplication):
+    """
+    gunicorn started from Python, e.x.:
+        GunicornApplication('main:app', {'bind': '0.0.0.0:8000', 'workers': 2}).run()
+    """
+
+    def __init__(self, app_uri: str, options: dict):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def init(self, parser, opts, args) -> None:
+        pass
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return import_app(self.app_uri)
+
+
+def gunicorn_options(
+    host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = GUNICORN_WORKERS
+) -> dict:
+    return {
+        'bind': f'{host}:{port}',
+        'workers': workers or default_workers(),
+        'worker_class': 'settings.server.UvicornWorker',
+        'logger_class': 'settings.logging.GunicornLogger',
+        'backlog': SERVER_BACKLOG,
+        'keepalive': SERVER_KEEPALIVE_SECONDS,
+        'timeout': TIMEOUT_SECONDS,
+        'graceful_timeout': TIMEOUT_SECONDS,
+        'max_requests': SERVER_MAX_REQUESTS,
+        'max_requests_jitter': SERVER_MAX_REQUESTS_JITTER,
+        'reuse_port': SERVER_REUSE_PORT,
+        'pythonpath': os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    }
@@ -4,6 +4,11 @@ from httpx import AsyncClient
 from main import app
 
 
+@pytest.fixture(scope='session')
+def anyio_backend():
+    return 'asyncio'
+
+
 @pytest.fixture(scope='session')
 async def client():
     async with AsyncClient(app=app, base_url='http://test/v1') as ac:
@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import traceback
+
+import pytest
+
+from core.aggregation import Aggregation
+from core.exception import UpstreamException
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_run_dependent_calls_concurrently():
+    started = []
+    aggregation = Aggregation()
+
+    @aggregation.call('member')
+    async def member(member_id: int):
+        started.append('member')
+        await asyncio.sleep(0.01)
+        return {'id': member_id}
+
+    @aggregation.call('settings')
+    async def settings(member_id: int):
+        started.append('settings')
+        await asyncio.sleep(0.01)
+        return {'member_id': member_id}
+
+    @aggregation.call('orders', depends_on=['member'])
+    async def orders(member: dict):
+        started.append('orders')
+        return [member['id']]
+
+    result = await aggregation.run(member_id=1)
+
+    assert started == ['member', 'settings', 'orders']
+    assert result['orders'] == [1]
+    assert result['settings'] == {'member_id': 1}
+
+
+async def test_skip_failed_calls_and_their_dependents():
+    aggregation = Aggregation()
+
+    @aggregation.call('member', on_error='skip', default={})
+    async def member():
+        raise UpstreamException('member service unavailable')
+
+    @aggregation.call('orders', depends_on=['member'], on_error='skip', default=[])
+    async def orders(member: dict):
+        return [member['id']]
+
+    result = await aggregation.run()
+
+    assert result.results == {'member': {}, 'orders': []}
+    assert set(result.errors) == {'member', 'orders'}
+
+
+async def test_time_out_calls():
+    aggregation = Aggregation()
+
+    @aggregation.call('slow', timeout=0.01)
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(UpstreamException) as exc_info:
+        await aggregation.run()
+    assert exc_info.value.http_status == 504
+
+
+@pytest.mark.parametrize('first_failing', ['member', 'orders'])
+async def test_raise_the_first_error_with_the_others_chained(first_failing):
+    errors = {
+        'member': UpstreamException('member service unavailable'),
+        'orders': RuntimeError('orders failed'),
+    }
+    aggregation = Aggregation()
+
+    async def fail(name: str):
+        if name == first_failing:
+            raise errors[name]
+        try:
+            await asyncio.sleep(1)
+        finally:
+            # cancelled along with the group once the first call failed, failing as well
+            raise errors[name]
+
+    aggregation.call('member')(functools.partial(fail, 'member'))
+    aggregation.call('orders')(functools.partial(fail, 'orders'))
+
+    with pytest.raises(type(errors[first_failing])) as exc_info:
+        await aggregation.run()
+
+    assert exc_info.value is errors[first_failing]
+    group = exc_info.value.__cause__
+    assert isinstance(group, ExceptionGroup)
+    assert set(group.exceptions) == set(errors.values())
+    assert 'orders failed' in ''.join(traceback.format_exception(exc_info.value))
+
+
+async def test_reject_arguments_named_after_calls():
+    aggregation = Aggregation()
+
+    @aggregation.call('member')
+    async def member():
+        return {}
+
+    @aggregation.call('orders', depends_on=['member'])
+    async def orders(member: dict):
+        return []
+
+    with pytest.raises(ValueError, match='member'):
+        await aggregation.run(member={'id': 1})
+
+
+@pytest.mark.parametrize(
+    'depends_on, message',
+    [({'a': ['b'], 'b': ['a']}, 'cycle'), ({'a': ['c'], 'b': []}, 'unknown')],
+)
+def test_validate_dependencies(depends_on, message):
+    async def func():
+        return None
+
+    aggregation = Aggregation()
+    for name, dependencies in depends_on.items():
+        aggregation.call(name, depends_on=dependencies)(func)
+
+    with pytest.raises(ValueError, match=message):
+        aggregation.validate()
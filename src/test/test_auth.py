@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import hmac
+import time
+
+import httpx
+import orjson
+import pytest
+from fastapi import Depends
+
+from core.exception import UnauthorizedException
+from core.fastapi import FastAPI
+from core.fastapi.auth import BearerClaims, JsonWebKey, KeySet, TokenCache, TokenVerifier
+from core.fastapi.exception import FastAPIError
+from core.handler import fastapi_exception_handler
+
+pytestmark = pytest.mark.anyio
+
+SECRET = b'secret'
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def sign(claims: dict, secret: bytes = SECRET, kid: str = 'main') -> str:
+    header = b64encode(orjson.dumps({'alg': 'HS256', 'kid': kid}))  # pylint:disable=no-member
+    payload = b64encode(orjson.dumps(claims))  # pylint:disable=no-member
+    signing_input = f'{header}.{payload}'.encode()
+    return (
+        f'{header}.{payload}.{b64encode(hmac.new(secret, signing_input, hashlib.sha256).digest())}'
+    )
+
+
+@pytest.fixture(name='verifier')
+def fixture_verifier():
+    key_set = KeySet(source=None)
+    key_set.keys = {'main': JsonWebKey('main', 'oct', 'HS256', secret=SECRET)}
+    return TokenVerifier(
+        key_set, ('HS256',), issuer='gateway', audience='api', leeway=0, cache=TokenCache()
+    )
+
+
+@pytest.fixture(name='auth_client')
+async def fixture_auth_client(verifier):
+    app = FastAPI()
+    app.add_exception_handler(FastAPIError, fastapi_exception_handler)
+
+    @app.get('/me')
+    async def get_me(claims: dict = Depends(BearerClaims(verifier))):
+        return {'sub': claims['sub']}
+
+    async with httpx.AsyncClient(app=app, base_url='http://test') as ac:
+        yield ac
+
+
+def build_claims(**overrides) -> dict:
+    return {'sub': 'alice', 'iss': 'gateway', 'aud': 'api', 'exp': time.time() + 60, **overrides}
+
+
+async def test_verify_and_cache(verifier):
+    token = sign(build_claims())
+
+    assert (await verifier.verify(token))['sub'] == 'alice'
+    assert verifier.cached_subject(token) == 'alice'
+    assert verifier.cached_subject(sign(build_claims(sub='bob'))) is None
+
+
+@pytest.mark.parametrize(
+    'token, message',
+    [
+        (sign(build_claims(), secret=b'other'), 'Invalid token signature'),
+        (sign(build_claims(), kid='unknown'), 'Invalid token signature'),
+        (sign(build_claims(exp=time.time() - 1)), 'Token expired'),
+        (sign(build_claims(iss='other')), 'Invalid token issuer'),
+        (sign(build_claims(aud=['other'])), 'Invalid token audience'),
+        ('not.a.token', 'Malformed token'),
+    ],
+)
+async def test_reject(verifier, token, message):
+    with pytest.raises(UnauthorizedException) as e:
+        await verifier.verify(token)
+
+    assert e.value.message == message
+
+
+async def test_authenticate(auth_client):
+    response = await auth_client.get(
+        '/me', headers={'Authorization': f'Bearer {sign(build_claims())}'}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {'sub': 'alice'}
+    assert 'WWW-Authenticate' not in response.headers
+
+
+async def test_challenge_without_token(auth_client):
+    response = await auth_client.get('/me')
+
+    assert response.status_code == 401
+    assert response.json()['message'] == 'Missing bearer token'
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+
+async def test_challenge_a_rejected_token(auth_client):
+    token = sign(build_claims(exp=time.time() - 1))
+    response = await auth_client.get('/me', headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == (
+        'Bearer error="invalid_token", error_description="Token expired"'
+    )
@@ -0,0 +1,177 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.exception import UpstreamException
+from core.httpx.breaker import CircuitBreaker, CircuitState, circuit_breakers
+from core.httpx.decorator import http_error_handler
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(mocker):
+    clock = Clock()
+    mocker.patch('core.httpx.breaker.time.monotonic', clock)
+    return clock
+
+
+def call(breaker: CircuitBreaker, failed: bool) -> bool:
+    if not breaker.acquire():
+        return False
+    breaker.release(failed, 0.0)
+    return True
+
+
+def test_open_half_open_and_close(clock):
+    breaker = CircuitBreaker(
+        'member', failure_rate=0.5, minimum_calls=4, open_seconds=10, half_open_calls=2
+    )
+
+    for failed in (False, True, False):
+        assert call(breaker, failed)
+    assert breaker.state is CircuitState.CLOSED
+    assert call(breaker, True)
+    assert breaker.state is CircuitState.OPEN
+
+    assert not call(breaker, False)
+    assert breaker.rejected == 1
+
+    clock.now += 10
+    assert breaker.acquire() and breaker.acquire()
+    assert breaker.state is CircuitState.HALF_OPEN
+    # no more trial calls than `half_open_calls`
+    assert not breaker.acquire()
+    breaker.release(False, 0.0)
+    breaker.release(False, 0.0)
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.snapshot()['calls'] == 0
+
+
+def test_reopen_on_failed_trial(clock):
+    breaker = CircuitBreaker('member', failure_rate=0.5, minimum_calls=1, open_seconds=10)
+    assert call(breaker, True)
+    assert breaker.state is CircuitState.OPEN
+
+    clock.now += 10
+    assert call(breaker, True)
+    assert breaker.state is CircuitState.OPEN
+    assert not call(breaker, False)
+
+
+def test_count_slow_calls_as_failures(clock):
+    breaker = CircuitBreaker('member', minimum_calls=1, slow_call_seconds=1)
+    breaker.acquire()
+    breaker.release(False, 1.5)
+
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_bulkhead(clock):
+    breaker = CircuitBreaker('member', max_concurrency=2)
+
+    assert breaker.acquire() and breaker.acquire()
+    assert not breaker.acquire()
+    breaker.release(False, 0.0)
+    assert breaker.acquire()
+
+
+class Service:
+    __service_name__ = 'test-breaker'
+    __exception__ = UpstreamException
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    @http_error_handler
+    async def send(self):
+        if isinstance(self.outcome, BaseException):
+            raise self.outcome
+        return self.outcome
+
+
+@pytest.fixture(name='breaker')
+def fixture_breaker():
+    circuit_breakers.configure(Service.__service_name__, minimum_calls=2, failure_rate=0.5)
+    return circuit_breakers.get(Service.__service_name__)
+
+
+@pytest.mark.parametrize(
+    'outcome',
+    [
+        httpx.Response(503),
+        httpx.ConnectError('refused', request=httpx.Request('GET', 'http://member')),
+        RuntimeError('bug'),
+    ],
+    ids=['5xx response', 'connection error', 'other exception'],
+)
+async def test_count_failures_of_decorated_calls(breaker, outcome):
+    for _ in range(2):
+        try:
+            await Service(outcome).send()
+        except (UpstreamException, RuntimeError):
+            pass
+
+    assert breaker.state is CircuitState.OPEN
+    with pytest.raises(UpstreamException) as exc_info:
+        await Service(httpx.Response(200)).send()
+    assert exc_info.value.http_status == 503
+
+
+@pytest.mark.parametrize(
+    'outcome',
+    [httpx.Response(200), httpx.Response(404), asyncio.CancelledError()],
+    ids=['2xx response', '4xx response', 'cancellation'],
+)
+async def test_do_not_count_successes_or_cancellation(breaker, outcome):
+    for _ in range(3):
+        try:
+            await Service(outcome).send()
+        except asyncio.CancelledError:
+            pass
+
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.in_flight == 0
+    assert breaker.snapshot()['failures'] == 0
+
+
+def test_abandon_trial_calls(clock):
+    breaker = CircuitBreaker('member', minimum_calls=1, open_seconds=10, half_open_calls=1)
+    assert call(breaker, True)
+
+    clock.now += 10
+    assert breaker.acquire()
+    breaker.abandon()
+    # neither closed by the abandoned trial nor short of a trial slot
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert breaker.in_flight == 0
+    assert call(breaker, True)
+    assert breaker.state is CircuitState.OPEN
+
+
+async def test_do_not_close_on_cancelled_trial_calls(breaker):
+    breaker.half_open_calls = 1
+    refused = httpx.ConnectError('refused', request=httpx.Request('GET', 'http://member'))
+    for _ in range(2):
+        with pytest.raises(UpstreamException):
+            await Service(refused).send()
+    assert breaker.state is CircuitState.OPEN
+
+    breaker.opened_at -= breaker.open_seconds
+    with pytest.raises(asyncio.CancelledError):
+        await Service(asyncio.CancelledError()).send()
+
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert breaker.in_flight == 0
+    with pytest.raises(UpstreamException):
+        await Service(refused).send()
+    assert breaker.state is CircuitState.OPEN
@@ -0,0 +1,139 @@
+import httpx
+import pytest
+
+from core.httpx.cache import CacheEntry, CacheTransport, ResponseCache, response_cache
+from core.metrics import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+class Upstream:
+    def __init__(self, headers: dict, content: bytes = b'content'):
+        self.headers = headers
+        self.content = content
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        etag = self.headers.get('etag')
+        if etag is not None and request.headers.get('if-none-match') == etag:
+            return httpx.Response(304, headers=self.headers)
+
+        return httpx.Response(200, headers=self.headers, content=self.content)
+
+
+async def get(transport: CacheTransport, url: str = 'http://upstream/a', **headers) -> bytes:
+    response = await transport.handle_async_request(httpx.Request('GET', url, headers=headers))
+    content = await response.aread()
+    await response.aclose()
+    return content
+
+
+def build(headers: dict) -> tuple[CacheTransport, Upstream]:
+    upstream = Upstream(headers)
+    return CacheTransport(httpx.MockTransport(upstream), cache=ResponseCache()), upstream
+
+
+async def test_serve_fresh_response_from_cache():
+    transport, upstream = build({'cache-control': 'max-age=60'})
+
+    assert await get(transport) == b'content'
+    assert await get(transport) == b'content'
+    assert len(upstream.requests) == 1
+    assert transport.cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize(
+    'headers',
+    [
+        {'cache-control': 'max-age=60, stale-while-revalidate=soon'},
+        {'cache-control': 'max-age=60', 'content-length': 'seven'},
+        {'cache-control': 'max-age=later'},
+        {'cache-control': 'private, max-age=60'},
+        {'cache-control': 'no-store, max-age=60'},
+    ],
+)
+async def test_do_not_store_uncacheable_or_malformed_responses(headers):
+    transport, upstream = build(headers)
+
+    for _ in range(2):
+        assert await get(transport) == b'content'
+
+    assert len(upstream.requests) == 2
+    assert len(transport.cache) == 0
+
+
+async def test_do_not_share_responses_between_cookies():
+    transport, upstream = build({'cache-control': 'max-age=60'})
+
+    await get(transport, cookie='session=a')
+    await get(transport, cookie='session=b')
+    await get(transport)
+    await get(transport, cookie='session=a')
+
+    assert len(upstream.requests) == 3
+
+
+async def test_revalidate_without_changing_the_caller_request():
+    transport, upstream = build({'cache-control': 'no-cache', 'etag': '"v1"'})
+    await get(transport)
+
+    request = httpx.Request('GET', 'http://upstream/a')
+    response = await transport.handle_async_request(request)
+
+    assert await response.aread() == b'content'
+    assert upstream.requests[-1].headers['if-none-match'] == '"v1"'
+    assert 'if-none-match' not in request.headers
+    assert transport.cache.stats()['revalidations'] == 1
+
+
+def test_evict_least_recently_used_past_max_bytes():
+    cache = ResponseCache(max_bytes=250, max_entry_bytes=250)
+    for key in ('a', 'b', 'c'):
+        cache.set((key,), CacheEntry(200, [], b'x' * 100, 0, 0))
+
+    assert cache.get(('a',)) is None
+    assert cache.get(('b',)) is not None and cache.get(('c',)) is not None
+    assert cache.size == 200
+
+
+def events() -> dict[str, float]:
+    return {
+        labels[0]: value
+        for labels, value in metrics.snapshot()['response_cache_events_total']['series']
+    }
+
+
+async def test_count_the_events_in_the_metrics():
+    transport, _ = build({'cache-control': 'max-age=60'})
+    before = events()
+
+    await get(transport)
+    await get(transport)
+    # evicts the cached response and the new one
+    transport.cache.max_bytes = 0
+    transport.cache.set(('a',), CacheEntry(200, [], b'x', 0, 0))
+
+    counted = {event: value - before.get(event, 0) for event, value in events().items()}
+    assert {event: value for event, value in counted.items() if value} == {
+        'misses': 1,
+        'hits': 1,
+        'evictions': 2,
+    }
+    assert transport.cache.stats()['evictions'] == 2
+
+
+async def test_expose_the_shared_cache(client):
+    entry = CacheEntry(200, [], b'x' * 10, 0, 0)
+    response_cache.clear()
+    response_cache.set(('a',), entry)
+    try:
+        response = await client.get('http://test/upstreams')
+        snapshot = metrics.snapshot()
+    finally:
+        response_cache.clear()
+
+    assert response.json()['response_cache']['entries'] == 1
+    assert response.json()['response_cache']['bytes'] == entry.size
+    assert snapshot['response_cache_entries']['series'] == [[(), 1]]
+    assert snapshot['response_cache_bytes']['series'] == [[(), entry.size]]
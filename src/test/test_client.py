@@ -0,0 +1,255 @@
+import asyncio
+from typing import Optional
+
+import h2.config
+import h2.connection
+import h2.events
+import httpx
+import pytest
+from asgi_correlation_id.context import correlation_id
+
+from core.httpx import client as client_module
+from core.httpx.client import (
+    DEFAULT_SERVICE,
+    ClientRegistry,
+    UpstreamConfig,
+    get_session,
+    inject_request_id,
+)
+from core.metrics import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(name='registry')
+async def fixture_registry():
+    registry = ClientRegistry()
+    registry.register('member', base_url='http://member')
+    yield registry
+    await registry.shutdown()
+
+
+async def test_open_on_startup_close_on_shutdown(registry):
+    await registry.startup()
+    opened = {name: registry.get(name) for name in (DEFAULT_SERVICE, 'member')}
+    assert not any(client.is_closed for client in opened.values())
+    assert registry.get('member') is opened['member']
+    assert str(opened['member'].base_url) == 'http://member'
+
+    await registry.shutdown()
+    assert all(client.is_closed for client in opened.values())
+
+    # reopened on the next use
+    reopened = registry.get('member')
+    assert reopened is not opened['member']
+    assert not reopened.is_closed
+
+
+async def test_open_lazily(registry):
+    member = registry.get('member')
+    assert not member.is_closed
+    assert registry.get('member') is member
+
+
+async def test_register_opened_client(registry):
+    registry.register('member', base_url='http://member:8080')  # not opened yet
+    registry.get('member')
+
+    with pytest.raises(RuntimeError):
+        registry.register('member', base_url='http://other')
+
+    await registry.shutdown()
+    registry.register('member', base_url='http://other')
+    assert str(registry.get('member').base_url) == 'http://other'
+
+
+async def test_unknown_service(registry):
+    with pytest.raises(KeyError):
+        registry.get('unknown')
+
+
+async def test_get_session_yields_the_shared_client(monkeypatch, registry):
+    monkeypatch.setattr(client_module, 'clients', registry)
+
+    sessions = [get_session() for _ in range(2)]
+    shared = [await anext(session) for session in sessions]
+
+    assert shared[0] is shared[1] is registry.get()
+    for session in sessions:
+        await session.aclose()
+    # the client outlives the request
+    assert not shared[0].is_closed
+
+
+@pytest.mark.parametrize(
+    'request_id, headers, forwarded',
+    [
+        ('6b3f7a1c6f6c4b7e9d3c2f6a1b0e9d8c', {}, '6b3f7a1c6f6c4b7e9d3c2f6a1b0e9d8c'),
+        # set by the caller
+        ('6b3f7a1c6f6c4b7e9d3c2f6a1b0e9d8c', {'X-Request-ID': 'caller'}, 'caller'),
+        # outside of a request
+        (None, {}, None),
+    ],
+)
+async def test_forward_the_request_id(request_id, headers, forwarded):
+    request = httpx.Request('GET', 'http://member/a', headers=headers)
+    token = correlation_id.set(request_id)
+    try:
+        await inject_request_id(request)
+    finally:
+        correlation_id.reset(token)
+
+    assert request.headers.get('X-Request-ID') == forwarded
+
+
+async def test_clients_forward_the_request_id():
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request.headers.get('X-Request-ID'))
+        return httpx.Response(204)
+
+    client = UpstreamConfig(base_url='http://member').build_client('member')
+    # the event hooks of the client, sent through a mock pool
+    async with httpx.AsyncClient(
+        base_url=client.base_url,
+        transport=httpx.MockTransport(handler),
+        event_hooks=client.event_hooks,
+    ) as mock_client:
+        for request_id in ('6b3f7a1c6f6c4b7e9d3c2f6a1b0e9d8c', None):
+            token = correlation_id.set(request_id)
+            try:
+                await mock_client.get('/a')
+            finally:
+                correlation_id.reset(token)
+    await client.aclose()
+
+    assert sent == ['6b3f7a1c6f6c4b7e9d3c2f6a1b0e9d8c', None]
+
+
+class StandIn:
+    """
+    Local upstream answering every request after `delay` seconds, over HTTP/1.1 or, with `h2c`,
+    HTTP/2 with prior knowledge.
+    """
+
+    def __init__(self, h2c: bool = False, delay: float = 0):
+        self.h2c = h2c
+        self.delay = delay
+        self.connections = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    async def __aenter__(self) -> 'StandIn':
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            await (
+                self.serve_h2c(reader, writer) if self.h2c else self.serve_http11(reader, writer)
+            )
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_http11(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            await reader.readuntil(b'\r\n\r\n')  # requests without a body
+            await asyncio.sleep(self.delay)
+            writer.write(b'HTTP/1.1 200 OK\r\ncontent-length: 8\r\n\r\nHTTP/1.1')
+            await writer.drain()
+
+    async def serve_h2c(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        connection.initiate_connection()
+        writer.write(connection.data_to_send())
+        lock = asyncio.Lock()
+
+        async def respond(stream_id: int) -> None:
+            await asyncio.sleep(self.delay)
+            async with lock:
+                connection.send_headers(stream_id, [(':status', '200'), ('content-length', '6')])
+                connection.send_data(stream_id, b'HTTP/2', end_stream=True)
+                writer.write(connection.data_to_send())
+                await writer.drain()
+
+        responses = set()
+        while data := await reader.read(65536):
+            for event in connection.receive_data(data):
+                if isinstance(event, h2.events.StreamEnded):
+                    responses.add(asyncio.create_task(respond(event.stream_id)))
+            writer.write(connection.data_to_send())
+            await writer.drain()
+        await asyncio.gather(*responses)
+
+
+def acquire_count(upstream: str) -> int:
+    series = dict(
+        (tuple(labels), value)
+        for labels, value in metrics.snapshot()['upstream_pool_acquire_seconds']['series']
+    )
+    # the bucket counts, then the sum
+    return sum(series.get((upstream,), [0, 0])[:-1])
+
+
+async def test_speak_h2c_with_prior_knowledge(registry):
+    async with StandIn(h2c=True) as upstream:
+        registry.register('h2c', base_url=upstream.url, http2=True)
+        client = registry.get('h2c')
+
+        responses = await asyncio.gather(*(client.get('/a') for _ in range(3)))
+
+        assert [response.http_version for response in responses] == ['HTTP/2'] * 3
+        assert [response.text for response in responses] == ['HTTP/2'] * 3
+        # multiplexed on one connection
+        assert upstream.connections == 1
+        assert registry.pools() == {
+            'h2c': {'http2': True, 'max_connections': 100, 'active': 0, 'idle': 1, 'waiting': 0}
+        }
+
+
+async def test_report_requests_waiting_for_a_connection(registry):
+    before = acquire_count('saturated')
+    async with StandIn(delay=0.1) as upstream:
+        registry.register('saturated', base_url=upstream.url, max_connections=1)
+        client = registry.get('saturated')
+
+        requests = [asyncio.create_task(client.get('/a')) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert registry.pools()['saturated'] == {
+            'http2': False,
+            'max_connections': 1,
+            'active': 1,
+            'idle': 0,
+            'waiting': 1,
+        }
+        assert registry.pool_connections()[('saturated', 'waiting')] == 1
+
+        responses = await asyncio.gather(*requests)
+
+    assert [response.text for response in responses] == ['HTTP/1.1'] * 2
+    assert acquire_count('saturated') - before == 2
+
+
+async def test_time_out_waiting_for_a_connection(registry):
+    async with StandIn(delay=0.2) as upstream:
+        registry.register('timed-out', base_url=upstream.url, max_connections=1, pool_timeout=0.05)
+        client = registry.get('timed-out')
+
+        first = asyncio.create_task(client.get('/a'))
+        await asyncio.sleep(0.02)
+        with pytest.raises(httpx.PoolTimeout):
+            await client.get('/a')
+
+        assert (await first).status_code == 200
@@ -0,0 +1,193 @@
+import gzip
+import zlib
+from typing import Optional
+
+import pytest
+
+from core.fastapi.compression import ENCODERS, Compression, GzipEncoder, parse_accept_encoding
+from core.httpx.cache import CachedBody, CacheEntry, ResponseCache
+
+pytestmark = pytest.mark.anyio
+
+BODY = b'{"items": [' + b', '.join(b'{"id": %d}' % i for i in range(200)) + b']}'
+
+
+@pytest.fixture(name='encoders')
+def fixture_encoders(mocker):
+    # brotli and zstandard are optional, any encoder stands in for negotiation
+    mocker.patch.dict(ENCODERS, {'br': GzipEncoder, 'zstd': GzipEncoder})
+
+
+def start_message(status: int = 200, headers: Optional[list] = None, **extra) -> dict:
+    if headers is None:
+        headers = [(b'content-type', b'application/json')]
+    return {'type': 'http.response.start', 'status': status, 'headers': headers, **extra}
+
+
+def body_message(body: bytes, more_body: bool = False) -> dict:
+    return {'type': 'http.response.body', 'body': body, 'more_body': more_body}
+
+
+async def respond(compression: Compression, messages: list[dict]) -> list[dict]:
+    sent = []
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    responder = compression.responder(send, 'gzip')
+    for message in messages:
+        await responder(message)
+
+    return sent
+
+
+def get_headers(message: dict) -> dict[bytes, bytes]:
+    return dict(message['headers'])
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, BR;q=0.8 , *;q=0,') == {'gzip': 1.0, 'br': 0.8, '*': 0.0}
+    assert parse_accept_encoding('gzip;q=high') == {'gzip': 0.0}
+    assert not parse_accept_encoding('')
+
+
+@pytest.mark.parametrize(
+    'accept_encoding, encoding',
+    [
+        ('gzip', 'gzip'),
+        # the earliest of `encodings` on ties
+        ('gzip, br', 'br'),
+        ('gzip;q=1, br;q=0.5', 'gzip'),
+        ('*', 'br'),
+        ('br;q=0, *', 'zstd'),
+        ('*;q=0, gzip', 'gzip'),
+        ('gzip;q=0', None),
+        ('identity', None),
+        ('', None),
+    ],
+)
+@pytest.mark.usefixtures('encoders')
+def test_negotiate(accept_encoding, encoding):
+    compression = Compression(encodings=('br', 'zstd', 'gzip'))
+
+    assert compression.negotiate(accept_encoding) == encoding
+    # memoized
+    assert compression.negotiate(accept_encoding) == encoding
+
+
+@pytest.mark.parametrize(
+    'message, compressible',
+    [
+        (start_message(), True),
+        (start_message(headers=[(b'Content-Type', b'text/html; charset=utf-8')]), True),
+        (start_message(101), False),
+        (start_message(204), False),
+        (start_message(206), False),
+        (start_message(304), False),
+        (start_message(headers=[(b'content-type', b'image/png')]), False),
+        (start_message(headers=[]), False),
+        (
+            start_message(
+                headers=[(b'content-type', b'application/json'), (b'content-encoding', b'br')]
+            ),
+            False,
+        ),
+    ],
+)
+def test_is_compressible(message, compressible):
+    assert Compression(encodings=('gzip',)).is_compressible(message) is compressible
+
+
+async def test_send_small_bodies_as_is():
+    compression = Compression(encodings=('gzip',), minimum_bytes=len(BODY) + 1)
+    headers = [(b'content-type', b'application/json'), (b'content-length', b'%d' % len(BODY))]
+
+    sent = await respond(compression, [start_message(headers=headers), body_message(BODY)])
+
+    assert sent[0]['headers'] == headers
+    assert sent[1]['body'] == BODY
+
+
+async def test_compress_whole_bodies():
+    compression = Compression(encodings=('gzip',), minimum_bytes=100)
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', b'%d' % len(BODY)),
+        (b'vary', b'Origin'),
+    ]
+
+    start, body = await respond(compression, [start_message(headers=headers), body_message(BODY)])
+
+    assert gzip.decompress(body['body']) == BODY
+    assert get_headers(start) == {
+        b'content-type': b'application/json',
+        b'content-encoding': b'gzip',
+        b'vary': b'Origin, Accept-Encoding',
+        b'content-length': b'%d' % len(body['body']),
+    }
+
+
+@pytest.mark.parametrize(
+    'vary, merged',
+    [
+        ([b'Accept-Encoding'], b'Accept-Encoding'),
+        ([b'Origin', b'accept-encoding, Cookie'], b'Origin, accept-encoding, Cookie'),
+        ([b'*'], b'*'),
+    ],
+)
+async def test_merge_vary(vary, merged):
+    compression = Compression(encodings=('gzip',), minimum_bytes=100)
+    headers = [(b'content-type', b'application/json'), *((b'Vary', value) for value in vary)]
+
+    start, _ = await respond(compression, [start_message(headers=headers), body_message(BODY)])
+
+    assert [value for key, value in start['headers'] if key == b'vary'] == [merged]
+
+
+async def test_flush_streamed_chunks():
+    compression = Compression(encodings=('gzip',), minimum_bytes=100)
+    chunks = [BODY[:10], BODY[10:500], BODY[500:]]
+    headers = [(b'content-type', b'application/json'), (b'content-length', b'%d' % len(BODY))]
+
+    sent = await respond(
+        compression,
+        [
+            start_message(headers=headers),
+            *(body_message(chunk, more_body=i < len(chunks) - 1) for i, chunk in enumerate(chunks)),
+        ],
+    )
+
+    assert b'content-length' not in get_headers(sent[0])
+    assert get_headers(sent[0])[b'content-encoding'] == b'gzip'
+    # every chunk sent decodes to the chunks received so far
+    decoder = zlib.decompressobj(31)
+    for i, message in enumerate(sent[1:]):
+        assert decoder.decompress(message['body']) == chunks[i]
+        assert message['more_body'] is (i < len(chunks) - 1)
+    assert decoder.eof
+
+
+async def test_reuse_the_cached_variant():
+    compression = Compression(encodings=('gzip',), minimum_bytes=100)
+    cache = ResponseCache()
+    entry = CacheEntry(200, [], BODY, 0, 0)
+    cache.set(('a',), entry)
+
+    def cached_response() -> list[dict]:
+        return [
+            start_message(cached_body=CachedBody(cache, ('a',), entry)),
+            body_message(BODY[:100], more_body=True),
+            body_message(BODY[100:]),
+        ]
+
+    first = await respond(compression, cached_response())
+    variant = entry.variants['gzip']
+    assert gzip.decompress(variant) == BODY
+    assert first[1]['body'] == variant
+
+    second = await respond(compression, cached_response())
+    # served from the first body message, the rest is the cached content
+    assert len(second) == 2
+    assert second[1]['body'] is variant
+    assert get_headers(second[0])[b'content-length'] == b'%d' % len(variant)
+    assert 'cached_body' not in second[0]
@@ -0,0 +1,384 @@
+import asyncio
+import os
+import socket
+
+import httpx
+import pytest
+
+from core.httpx import discovery
+from core.httpx.discovery import (
+    DiscoveryTransport,
+    Endpoint,
+    LeastOutstandingBalancer,
+    PowerOfTwoChoicesBalancer,
+    Resolver,
+    RoundRobinBalancer,
+    UpstreamRegistry,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class NameServer:
+    """
+    `getaddrinfo` of the event loop answering `answers` in turn, an `OSError` is raised.
+    """
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.queries = 0
+
+    async def __call__(self, host, port, **kwargs):
+        self.queries += 1
+        await asyncio.sleep(0)
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, OSError):
+            raise answer
+        return [(family, socket.SOCK_STREAM, 6, '', (address, port)) for family, address in answer]
+
+
+class StubResolver:
+    def __init__(self, addresses: list[str]):
+        self.addresses = addresses
+        self.resolved: list[tuple[str, int]] = []
+
+    async def resolve(self, host: str, port: int) -> list[str]:
+        self.resolved.append((host, port))
+        if not self.addresses:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return self.addresses
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(mocker):
+    clock = Clock()
+    mocker.patch.object(discovery, 'time', clock)
+    return clock
+
+
+def name_server(mocker, *answers) -> NameServer:
+    server = NameServer(*answers)
+    mocker.patch.object(asyncio.get_running_loop(), 'getaddrinfo', server)
+    return server
+
+
+IPV4 = socket.AF_INET
+IPV6 = socket.AF_INET6
+
+
+async def test_cache_addresses_for_the_ttl(mocker, clock):
+    server = name_server(
+        mocker,
+        [(IPV4, '10.0.0.1'), (IPV4, '10.0.0.2'), (IPV4, '10.0.0.1'), (IPV6, '::1')],
+        [(IPV4, '10.0.0.3')],
+    )
+    resolver = Resolver(ttl=10, negative_ttl=1)
+
+    # deduplicated, of the preferred family
+    assert await resolver.resolve('member', 80) == ['10.0.0.1', '10.0.0.2']
+    clock.now += 9
+    assert await resolver.resolve('member', 80) == ['10.0.0.1', '10.0.0.2']
+    assert server.queries == 1
+
+    clock.now += 1
+    assert await resolver.resolve('member', 80) == ['10.0.0.3']
+    assert server.queries == 2
+
+
+async def test_cache_failures_for_the_negative_ttl(mocker, clock):
+    error = socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+    server = name_server(mocker, error, [(IPV4, '10.0.0.1')])
+    resolver = Resolver(ttl=10, negative_ttl=1)
+
+    for _ in range(2):
+        with pytest.raises(socket.gaierror) as info:
+            await resolver.resolve('member', 80)
+        assert info.value is error
+    assert server.queries == 1
+
+    clock.now += 1
+    assert await resolver.resolve('member', 80) == ['10.0.0.1']
+    assert server.queries == 2
+
+
+async def test_share_concurrent_lookups(mocker):
+    server = name_server(mocker, [(IPV4, '10.0.0.1')])
+    resolver = Resolver()
+
+    waiting = [asyncio.create_task(resolver.resolve('member', 80)) for _ in range(3)]
+    await asyncio.sleep(0)
+    waiting[0].cancel()
+    results = await asyncio.gather(*waiting, return_exceptions=True)
+
+    assert server.queries == 1
+    # a cancelled caller does not cancel the lookup of the others
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == [['10.0.0.1']] * 2
+    assert not resolver._lookups  # pylint:disable=protected-access
+
+
+async def test_serve_the_last_addresses_while_failing(mocker, clock):
+    server = name_server(mocker, [(IPV4, '10.0.0.1')], OSError('unreachable'), [(IPV4, '10.0.0.2')])
+    resolver = Resolver(ttl=10, negative_ttl=1)
+    assert await resolver.resolve('member', 80) == ['10.0.0.1']
+
+    clock.now += 10
+    assert await resolver.resolve('member', 80) == ['10.0.0.1']
+    # kept for the negative ttl only
+    assert await resolver.resolve('member', 80) == ['10.0.0.1']
+    assert server.queries == 2
+
+    clock.now += 1
+    assert await resolver.resolve('member', 80) == ['10.0.0.2']
+
+
+@pytest.mark.parametrize(
+    'url, host, port, netloc, resolve',
+    [
+        ('http://member:8000', 'member', 8000, 'member:8000', True),
+        ('http://member', 'member', 80, 'member', True),
+        ('https://member', 'member', 443, 'member', False),
+        ('http://10.0.0.1:8000', '10.0.0.1', 8000, '10.0.0.1:8000', False),
+        ('http://[::1]:8000', '::1', 8000, '[::1]:8000', False),
+    ],
+)
+def test_parse_endpoints(url, host, port, netloc, resolve):
+    endpoint = Endpoint(url)
+
+    assert (endpoint.host, endpoint.port, endpoint.netloc, endpoint.resolve) == (
+        host,
+        port,
+        netloc,
+        resolve,
+    )
+
+
+@pytest.mark.parametrize('url', ['ftp://member', 'member:8000', 'http://'])
+def test_invalid_endpoints(url):
+    with pytest.raises(ValueError):
+        Endpoint(url)
+
+
+def build_endpoints(*outstanding: int) -> list[Endpoint]:
+    endpoints = [Endpoint(f'http://member-{i}:8000') for i in range(len(outstanding))]
+    for endpoint, count in zip(endpoints, outstanding):
+        endpoint.outstanding = count
+    return endpoints
+
+
+def test_round_robin():
+    endpoints = build_endpoints(5, 0, 0)
+    balancer = RoundRobinBalancer()
+
+    assert [balancer.choose(endpoints) for _ in range(4)] == [*endpoints, endpoints[0]]
+
+
+def test_least_outstanding():
+    endpoints = build_endpoints(2, 1, 1, 3)
+    balancer = LeastOutstandingBalancer()
+
+    # ties are broken round-robin
+    assert [balancer.choose(endpoints) for _ in range(4)] == [
+        endpoints[1],
+        endpoints[1],
+        endpoints[2],
+        endpoints[1],
+    ]
+
+
+def test_power_of_two_choices(mocker):
+    endpoints = build_endpoints(2, 1, 0)
+    sample = mocker.patch.object(discovery.random, 'sample')
+    balancer = PowerOfTwoChoicesBalancer()
+
+    sample.return_value = [endpoints[0], endpoints[1]]
+    assert balancer.choose(endpoints) is endpoints[1]
+    sample.return_value = [endpoints[2], endpoints[0]]
+    assert balancer.choose(endpoints) is endpoints[2]
+    sample.assert_called_with(endpoints, 2)
+
+    sample.reset_mock()
+    assert balancer.choose(endpoints[:1]) is endpoints[0]
+    sample.assert_not_called()
+
+
+@pytest.fixture(name='registry_file')
+def fixture_registry_file(tmp_path):
+    return tmp_path / 'upstream_registry.yaml'
+
+
+def write_registry(path, content: str, mtime: float) -> None:
+    path.write_text(content, encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+async def test_reload_the_registry_once_changed(registry_file):
+    write_registry(
+        registry_file,
+        'services:\n'
+        '  member:\n'
+        '    balancer: least_outstanding\n'
+        '    endpoints: [http://member-1:8000, http://member-2:8000]\n',
+        mtime=1000,
+    )
+    registry = UpstreamRegistry(path=str(registry_file))
+    kept = registry.get('member').endpoints[1]
+    kept.outstanding = 2
+
+    # reloaded on the mtime only
+    registry_file.write_text('services: {}\n', encoding='utf-8')
+    os.utime(registry_file, (1000, 1000))
+    registry.reload_if_changed()
+    assert registry.get('member') is not None
+
+    write_registry(
+        registry_file,
+        'services:\n  member:\n    endpoints: [http://member-2:8000, http://member-3:8000]\n',
+        mtime=1001,
+    )
+    registry.reload_if_changed()
+
+    # the endpoints kept keep their requests in flight
+    assert registry.get('member').endpoints[0] is kept
+    assert registry.snapshot() == {
+        'member': {
+            'balancer': discovery.UPSTREAM_BALANCER,
+            'endpoints': {'http://member-2:8000': 2, 'http://member-3:8000': 0},
+        }
+    }
+
+
+async def test_keep_the_registry_on_errors(registry_file):
+    write_registry(
+        registry_file, 'services:\n  member:\n    endpoints: [http://member:8000]\n', 1000
+    )
+    registry = UpstreamRegistry(path=str(registry_file))
+    registry.reload_if_changed()
+
+    write_registry(registry_file, 'services:\n  member:\n    balancer: random\n', 1001)
+    registry.reload_if_changed()
+    assert [endpoint.url for endpoint in registry.get('member').endpoints] == ['http://member:8000']
+
+    registry_file.unlink()
+    registry.reload_if_changed()
+    assert registry.get('member') is None
+
+
+def build_client(registry: UpstreamRegistry, handler, resolver: StubResolver) -> httpx.AsyncClient:
+    transport = DiscoveryTransport(
+        httpx.MockTransport(handler), 'member', registry=registry, resolver=resolver
+    )
+    return httpx.AsyncClient(base_url='http://member.internal', transport=transport)
+
+
+async def test_send_to_the_endpoints(registry_file):
+    write_registry(
+        registry_file,
+        'services:\n'
+        '  member:\n'
+        '    balancer: round_robin\n'
+        '    endpoints: [http://member-1:8000, https://member-2]\n',
+        mtime=1000,
+    )
+    resolver = StubResolver(['10.0.0.1', '10.0.0.2'])
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append((str(request.url), request.headers['Host']))
+        return httpx.Response(204)
+
+    async with build_client(UpstreamRegistry(path=str(registry_file)), handler, resolver) as client:
+        for _ in range(3):
+            await client.get('/a', params={'b': 1})
+
+    assert sent == [
+        ('http://10.0.0.1:8000/a?b=1', 'member-1:8000'),
+        # the certificate is verified against the host name
+        ('https://member-2/a?b=1', 'member-2'),
+        ('http://10.0.0.2:8000/a?b=1', 'member-1:8000'),
+    ]
+    assert resolver.resolved == [('member-1', 8000)] * 2
+
+
+async def test_send_to_the_base_url_without_endpoints(registry_file):
+    write_registry(registry_file, 'services:\n  member:\n    endpoints: []\n', mtime=1000)
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append((str(request.url), request.headers['Host']))
+        return httpx.Response(204)
+
+    async with build_client(
+        UpstreamRegistry(path=str(registry_file)), handler, StubResolver([])
+    ) as client:
+        await client.get('/a')
+
+    assert sent == [('http://member.internal/a', 'member.internal')]
+
+
+async def test_release_the_endpoint_once_the_response_is_closed(registry_file):
+    write_registry(
+        registry_file, 'services:\n  member:\n    endpoints: [http://member:8000]\n', 1000
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=b'abc')
+
+    registry = UpstreamRegistry(path=str(registry_file))
+    endpoint = registry.get('member').endpoints[0]
+
+    async with build_client(registry, handler, StubResolver(['10.0.0.1'])) as client:
+        async with client.stream('GET', '/a') as response:
+            # streamed bodies count as in flight until read
+            assert endpoint.outstanding == 1
+            assert await response.aread() == b'abc'
+            assert endpoint.outstanding == 0
+
+        async with client.stream('GET', '/a'):
+            assert endpoint.outstanding == 1
+        # or closed unread
+        assert endpoint.outstanding == 0
+
+        await client.get('/a')
+        assert endpoint.outstanding == 0
+
+
+async def test_release_the_endpoint_on_errors(registry_file):
+    write_registry(
+        registry_file, 'services:\n  member:\n    endpoints: [http://member:8000]\n', 1000
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError('Connection refused', request=request)
+
+    registry = UpstreamRegistry(path=str(registry_file))
+    endpoint = registry.get('member').endpoints[0]
+
+    async with build_client(registry, handler, StubResolver(['10.0.0.1'])) as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get('/a')
+        assert endpoint.outstanding == 0
+
+
+async def test_fail_to_connect_when_resolving_fails(registry_file):
+    write_registry(
+        registry_file, 'services:\n  member:\n    endpoints: [http://member:8000]\n', 1000
+    )
+    sent = []
+
+    async with build_client(
+        UpstreamRegistry(path=str(registry_file)), sent.append, StubResolver([])
+    ) as client:
+        with pytest.raises(httpx.ConnectError) as info:
+            await client.get('/a')
+
+    assert isinstance(info.value.__cause__, socket.gaierror)
+    assert not sent
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.pydantic.field import ISO8601Datetime, ParameterDate, PhoneNumberStr, parse_iso8601
+
+
+@pytest.mark.parametrize(
+    'value, expected',
+    [
+        # fromisoformat
+        ('2022-01-02T03:04:05Z', datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+        (
+            '2022-01-02T03:04:05.123456+08:00',
+            datetime(2022, 1, 2, 3, 4, 5, 123456, tzinfo=timezone(timedelta(hours=8))),
+        ),
+        ('2022-01-02T03:04:05', datetime(2022, 1, 2, 3, 4, 5)),
+        # isoparse
+        ('20220102T030405Z', datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+        ('2022-01-02T24:00:00-05:30', datetime(2022, 1, 3, tzinfo=timezone(-timedelta(hours=5.5)))),
+        ('2022-01-02T03:04:05+00', datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ],
+)
+def test_parse_iso8601_gives_the_same_tzinfo_type(value, expected):
+    parsed = parse_iso8601(value)
+
+    assert parsed == expected
+    assert type(parsed.tzinfo) is type(expected.tzinfo)
+    if expected.tzinfo is timezone.utc:
+        assert parsed.tzinfo is timezone.utc
+
+
+def test_iso8601_datetime():
+    assert ISO8601Datetime.validate('2022-01-02T11:04:05+08:00') == datetime(
+        2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc
+    )
+    with pytest.raises(ValueError):
+        ISO8601Datetime.validate('2022-01-02T03:04:05')
+
+
+def test_invalid_values_are_not_cached():
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            PhoneNumberStr.validate('not a number')
+        with pytest.raises(ValueError):
+            ParameterDate.validate('2022-13-01')
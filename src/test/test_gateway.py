@@ -0,0 +1,150 @@
+import uuid
+
+import httpx
+import pytest
+from asgi_correlation_id.context import correlation_id
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from core.enum import ErrorCode
+from core.exception import BaseException_, ServiceOverloadedException, TooManyRequestsException
+from core.fastapi import FastAPI
+from core.fastapi.admission import AdmissionController
+from core.fastapi.exception import FastAPIError
+from core.fastapi.middleware import GatewayMiddleware
+from core.fastapi.ratelimit import MemoryBuckets, RateLimiter
+from core.handler import (
+    HTTP_ERRORS,
+    base_exception_handler,
+    fastapi_exception_handler,
+    http_exception_handler,
+    request_validation_exception_handler,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def build_app(**options) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(GatewayMiddleware, cors={'allow_origin_regex': '.*'}, **options)
+    app.add_exception_handler(StarletteHTTPException, http_exception_handler)
+    app.add_exception_handler(RequestValidationError, request_validation_exception_handler)
+    app.add_exception_handler(FastAPIError, fastapi_exception_handler)
+    app.add_exception_handler(Exception, base_exception_handler)
+
+    @app.get('/request-id')
+    async def get_request_id():
+        return {'request_id': correlation_id.get()}
+
+    @app.get('/conflict')
+    async def conflict():
+        raise FastAPIError('Order conflict', code=1409, http_status=409, data={'id': 1})
+
+    @app.get('/unhandled')
+    async def unhandled():
+        raise RuntimeError('unhandled')
+
+    @app.get('/items/{item_id}')
+    async def get_item(item_id: int):
+        return {'id': item_id}
+
+    return app
+
+
+def build_client(app: FastAPI) -> httpx.AsyncClient:
+    # unhandled errors are re-raised to the server once answered
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url='http://test')
+
+
+@pytest.fixture(name='gateway_client')
+async def fixture_gateway_client():
+    async with build_client(build_app()) as ac:
+        yield ac
+
+
+async def test_map_errors(gateway_client):
+    response = await gateway_client.get('/conflict')
+    assert response.status_code == 409
+    assert response.json() == {'message': 'Order conflict', 'code': 1409, 'data': {'id': 1}}
+
+    response = await gateway_client.get('/items/abc')
+    assert response.status_code == 422
+    assert response.json()['code'] == ErrorCode.GENERAL_REQUEST_VALIDATION_FAILED
+
+    response = await gateway_client.get('/missing')
+    assert response.status_code == 404
+    assert response.json()['code'] == ErrorCode.GENERAL_HTTP_SERVICE_ERROR
+
+
+async def test_unhandled_errors_keep_the_request_id(gateway_client):
+    request_id = uuid.uuid4().hex
+    response = await gateway_client.get('/unhandled', headers={'X-Request-ID': request_id})
+
+    assert response.status_code == 500
+    assert response.json() == {
+        'message': BaseException_.message,
+        'code': BaseException_.code,
+        'data': None,
+    }
+    assert response.headers['X-Request-ID'] == request_id
+
+
+async def test_propagate_the_request_id(gateway_client):
+    request_id = uuid.uuid4().hex
+    response = await gateway_client.get(
+        '/request-id', headers={'X-Request-ID': request_id, 'Origin': 'https://app.example.com'}
+    )
+
+    assert response.json() == {'request_id': request_id}
+    assert response.headers['X-Request-ID'] == request_id
+    assert response.headers['Access-Control-Expose-Headers'] == 'X-Request-ID'
+    assert response.headers['Access-Control-Allow-Origin'] == 'https://app.example.com'
+
+    # handled errors carry it too
+    response = await gateway_client.get('/conflict', headers={'X-Request-ID': request_id})
+    assert response.headers['X-Request-ID'] == request_id
+
+
+async def test_replace_an_invalid_request_id(gateway_client):
+    response = await gateway_client.get('/request-id', headers={'X-Request-ID': 'not-a-uuid'})
+
+    request_id = response.json()['request_id']
+    assert request_id != 'not-a-uuid'
+    assert uuid.UUID(request_id).version == 4
+    assert response.headers['X-Request-ID'] == request_id
+
+
+async def test_rate_limit_before_admission(mocker):
+    admission = AdmissionController(max_in_flight=1, max_loop_lag=0)
+    acquire = mocker.spy(admission, 'acquire')
+    rate_limiter = RateLimiter(rules={'/request-id': '1:1'}, buckets=MemoryBuckets(), subject=None)
+    async with build_client(build_app(admission=admission, rate_limiter=rate_limiter)) as ac:
+        assert (await ac.get('/request-id')).status_code == 200
+        assert acquire.call_count == 1
+
+        # the limited request never takes a slot of the admission control
+        admission.in_flight = admission.max_in_flight
+        response = await ac.get('/request-id')
+        assert response.status_code == TooManyRequestsException.http_status
+        assert acquire.call_count == 1
+
+        # under its limit, the overloaded worker sheds it
+        response = await ac.get('/items/1')
+        assert response.status_code == ServiceOverloadedException.http_status
+        assert response.json()['code'] == ServiceOverloadedException.code
+
+
+async def test_count_rejected_requests_as_errors():
+    admission = AdmissionController(max_in_flight=1, max_loop_lag=0)
+    rate_limiter = RateLimiter(rules={'/items/*': '1:1'}, buckets=MemoryBuckets(), subject=None)
+    overloaded = HTTP_ERRORS.labels(str(int(ServiceOverloadedException.code)))
+    too_many_requests = HTTP_ERRORS.labels(str(int(TooManyRequestsException.code)))
+    before = overloaded.value, too_many_requests.value
+    async with build_client(build_app(admission=admission, rate_limiter=rate_limiter)) as ac:
+        admission.in_flight = admission.max_in_flight
+        assert (await ac.get('/request-id')).status_code == 503
+        assert (await ac.get('/items/1')).status_code == 503
+        assert (await ac.get('/items/1')).status_code == 429
+
+    assert (overloaded.value, too_many_requests.value) == (before[0] + 2, before[1] + 1)
@@ -0,0 +1,38 @@
+import datetime
+import uuid
+
+import orjson
+import pytest
+
+from core.fastapi.exception import FastAPIError
+from core.handler import ExceptionResponseContent, fastapi_exception_handler
+from core.pydantic.model import BaseModel
+
+pytestmark = pytest.mark.anyio
+
+
+class Order(BaseModel):
+    id: uuid.UUID
+    created_at: datetime.datetime
+
+
+async def test_encode_error_data():
+    order = Order(id=uuid.UUID(int=1), created_at=datetime.datetime(2022, 1, 2, 3, 4, 5))
+    error = FastAPIError(
+        'Order conflict', code=1409, http_status=409, data={'order': order, 'at': order.created_at}
+    )
+
+    response = await fastapi_exception_handler(None, error)
+
+    assert response.status_code == 409
+    content = orjson.loads(response.body)  # pylint:disable=no-member
+    assert content == {
+        'message': 'Order conflict',
+        'code': 1409,
+        'data': {
+            'order': {'id': str(order.id), 'created_at': '2022-01-02T03:04:05'},
+            'at': '2022-01-02T03:04:05',
+        },
+    }
+    # the shape of the model the handlers do not build anymore
+    assert ExceptionResponseContent(**content).dict() == content
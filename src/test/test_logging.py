@@ -0,0 +1,195 @@
+import functools
+import os
+import sys
+from logging import ERROR, INFO, WARNING, Handler, LogRecord
+
+import pytest
+from starlette.datastructures import Headers
+
+from core.fastapi.logging import (
+    REDACTED,
+    CapturePolicy,
+    HTTPContext,
+    HTTPFilter,
+    RelativePathFilter,
+    http_context_var,
+)
+from settings.logging import QueueLogHandler
+
+
+class Listener:
+    def __init__(self):
+        self.records: list[LogRecord] = []
+
+    def put(self, handler: Handler, record: LogRecord) -> None:
+        self.records.append(record)
+
+
+@pytest.fixture(name='listener')
+def fixture_listener():
+    return Listener()
+
+
+@pytest.fixture(name='queue_handler')
+def fixture_queue_handler(listener):
+    return QueueLogHandler(Handler(), listener)
+
+
+def make_record(msg: str, args) -> LogRecord:
+    return LogRecord('fastapi', INFO, __file__, 1, msg, args, None)
+
+
+def test_merge_mutable_arguments(queue_handler, listener):
+    items = ['a']
+    queue_handler.handle(make_record('items %s', (items,)))
+    items.append('b')
+
+    [record] = listener.records
+    assert record.args is None
+    assert record.getMessage() == "items ['a']"
+
+
+def test_merge_mapping_arguments(queue_handler, listener):
+    queue_handler.handle(make_record('%(user)s logged in', ({'user': 'alice'},)))
+
+    [record] = listener.records
+    assert record.args is None
+    assert record.getMessage() == 'alice logged in'
+
+
+def test_keep_scalar_arguments(queue_handler, listener):
+    # unpacked by the access formatters
+    args = ('127.0.0.1:1234', 'GET', '/v1/orders', '1.1', 200)
+    queue_handler.handle(make_record('%s - "%s %s HTTP/%s" %d', args))
+
+    [record] = listener.records
+    assert record.args == args
+    assert record.getMessage() == '127.0.0.1:1234 - "GET /v1/orders HTTP/1.1" 200'
+
+
+def test_drop_unformattable_records(queue_handler, listener, mocker):
+    handle_error = mocker.patch.object(queue_handler, 'handleError')
+    queue_handler.handle(make_record('%d items', (['a'],)))
+
+    assert not listener.records
+    handle_error.assert_called_once()
+
+
+def test_relative_path(monkeypatch):
+    monkeypatch.setattr(sys, 'path', ['/app', '/app/core', '/usr/lib/python3.11'])
+    relative_path = RelativePathFilter()
+
+    for pathname, expected in (
+        ('/app/core/handler.py', 'handler.py'),
+        ('/app/main.py', 'main.py'),
+        # relative to the shortest entry
+        ('/opt/lib/module.py', os.path.join('..', 'opt', 'lib', 'module.py')),
+    ):
+        record = make_record('message', None)
+        record.pathname = pathname
+        assert relative_path.filter(record)
+        assert record.relativepath == expected  # pylint:disable=no-member
+
+    monkeypatch.setattr(sys, 'path', [])
+    record = make_record('message', None)
+    relative_path.filter(record)
+    assert record.relativepath == record.pathname  # pylint:disable=no-member
+
+
+def make_access_record(status_code: int) -> LogRecord:
+    args = ('127.0.0.1:1234', 'GET', '/v1/orders', '1.1', status_code)
+    return LogRecord('uvicorn.access', INFO, __file__, 1, '%s - "%s %s HTTP/%s" %d', args, None)
+
+
+def make_context(policy: CapturePolicy) -> HTTPContext:
+    return HTTPContext(b'', Headers(), functools.partial(policy.body, b''), policy=policy)
+
+
+@pytest.mark.parametrize(
+    'record, captured',
+    [
+        (make_record('message', None), False),
+        (LogRecord('fastapi', WARNING, __file__, 1, 'message', None, None), True),
+        (LogRecord('fastapi', ERROR, __file__, 1, 'message', None, None), True),
+        (make_access_record(200), False),
+        (make_access_record(404), True),
+        (make_access_record(502), True),
+        # five arguments, not an access line
+        (make_record('%s %s %s %s %d', ('a', 'b', 'c', 'd', 500)), False),
+    ],
+)
+def test_capture_sampled_out_requests(record, captured):
+    context = make_context(CapturePolicy(sample_rate=0))
+
+    assert context.captures(record) is captured
+    assert make_context(CapturePolicy(sample_rate=1)).captures(record)
+
+
+def test_sample_requests(mocker):
+    mocker.patch('core.fastapi.logging.random.random', side_effect=[0.05, 0.5])
+    policy = CapturePolicy(sample_rate=0.1)
+
+    assert [make_context(policy).sampled for _ in range(2)] == [True, False]
+
+
+@pytest.mark.parametrize(
+    'allowed, denied, expected',
+    [
+        (
+            frozenset(),
+            frozenset(),
+            {'Accept': 'application/json', 'Authorization': REDACTED, 'Cookie': REDACTED},
+        ),
+        (
+            frozenset({'accept', 'authorization'}),
+            frozenset(),
+            {'Accept': 'application/json', 'Authorization': REDACTED},
+        ),
+        (frozenset(), frozenset({'cookie', 'authorization'}), {'Accept': 'application/json'}),
+    ],
+)
+def test_filter_and_redact_headers(allowed, denied, expected):
+    policy = CapturePolicy(allowed_headers=allowed, denied_headers=denied)
+    headers = [
+        ('Accept', 'application/json'),
+        ('Authorization', 'Bearer secret'),
+        ('Cookie', 'session=secret'),
+    ]
+
+    assert policy.headers(headers) == expected
+
+
+def test_cap_bodies():
+    policy = CapturePolicy(body_bytes=4)
+
+    assert policy.body(b'abcdef') == {'raw': 'abcd', 'size': 6, 'truncated': True}
+    assert policy.body(b'abc') == {'raw': 'abc', 'size': 3, 'truncated': False}
+    assert policy.body(None) == {'raw': None}
+
+
+def test_render_captured_requests_only():
+    rendered = []
+
+    def render_body() -> dict:
+        rendered.append(True)
+        return {'raw': 'abc'}
+
+    policy = CapturePolicy(sample_rate=0)
+    context = HTTPContext(b'page=2', Headers({'accept': '*/*'}), render_body, policy=policy)
+    token = http_context_var.set(context)
+    try:
+        sampled_out = make_record('message', None)
+        HTTPFilter().filter(sampled_out)
+        assert not hasattr(sampled_out, 'request') and not rendered
+
+        captured = make_access_record(500)
+        HTTPFilter().filter(captured)
+    finally:
+        http_context_var.reset(token)
+
+    assert captured.request == {  # pylint:disable=no-member
+        'query_params': 'page=2',
+        'headers': {'accept': '*/*'},
+        'body': {'raw': 'abc'},
+    }
+    assert len(rendered) == 1
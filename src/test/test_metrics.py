@@ -0,0 +1,88 @@
+import os
+import subprocess
+
+from core.metrics import MetricsRegistry, render
+from core.process import BOOT_ID, process_identity
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen(['true'])  # pylint:disable=consider-using-with
+    process.wait()
+    return process.pid
+
+
+def build(directory: str) -> MetricsRegistry:
+    registry = MetricsRegistry(str(directory))
+    registry.counter('requests_total', 'Requests')
+    registry.gauge('connections', 'Open connections')
+    return registry
+
+
+def values(registry: MetricsRegistry, own: dict) -> dict[str, float]:
+    lines = render(registry.collect(own)).splitlines()
+    return {
+        name: float(value) for name, value in (l.split() for l in lines if not l.startswith('#'))
+    }
+
+
+def write_worker(registry: MetricsRegistry, name: str, requests: float, connections: float):
+    snapshot = registry.snapshot()
+    snapshot['requests_total']['series'] = [[[], requests]]
+    snapshot['connections']['series'] = [[[], connections]]
+    registry._write(registry._path(name), snapshot)  # pylint:disable=protected-access
+
+
+def file_name(identity: str) -> str:
+    return identity.replace(':', '_')
+
+
+def test_keep_the_counters_of_a_dead_worker_whose_pid_is_reused(tmp_path):
+    scraper = build(tmp_path)
+    live = file_name(process_identity(os.getppid()))
+    # a worker that held the PID before, started at another time
+    write_worker(scraper, f'{BOOT_ID}_{os.getppid()}_0', requests=5, connections=3)
+    write_worker(scraper, live, requests=2, connections=1)
+    write_worker(scraper, file_name(process_identity(dead_pid())), requests=7, connections=4)
+
+    assert values(scraper, scraper.snapshot()) == {'requests_total': 14.0, 'connections': 1.0}
+    # folded into the archive once
+    assert sorted(os.listdir(tmp_path)) == ['.lock', 'archive.json', f'metrics_{live}.json']
+    assert values(scraper, scraper.snapshot()) == {'requests_total': 14.0, 'connections': 1.0}
+
+
+def test_archive_on_shutdown(tmp_path):
+    worker = build(tmp_path)
+    worker.counter('jobs_total', 'Jobs').labels().inc(3)
+    worker.flush(worker.snapshot())
+    assert os.path.exists(worker.file)
+
+    worker.archive(worker.snapshot())
+
+    assert not os.path.exists(worker.file)
+    scraper = build(tmp_path)
+    scraper.counter('jobs_total', 'Jobs')
+    assert values(scraper, scraper.snapshot())['jobs_total'] == 3.0
+
+
+def test_a_forked_worker_writes_its_own_file(tmp_path, monkeypatch):
+    registry = build(tmp_path)
+    parent = registry.file
+    monkeypatch.setattr(os, 'getpid', lambda: 1)
+
+    assert registry.file != parent
+    assert os.path.basename(registry.file) == f'metrics_{file_name(process_identity(1))}.json'
+
+
+def test_do_not_flush_once_archived(tmp_path):
+    worker = build(tmp_path)
+    worker.counter('jobs_total', 'Jobs').labels().inc(3)
+    snapshot = worker.snapshot()
+
+    worker.archive(worker.snapshot())
+    # a flush still running in the threadpool when the worker shut down
+    worker.flush(snapshot)
+
+    assert not os.path.exists(worker.file)
+    scraper = build(tmp_path)
+    scraper.counter('jobs_total', 'Jobs')
+    assert values(scraper, scraper.snapshot())['jobs_total'] == 3.0
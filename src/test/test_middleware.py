@@ -0,0 +1,149 @@
+import pytest
+
+from core.fastapi.logging import CapturePolicy, http_context_var
+from core.fastapi.middleware import ParseRequestMiddleware
+
+pytestmark = pytest.mark.anyio
+
+POLICY = CapturePolicy(body_bytes=1024)
+
+
+class Client:
+    """
+    `receive` of the server, the messages of a request and then `http.disconnect`
+    """
+
+    def __init__(self, messages: list[dict]):
+        self.messages = messages
+        self.received = 0
+
+    async def __call__(self) -> dict:
+        self.received += 1
+        if self.messages:
+            return self.messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+
+class App:
+    """
+    Reads `count` messages, then the body captured for logging.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self.messages: list[dict] = []
+        self.body = None
+
+    async def __call__(self, scope, receive, send):
+        for _ in range(self.count):
+            self.messages.append(await receive())
+        self.body = http_context_var.get().body()
+
+
+def build_scope(content_type: str = 'application/json') -> dict:
+    return {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/',
+        'query_string': b'',
+        'headers': [(b'content-type', content_type.encode('latin-1'))],
+    }
+
+
+def body_messages(*chunks: bytes) -> list[dict]:
+    return [
+        {'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+async def test_stream_chunks_through():
+    messages = body_messages(b'{"a":', b' 1', b'}')
+    app = App(len(messages))
+    middleware = ParseRequestMiddleware(app, streaming=True, preview_bytes=1024, policy=POLICY)
+
+    await middleware(build_scope(), Client(list(messages)), None)
+
+    # the chunks reach the app as sent, one at a time
+    assert app.messages == messages
+    assert app.body == {'raw': '{"a": 1}', 'size': 8, 'truncated': False}
+
+
+async def test_stream_caps_the_preview():
+    messages = body_messages(b'abc', b'defg', b'hi')
+    app = App(len(messages))
+    middleware = ParseRequestMiddleware(app, streaming=True, preview_bytes=5, policy=POLICY)
+
+    await middleware(build_scope(), Client(list(messages)), None)
+
+    assert b''.join(message['body'] for message in app.messages) == b'abcdefghi'
+    assert app.body == {'raw': 'abcde', 'size': 9, 'truncated': True}
+
+
+async def test_stream_previews_the_policy_cap():
+    messages = body_messages(b'abcdefgh')
+    app = App(len(messages))
+    middleware = ParseRequestMiddleware(
+        app, streaming=True, preview_bytes=1024, policy=CapturePolicy(body_bytes=3)
+    )
+
+    await middleware(build_scope(), Client(list(messages)), None)
+
+    assert app.body == {'raw': 'abc', 'size': 8, 'truncated': True}
+
+
+@pytest.mark.parametrize(
+    'content_type, previewed',
+    [
+        ('application/json', True),
+        ('application/x-www-form-urlencoded', True),
+        ('text/plain; charset=utf-8', True),
+        ('application/octet-stream', False),
+        ('multipart/form-data; boundary=x', False),
+    ],
+)
+async def test_stream_previews_allowed_content_types(content_type, previewed):
+    messages = body_messages(b'abc')
+    app = App(len(messages))
+    middleware = ParseRequestMiddleware(app, streaming=True, preview_bytes=1024, policy=POLICY)
+
+    await middleware(build_scope(content_type), Client(list(messages)), None)
+
+    assert app.messages == messages
+    if previewed:
+        assert app.body == {'raw': 'abc', 'size': 3, 'truncated': False}
+    else:
+        assert app.body == {'raw': None}
+
+
+async def test_buffer_and_replay_the_body():
+    app = App(2)
+    middleware = ParseRequestMiddleware(app, streaming=False, policy=POLICY)
+    client = Client(body_messages(b'abc', b'def'))
+
+    await middleware(build_scope(), client, None)
+
+    # one message for the whole body, then the server is awaited again
+    assert app.messages == [
+        {'type': 'http.request', 'body': b'abcdef', 'more_body': False},
+        {'type': 'http.disconnect'},
+    ]
+    assert client.received == 3
+    assert app.body == {'raw': 'abcdef', 'size': 6, 'truncated': False}
+
+
+async def test_replay_the_disconnect_after_the_body():
+    chunks = body_messages(b'abc', b'def')
+    chunks[-1]['more_body'] = True  # the client went away mid-body
+    app = App(2)
+    middleware = ParseRequestMiddleware(app, streaming=False, policy=POLICY)
+    client = Client(chunks + [{'type': 'http.disconnect'}])
+
+    await middleware(build_scope(), client, None)
+
+    assert app.messages == [
+        {'type': 'http.request', 'body': b'abcdef', 'more_body': False},
+        {'type': 'http.disconnect'},
+    ]
+    # nothing is read from the server past the buffered messages
+    assert client.received == 3
@@ -0,0 +1,102 @@
+import datetime
+from typing import Optional
+
+import orjson
+import pytest
+from pydantic import Field, ValidationError, root_validator
+
+from core.pydantic.model import BaseModel
+
+
+class Credential(BaseModel):
+    user: str
+    password: str = Field(exclude=True)
+    token: Optional[str] = None
+
+
+class Profile(BaseModel):
+    credential: Credential
+    # nested exclude settings
+    backup: Credential = Field(exclude={'user'})
+    tags: list[str] = Field(default_factory=list, alias='labels')
+    updated_at: datetime.datetime
+
+    class Config:
+        allow_population_by_field_name = True
+        fields = {'tags': {'exclude': {0}}}
+
+
+class Account(BaseModel):
+    name: str
+    secret: str
+
+    class Config:
+        fields = {'secret': {'exclude': True}}
+
+    @property
+    def display_name(self) -> str:
+        return self.name.title()
+
+
+@pytest.fixture(name='credential')
+def fixture_credential():
+    return Credential(user='alice', password='hunter2')
+
+
+@pytest.fixture(name='profile')
+def fixture_profile(credential):
+    return Profile(
+        credential=credential,
+        backup=credential,
+        tags=['a', 'b'],
+        updated_at=datetime.datetime(2022, 1, 2, 3, 4, 5),
+    )
+
+
+@pytest.mark.parametrize('options', [{}, {'by_alias': True}, {'exclude_none': True}])
+def test_jsonable_dict_matches_json(credential, profile, options):
+    account = Account(name='alice smith', secret='s3cret')
+    for model in (credential, profile, account):
+        expected = orjson.loads(model.json(**options))  # pylint:disable=no-member
+        assert model.jsonable_dict(**options) == expected
+        assert orjson.loads(model.json_bytes(**options)) == expected  # pylint:disable=no-member
+
+
+def test_leave_out_excluded_fields(credential, profile):
+    assert credential.jsonable_dict() == {'user': 'alice', 'token': None}
+    assert profile.jsonable_dict()['backup'] == {'token': None}
+    assert profile.jsonable_dict()['tags'] == ['b']
+    assert b'hunter2' not in profile.json_bytes()
+    assert Account(name='bob', secret='s3cret').jsonable_dict() == {
+        'name': 'bob',
+        'display_name': 'Bob',
+    }
+
+
+class Event(BaseModel):
+    name: Optional[str] = Field(None, nullable=False)
+    # resolved by `update_forward_refs`
+    happened_at: Optional['Timestamp'] = None
+
+
+def test_convert_forward_ref_datetimes_to_utc():
+    Event.update_forward_refs(Timestamp=datetime.datetime)
+
+    event = Event(name='signup', happened_at='2024-01-02T03:04:05+08:00')
+
+    assert event.happened_at == datetime.datetime(2024, 1, 1, 19, 4, 5)
+    assert Event.__model_metadata__.datetime_fields == ('happened_at',)
+
+
+def test_check_nullable_fields_of_subclasses_with_root_validators():
+    class AuditedEvent(Event):
+        source: str = ''
+
+        @root_validator(pre=True)
+        def default_source(cls, values):
+            values.setdefault('source', 'api')
+            return values
+
+    with pytest.raises(ValidationError, match='name is not allowed to be null'):
+        AuditedEvent(name=None)
+    assert AuditedEvent(name='signup').source == 'api'
@@ -0,0 +1,138 @@
+import httpx
+import orjson
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+
+from core.fastapi import FastAPI
+from core.httpx.client import UpstreamConfig, clients
+from core.proxy import ProxyRoute, RouteTable
+
+pytestmark = pytest.mark.anyio
+
+
+async def echo(scope, receive, send):
+    request = Request(scope, receive)
+    content = orjson.dumps(  # pylint:disable=no-member
+        {
+            'method': request.method,
+            'raw_path': scope['raw_path'].partition(b'?')[0].decode('ascii'),
+            'query': scope['query_string'].decode('ascii'),
+            'headers': {key.decode(): value.decode() for key, value in scope['headers']},
+            'body': (await request.body()).decode(),
+        }
+    )
+    response = Response(
+        content,
+        media_type='application/json',
+        headers={'Connection': 'X-Upstream-Secret', 'X-Upstream-Secret': '1', 'Keep-Alive': '5'},
+    )
+    await response(scope, receive, send)
+
+
+@pytest.fixture(name='proxy_client', scope='module')
+async def fixture_proxy_client(module_mocker):
+    module_mocker.patch.object(
+        UpstreamConfig,
+        'build_transport',
+        lambda self, name='default': httpx.ASGITransport(app=echo),
+    )
+    clients.register('echo', UpstreamConfig(base_url='http://echo'))
+
+    app = FastAPI()
+    app.add_proxy(
+        [
+            ProxyRoute('/echo', 'echo'),
+            ProxyRoute('/echo/rewritten', 'echo', methods=['GET'], upstream_prefix='/api'),
+        ]
+    )
+    app.add_versioning((1, 0))
+    async with httpx.AsyncClient(app=app, base_url='http://test/v1') as ac:
+        yield ac
+    await clients.shutdown()
+
+
+def test_route_table_matches_longest_prefix_per_segment():
+    members = ProxyRoute('/members', 'member')
+    member_orders = ProxyRoute('/members/orders', 'order', methods=['GET'])
+    fallback = ProxyRoute('/', 'default')
+    table = RouteTable([members, member_orders, fallback])
+
+    assert table.match('GET', '/members') is members
+    assert table.match('GET', '/members/1') is members
+    assert table.match('GET', '/members/orders/1') is member_orders
+    assert table.match('POST', '/members/orders/1') is members
+    assert table.match('GET', '/membership') is fallback
+    assert RouteTable([members]).match('GET', '/membership') is None
+
+
+def test_route_table_rejects_duplicated_routes():
+    with pytest.raises(ValueError):
+        RouteTable([ProxyRoute('/members', 'a'), ProxyRoute('/members/', 'b')])
+
+
+def test_route_rewrite():
+    route = ProxyRoute('/members', 'member', upstream_prefix='/api/members')
+
+    assert route.rewrite('/members') == '/api/members'
+    assert route.rewrite('/members/1') == '/api/members/1'
+    assert ProxyRoute('/members', 'member').rewrite('/members/1') == '/members/1'
+
+
+async def test_forward_request(proxy_client):
+    response = await proxy_client.post('/echo/1?a=1&b=%2F', content=b'payload')
+    forwarded = response.json()
+
+    assert response.status_code == 200
+    assert forwarded['method'] == 'POST'
+    assert forwarded['raw_path'] == '/echo/1'
+    assert forwarded['query'] == 'a=1&b=%2F'
+    assert forwarded['body'] == 'payload'
+    assert forwarded['headers']['host'] == 'echo'
+    assert forwarded['headers']['x-forwarded-host'] == 'test'
+    assert forwarded['headers']['x-forwarded-proto'] == 'http'
+
+
+async def test_forward_keeps_percent_encoding(proxy_client):
+    response = await proxy_client.get('/echo/a%2Fb/caf%C3%A9%20x')
+
+    assert response.json()['raw_path'] == '/echo/a%2Fb/caf%C3%A9%20x'
+
+
+async def test_forward_rewritten_prefix(proxy_client):
+    response = await proxy_client.get('/echo/rewritten/a%2Fb')
+    assert response.json()['raw_path'] == '/api/a%2Fb'
+
+    # the rewritten route is GET only
+    response = await proxy_client.delete('/echo/rewritten/a')
+    assert response.json()['raw_path'] == '/echo/rewritten/a'
+
+
+async def test_unmatched_path_falls_back(proxy_client):
+    response = await proxy_client.get('/unknown')
+
+    assert response.status_code == 404
+
+
+async def test_strip_hop_by_hop_headers(proxy_client):
+    response = await proxy_client.get(
+        '/echo',
+        headers={
+            'Connection': 'X-Client-Secret, close',
+            'X-Client-Secret': '1',
+            'Keep-Alive': 'timeout=5',
+            'TE': 'trailers',
+            'Proxy-Authorization': 'Basic eA==',
+            'X-Kept': '1',
+        },
+    )
+    forwarded = response.json()['headers']
+
+    for name in ('x-client-secret', 'keep-alive', 'te', 'proxy-authorization'):
+        assert name not in forwarded
+    # the upstream client sends its own `Connection`
+    assert forwarded.get('connection') != 'X-Client-Secret, close'
+    assert forwarded['x-kept'] == '1'
+    assert 'x-upstream-secret' not in response.headers
+    assert 'keep-alive' not in response.headers
+    assert response.headers['content-type'] == 'application/json'
@@ -0,0 +1,102 @@
+import httpx
+import pytest
+
+from core.fastapi import FastAPI
+from core.fastapi.middleware import GatewayMiddleware
+from core.fastapi.ratelimit import (
+    MemoryBuckets,
+    RateLimiter,
+    RateLimitRule,
+    SharedBuckets,
+    take_token,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_parse_rules():
+    assert RateLimitRule.parse('/v1/*', '20:40') == RateLimitRule('/v1/*', 20.0, 40)
+    assert RateLimitRule.parse('/v1/orders', '0.5') == RateLimitRule('/v1/orders', 0.5, 1)
+
+
+@pytest.mark.parametrize('value', ['0', '-1:10', '0:10', '5:0', 'inf', 'nan'])
+def test_reject_invalid_rules(value):
+    with pytest.raises(ValueError):
+        RateLimitRule.parse('/v1/*', value)
+
+
+def test_take_token():
+    assert take_token(1.0, 0.0, 2.0, 4, 0.0) == (0.0, 0.0)
+    # empty, half a second until the next token
+    assert take_token(0.0, 0.0, 2.0, 4, 0.25) == (0.5, 0.25)
+    # refilled up to the burst
+    assert take_token(0.0, 0.0, 2.0, 4, 100.0) == (3.0, 0.0)
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_buckets(tmp_path, shared):
+    if shared:
+        path = str(tmp_path / 'buckets')
+        # two workers of the host
+        first, second = SharedBuckets(path, max_keys=64), SharedBuckets(path, max_keys=64)
+    else:
+        first = second = MemoryBuckets(max_keys=64)
+
+    assert not first.take(b'alice', 1.0, 2, 0.0)
+    assert not second.take(b'alice', 1.0, 2, 0.0)
+    assert second.take(b'alice', 1.0, 2, 0.0) == 1.0
+    assert not first.take(b'bob', 1.0, 2, 0.0)
+    assert not first.take(b'alice', 1.0, 2, 1.0)
+
+
+def build_limiter(**options) -> RateLimiter:
+    return RateLimiter(
+        rules={'/v1/*': '1:1'}, buckets=MemoryBuckets(), subject=lambda token: None, **options
+    )
+
+
+@pytest.mark.parametrize(
+    'trusted_proxies, forwarded_for, expected',
+    [
+        (0, '203.0.113.7', 'ip:10.0.0.2'),
+        (1, None, 'ip:10.0.0.2'),
+        (1, '203.0.113.7', 'ip:203.0.113.7'),
+        # forged by the client, the load balancer appended the last entry
+        (1, '198.51.100.1, 203.0.113.7', 'ip:203.0.113.7'),
+        (2, '198.51.100.1,203.0.113.7,10.0.0.9', 'ip:203.0.113.7'),
+        (2, '203.0.113.7', 'ip:203.0.113.7'),
+    ],
+)
+def test_key_anonymous_clients(trusted_proxies, forwarded_for, expected):
+    limiter = build_limiter(trusted_proxies=trusted_proxies)
+    scope = {'client': ('10.0.0.2', 40000)}
+
+    assert limiter.client(scope, None, forwarded_for) == expected
+
+
+def test_key_verified_subjects():
+    limiter = build_limiter(trusted_proxies=1)
+    limiter.subject = {'token': 'alice'}.get
+
+    assert limiter.client({}, 'Bearer token', '203.0.113.7') == 'sub:alice'
+    assert limiter.client({}, 'Bearer other', '203.0.113.7') == 'ip:203.0.113.7'
+
+
+async def test_limit_clients_behind_the_load_balancer():
+    app = FastAPI()
+    app.add_middleware(GatewayMiddleware, rate_limiter=build_limiter(trusted_proxies=1))
+    app.add_api_route('/v1/orders', lambda: {}, methods=['GET'])
+
+    # every connection comes from the load balancer
+    transport = httpx.ASGITransport(app=app, client=('10.0.0.2', 40000))
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as ac:
+
+        async def get(forwarded_for: str) -> int:
+            response = await ac.get('/v1/orders', headers={'X-Forwarded-For': forwarded_for})
+            return response.status_code
+
+        assert await get('203.0.113.7') == 200
+        assert await get('198.51.100.1') == 200
+        assert await get('203.0.113.7') == 429
+        # forging the first entry does not get a new bucket
+        assert await get('192.0.2.1, 203.0.113.7') == 429
@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.httpx.retry import HedgePolicy, RetryPolicy, RetryTransport
+
+pytestmark = pytest.mark.anyio
+
+
+class Upstream(httpx.AsyncBaseTransport):
+    def __init__(self, delays: list[float], statuses: list[int]):
+        self.delays = delays
+        self.statuses = statuses
+        self.calls = 0
+        self.in_flight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        index = min(self.calls, len(self.delays) - 1)
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.delays[index])
+        finally:
+            self.in_flight -= 1
+        return httpx.Response(self.statuses[index], content=str(index).encode())
+
+
+def build(upstream: Upstream, **options) -> RetryTransport:
+    return RetryTransport(
+        upstream, policy=RetryPolicy(max_attempts=3, backoff_seconds=0), **options
+    )
+
+
+async def test_retry_on_status_codes():
+    upstream = Upstream([0, 0, 0], [503, 502, 200])
+
+    response = await build(upstream).handle_async_request(httpx.Request('GET', 'http://a'))
+
+    assert response.status_code == 200
+    assert upstream.calls == 3
+
+
+async def test_do_not_retry_non_idempotent_methods():
+    upstream = Upstream([0], [503])
+
+    response = await build(upstream).handle_async_request(httpx.Request('POST', 'http://a'))
+
+    assert response.status_code == 503
+    assert upstream.calls == 1
+
+
+async def test_hedge_slow_requests():
+    upstream = Upstream([1, 0], [200, 200])
+    transport = build(upstream, hedge=HedgePolicy(delay_seconds=0.01))
+
+    response = await transport.handle_async_request(httpx.Request('GET', 'http://a'))
+    await asyncio.sleep(0)
+
+    assert await response.aread() == b'1'
+    assert transport.hedges == 1
+    assert upstream.in_flight == 0
+
+
+@pytest.mark.parametrize('cancel_after', [0.005, 0.05], ids=['before hedging', 'hedged'])
+async def test_cancel_every_request_with_the_caller(cancel_after):
+    upstream = Upstream([1, 1], [200, 200])
+    transport = build(upstream, hedge=HedgePolicy(delay_seconds=0.01))
+
+    task = asyncio.create_task(transport.handle_async_request(httpx.Request('GET', 'http://a')))
+    await asyncio.sleep(cancel_after)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+
+    assert upstream.in_flight == 0
+
+
+class Gate(httpx.AsyncBaseTransport):
+    """
+    Holds the requests until `open`, then fails the `failing` one of them
+    """
+
+    def __init__(self, failing: int):
+        self.failing = failing
+        self.calls = 0
+        self.opened = asyncio.Event()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        index = self.calls
+        self.calls += 1
+        await self.opened.wait()
+        if index == self.failing:
+            raise httpx.ConnectError('refused', request=request)
+        return httpx.Response(200, content=str(index).encode())
+
+
+@pytest.mark.parametrize('failing', [0, 1], ids=['first failed', 'hedge failed'])
+async def test_prefer_the_response_when_both_hedges_complete(failing):
+    upstream = Gate(failing)
+    transport = RetryTransport(
+        upstream, policy=RetryPolicy(max_attempts=1), hedge=HedgePolicy(delay_seconds=0.01)
+    )
+
+    task = asyncio.create_task(transport.handle_async_request(httpx.Request('GET', 'http://a')))
+    while upstream.calls < 2:
+        await asyncio.sleep(0.005)
+    upstream.opened.set()
+    response = await task
+
+    assert await response.aread() == str(1 - failing).encode()
+    assert transport.hedges == 1
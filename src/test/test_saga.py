@@ -0,0 +1,179 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+from core.exception import SagaCompensationUndoneException
+from core.saga import Saga, SagaContext, SagaJournal, SagaOrchestrator, SagaStatus, StepStatus
+from core.process import is_alive, process_identity
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(name='journal')
+def fixture_journal(tmp_path):
+    journal = SagaJournal(str(tmp_path / 'saga.db'))
+    yield journal
+    journal.close()
+
+
+async def get_status(journal: SagaJournal) -> tuple[str, dict[str, str]]:
+    [(saga_id, status)] = await journal.execute('SELECT id, status FROM sagas')
+    steps = await journal.execute(
+        'SELECT name, status FROM saga_steps WHERE saga_id = ?', (saga_id,)
+    )
+    return status, dict(steps)
+
+
+def build_saga(calls: list[str], fail: str = '', delay: float = 0) -> Saga:
+    saga = Saga('order')
+
+    def add(name: str, depends_on: tuple[str, ...] = ()):
+        @saga.step(name, depends_on=depends_on)
+        async def action(context: SagaContext):
+            await asyncio.sleep(delay)
+            if name == fail:
+                raise RuntimeError(f'{name} failed')
+            calls.append(name)
+            return {'step': name}
+
+        @saga.compensation(name)
+        async def compensation(context: SagaContext):
+            calls.append(f'undo {name}')
+
+    add('reserve')
+    add('charge', depends_on=('reserve',))
+    add('ship', depends_on=('charge',))
+    return saga
+
+
+async def test_complete(journal):
+    calls = []
+    results = await SagaOrchestrator(journal).execute(build_saga(calls), {})
+
+    assert calls == ['reserve', 'charge', 'ship']
+    assert results['ship'] == {'step': 'ship'}
+    assert (await get_status(journal))[0] == SagaStatus.COMPLETED
+
+
+async def test_compensate_in_reverse_order(journal):
+    calls = []
+    with pytest.raises(RuntimeError):
+        await SagaOrchestrator(journal).execute(build_saga(calls, fail='ship'), {})
+
+    assert calls == ['reserve', 'charge', 'undo charge', 'undo reserve']
+    assert await get_status(journal) == (
+        SagaStatus.COMPENSATED,
+        {'reserve': StepStatus.COMPENSATED, 'charge': StepStatus.COMPENSATED},
+    )
+
+
+async def test_resume_compensation_keeps_failed_compensations(journal):
+    saga = build_saga([])
+    await journal.start('saga-1', saga.name, {})
+    await journal.set_step('saga-1', 'reserve', StepStatus.DONE, {'step': 'reserve'})
+    await journal.set_step('saga-1', 'charge', StepStatus.COMPENSATION_FAILED)
+    await journal.set_status('saga-1', SagaStatus.COMPENSATING, error='ship failed')
+    # owned by a process that exited
+    await journal.execute("UPDATE sagas SET owner = 'gone:1:1'")
+
+    orchestrator = SagaOrchestrator(journal)
+    orchestrator.register(saga)
+    await orchestrator.recover()
+
+    assert await get_status(journal) == (
+        SagaStatus.COMPENSATION_UNDONE,
+        {'reserve': StepStatus.COMPENSATED, 'charge': StepStatus.COMPENSATION_FAILED},
+    )
+
+
+async def test_raise_when_compensation_is_undone(journal):
+    saga = build_saga([], fail='ship')
+
+    @saga.compensation('reserve')
+    async def release(context: SagaContext):
+        raise RuntimeError('release failed')
+
+    with pytest.raises(SagaCompensationUndoneException):
+        await SagaOrchestrator(journal, compensation_attempts=1).execute(saga, {})
+    assert (await get_status(journal))[0] == SagaStatus.COMPENSATION_UNDONE
+
+
+async def test_cancel_steps_and_compensate_with_the_caller(journal):
+    calls = []
+    orchestrator = SagaOrchestrator(journal)
+    task = asyncio.create_task(orchestrator.execute(build_saga(calls, delay=0.05), {}))
+    await asyncio.sleep(0.08)  # `charge` is running
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.gather(*orchestrator._background)
+
+    assert calls == ['reserve', 'undo reserve']
+    assert await get_status(journal) == (
+        SagaStatus.COMPENSATED,
+        {'reserve': StepStatus.COMPENSATED},
+    )
+
+
+async def test_recover_in_the_background(journal):
+    calls = []
+    saga = build_saga(calls, delay=0.05)
+    await journal.start('saga-1', saga.name, {})
+    await journal.set_step('saga-1', 'reserve', StepStatus.DONE, {'step': 'reserve'})
+    await journal.execute("UPDATE sagas SET owner = 'gone:1:1'")
+
+    orchestrator = SagaOrchestrator(journal)
+    orchestrator.register(saga)
+    await orchestrator.startup()
+    # the worker starts serving before the resumed steps are done
+    assert not calls
+
+    await asyncio.gather(*orchestrator._background)
+    assert calls == ['charge', 'ship']
+    assert (await get_status(journal))[0] == SagaStatus.COMPLETED
+
+
+async def test_compensate_cancelled_steps(journal):
+    calls = []
+    saga = build_saga(calls)
+
+    @saga.step('notify', depends_on=('reserve',))
+    async def notify(context: SagaContext):
+        raise asyncio.CancelledError()
+
+    with pytest.raises(RuntimeError, match='notify cancelled'):
+        await SagaOrchestrator(journal).execute(saga, {})
+
+    assert calls[-1] == 'undo reserve'
+    assert (await get_status(journal))[0] == SagaStatus.COMPENSATED
+
+
+async def test_do_not_wait_after_the_last_compensation_attempt(journal):
+    saga = build_saga([], fail='charge')
+
+    @saga.compensation('reserve')
+    async def release(context: SagaContext):
+        raise RuntimeError('release failed')
+
+    started_at = time.perf_counter()
+    with pytest.raises(SagaCompensationUndoneException):
+        await SagaOrchestrator(journal, compensation_attempts=2).execute(saga, {})
+
+    # a single backoff of 0.1s, between the two attempts
+    assert 0.1 <= time.perf_counter() - started_at < 0.25
+
+
+def test_owner_liveness_survives_pid_reuse():
+    identity = process_identity()
+    boot_id, pid, started = identity.split(':')
+
+    assert is_alive(identity)
+    # same PID, another process
+    assert not is_alive(f'{boot_id}:{pid}:{int(started or 0) + 1}')
+    assert not is_alive(f'another-boot:{pid}:{started}')
+
+    exited = subprocess.Popen(['true'])  # pylint:disable=consider-using-with
+    exited.wait()
+    assert not is_alive(process_identity(exited.pid))
@@ -0,0 +1,83 @@
+import socket
+
+import pytest
+
+from settings.server import GunicornApplication, UvicornWorker, reuse_port_sockets
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(name='listener')
+def fixture_listener():
+    # the listener of the arbiter
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    yield sock
+    sock.close()
+
+
+def accepted(sock: socket.socket) -> int:
+    count = 0
+    sock.setblocking(False)
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except BlockingIOError:
+            return count
+        conn.close()
+        count += 1
+
+
+def test_spread_connections_over_the_shared_and_worker_sockets(listener):
+    own = reuse_port_sockets([listener], backlog=128)[0]
+    try:
+        assert own.getsockname() == listener.getsockname()
+
+        clients = [socket.create_connection(listener.getsockname()) for _ in range(64)]
+        shared, private = accepted(listener), accepted(own)
+        for client in clients:
+            client.close()
+    finally:
+        own.close()
+
+    assert shared + private == 64
+    # the listener of the arbiter keeps its share, the workers must accept on it too
+    assert shared and private
+
+
+def test_skip_unix_listeners(tmp_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(tmp_path / 'gunicorn.sock'))
+        assert not reuse_port_sockets([sock], backlog=128)
+
+
+class Config:
+    reuse_port = True
+    backlog = 128
+    max_requests = 1000
+
+
+@pytest.mark.parametrize('migrate, warned', [(True, False), (False, True)])
+async def test_warn_when_restarts_reset_queued_connections(listener, mocker, migrate, warned):
+    mocker.patch('settings.server.migrates_requests', return_value=migrate)
+    serve = mocker.patch('uvicorn.workers.UvicornWorker._serve')
+    worker = UvicornWorker.__new__(UvicornWorker)
+    worker.cfg, worker.sockets, worker.log = Config(), [listener], mocker.Mock()
+
+    await worker._serve()  # pylint:disable=protected-access
+
+    serve.assert_awaited_once()
+    assert len(worker.sockets) == 2
+    assert worker.sockets[0] is listener
+    assert worker.log.warning.called is warned
+    worker.sockets[1].close()
+
+
+def test_gunicorn_application_uses_the_options():
+    application = GunicornApplication('main:app', {'bind': '127.0.0.1:9000', 'workers': 3})
+
+    assert application.cfg.bind == ['127.0.0.1:9000']
+    assert application.cfg.workers == 3
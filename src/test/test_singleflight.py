@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.httpx.singleflight import CoalescingTransport
+
+pytestmark = pytest.mark.anyio
+
+
+class Upstream:
+    def __init__(self, chunks: list[bytes], content_length: bool = True):
+        self.chunks = chunks
+        self.content_length = content_length
+        self.calls = 0
+        self.read = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.content_length:
+            return httpx.Response(200, content=b''.join(self.chunks))
+
+        async def stream():
+            for chunk in self.chunks:
+                self.read += 1
+                yield chunk
+
+        return httpx.Response(200, content=stream())
+
+
+async def send(transport: CoalescingTransport) -> bytes:
+    response = await transport.handle_async_request(httpx.Request('GET', 'http://upstream/a'))
+    content = await response.aread()
+    await response.aclose()
+    return content
+
+
+@pytest.mark.parametrize('content_length', [True, False])
+async def test_share_one_upstream_call(content_length):
+    upstream = Upstream([b'a' * 10, b'b' * 10], content_length=content_length)
+    transport = CoalescingTransport(httpx.MockTransport(upstream), max_body_bytes=100)
+
+    contents = await asyncio.gather(*[send(transport) for _ in range(5)])
+
+    assert contents == [b'a' * 10 + b'b' * 10] * 5
+    assert upstream.calls == 1
+    assert transport.coalesced == 4
+
+
+@pytest.mark.parametrize('content_length', [True, False])
+async def test_do_not_share_large_bodies(content_length):
+    chunks = [bytes([i]) * 10 for i in range(10)]
+    upstream = Upstream(chunks, content_length=content_length)
+    transport = CoalescingTransport(httpx.MockTransport(upstream), max_body_bytes=25)
+
+    contents = await asyncio.gather(*[send(transport) for _ in range(3)])
+
+    assert contents == [b''.join(chunks)] * 3
+    # the waiters fall back to their own request
+    assert upstream.calls == 3
+    assert transport.coalesced == 0
+
+
+async def test_stop_buffering_past_the_limit():
+    chunks = [b'x' * 10 for _ in range(100)]
+    upstream = Upstream(chunks, content_length=False)
+    transport = CoalescingTransport(httpx.MockTransport(upstream), max_body_bytes=25)
+
+    response = await transport.handle_async_request(httpx.Request('GET', 'http://upstream/a'))
+
+    # the leader reads past the limit only, the rest is streamed on demand
+    assert upstream.read == 3
+    assert len(await response.aread()) == 1000
+    assert upstream.read == 100